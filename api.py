@@ -0,0 +1,378 @@
+"""FastAPI backend for simulation and persistence.
+
+Runs standalone (python api.py, or uvicorn api:api --workers N) or in a
+background thread of the Streamlit app (app.py). CPU-bound evaluation is
+offloaded to a bounded jobs.JobPool, so the event loop keeps serving other
+clients while large circuits are evaluated. Sessions live in the memory of
+one server process: behind several workers they need sticky routing.
+"""
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+import asyncio
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import threading
+import uvicorn
+import json as _json
+import os
+from pathlib import Path
+
+import jobs
+from jobs import JobPool, Busy, TooLarge
+
+api = FastAPI()
+api.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+DATA_DIR = Path(__file__).parent / 'data'
+DATA_DIR.mkdir(exist_ok=True)
+
+# cached, pre-compiled circuits keyed by session id; budget and TTL come from
+# DLSIM_SESSION_MAX_BYTES / DLSIM_SESSION_TTL
+from sessions import SessionStore
+import netlist
+sessions = SessionStore()
+
+# process-wide simulator counters served at /metrics; DLSIM_METRICS=0 turns them off
+import metrics
+METRICS_ENABLED = os.environ.get('DLSIM_METRICS', '1') != '0'
+
+# bounded worker pool for evaluation; sizes, limits and timeout come from the
+# DLSIM_EVAL_* / DLSIM_SMALL_WORK / DLSIM_MAX_GATES settings (see jobs.py)
+pool = JobPool(stats=metrics.GLOBAL if METRICS_ENABLED else None)
+def check_gates(gates: int):
+    try:
+        pool.check(gates)
+    except TooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+
+async def offload(fn, *args, gates: int, work: int = None, local: bool = False, timeout=None):
+    # run a job on the pool, mapping its limits to HTTP errors
+    try:
+        return await pool.run(fn, *args, gates=gates, work=work, local=local,
+                              timeout=float(timeout) if timeout is not None else None)
+    except TooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except Busy as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={'Retry-After': '1'})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Evaluation timed out')
+    except MemoryError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+def batch_work(payload: dict) -> int:
+    # gates times 64-vector words: the bit-parallel cost of a batch
+    return len(payload.get('nodes', [])) * max(1, len(payload.get('vectors', [])) // 64)
+
+@api.post('/evaluate')
+async def evaluate_circuit(payload: dict):
+    # expected payload: { nodes: [...], edges: [...] , inputs: {id: bool, ...} (optional),
+    #                     timeout: seconds (optional, capped by DLSIM_EVAL_TIMEOUT) }
+    return await offload(jobs.evaluate, payload, gates=len(payload.get('nodes', [])),
+                         timeout=payload.get('timeout'))
+
+@api.post('/evaluate_batch')
+async def evaluate_batch(payload: dict):
+    # expected payload: { nodes: [...], edges: [...], vectors: [[bool, ...], ...] or [{id: bool}, ...],
+    #                     input_ids: [id, ...] (optional column order for list vectors),
+    #                     watch: [id, ...] (optional, gates to return), timeout (optional) }
+    return await offload(jobs.evaluate_batch, payload, gates=len(payload.get('nodes', [])),
+                         work=batch_work(payload), timeout=payload.get('timeout'))
+
+@api.post('/evaluate_parallel')
+async def evaluate_parallel_endpoint(payload: dict):
+    # same payload as /evaluate_batch, plus optional workers: int and watch: [id, ...];
+    # the vectors are split into `workers` shards (at most the pool's process count),
+    # each run as a large job on the shared process pool and merged in order
+    gates = len(payload.get('nodes', []))
+    check_gates(gates)
+    workers = min(int(payload.get('workers') or pool.processes), pool.processes)
+    parts = await asyncio.gather(*[
+        offload(jobs.evaluate_batch, shard, gates=gates, work=pool.small_work + 1, timeout=payload.get('timeout'))
+        for shard in jobs.split_batch(payload, workers)])
+    return jobs.merge_batches(parts)
+
+@api.post('/fault_coverage')
+async def fault_coverage_endpoint(payload: dict):
+    # same payload as /evaluate_batch, plus optional faults: [[id, 0|1], ...] and observe: [id, ...];
+    # every fault re-simulates part of the circuit, so this always counts as a large job
+    return await offload(jobs.fault_coverage, payload, gates=len(payload.get('nodes', [])),
+                         work=pool.small_work + 1, timeout=payload.get('timeout'))
+
+@api.post('/equivalence')
+async def equivalence_endpoint(payload: dict):
+    # expected payload: { first: {nodes, edges}, second: {nodes, edges}, outputs: [id, ...] (optional),
+    #                     sequential: bool (optional), max_nodes: int (optional), timeout (optional) };
+    # BDD size is not bounded by the gate count, so this always counts as a large job
+    gates = max(len(payload.get(k, {}).get('nodes', [])) for k in ('first', 'second'))
+    return await offload(jobs.equivalence, payload, gates=gates, work=pool.small_work + 1,
+                         timeout=payload.get('timeout'))
+
+@api.post('/sessions')
+async def create_session(payload: dict):
+    # upload a netlist once: { nodes: [...], edges: [...], inputs: {id: bool} (optional) }
+    try:
+        c = await offload(jobs.new_session_circuit, payload, metrics.GLOBAL if METRICS_ENABLED else None,
+                          gates=len(payload.get('nodes', [])), local=True)
+        s = sessions.create(c)
+    except MemoryError as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+    return {'session': s.id, 'gates': len(c.gates)}
+
+@api.post('/sessions/{sid}/evaluate')
+async def evaluate_session(sid: str, payload: dict):
+    # post only input deltas: { inputs: {id: bool, ...} }
+    s = sessions.get(sid)
+    if s is None:
+        raise HTTPException(status_code=404, detail='Session not found or expired')
+    return await offload(jobs.evaluate_session, s, payload, gates=len(s.circuit.gates), local=True,
+                         timeout=payload.get('timeout'))
+
+# ring-buffer length (cycles) of session traces; requests may ask for less
+TRACE_WINDOW = int(os.environ.get('DLSIM_TRACE_WINDOW', 10000))
+# most cycles one trace request may simulate
+MAX_TRACE_CYCLES = int(os.environ.get('DLSIM_TRACE_MAX_CYCLES', 100000))
+
+@api.post('/sessions/{sid}/trace')
+async def record_trace(sid: str, payload: dict):
+    # { cycles: int, stimulus: [{id: value}, ...] or {id: [value, ...]} (optional),
+    #   signals: [id, ...] (optional, starts a new trace), window: int (optional),
+    #   reset: bool (optional) }; recording continues the session's trace
+    s = sessions.get(sid)
+    if s is None:
+        raise HTTPException(status_code=404, detail='Session not found or expired')
+    cycles = int(payload.get('cycles', 1))
+    if cycles > MAX_TRACE_CYCLES:
+        raise HTTPException(status_code=400, detail=f'At most {MAX_TRACE_CYCLES} cycles per request')
+    result = await offload(jobs.record_trace, s, payload, TRACE_WINDOW, gates=len(s.circuit.gates),
+                           work=len(s.circuit.gates) * cycles, local=True, timeout=payload.get('timeout'))
+    sessions.resize(s)
+    return result
+
+@api.get('/sessions/{sid}/trace')
+async def get_trace(sid: str, start: int = None, end: int = None, format: str = 'json'):
+    # windowed slice of the recorded trace, as JSON or as VCD text (format=vcd)
+    s = sessions.get(sid)
+    if s is None:
+        raise HTTPException(status_code=404, detail='Session not found or expired')
+    result = await offload(jobs.trace_slice, s, start, end, format == 'vcd', gates=len(s.circuit.gates),
+                           local=True)
+    if result is None:
+        raise HTTPException(status_code=404, detail='No trace recorded')
+    return PlainTextResponse(result) if format == 'vcd' else result
+
+@api.delete('/sessions/{sid}')
+async def delete_session(sid: str):
+    if not sessions.delete(sid):
+        raise HTTPException(status_code=404, detail='Session not found or expired')
+    return {'deleted': sid}
+
+MAX_CLOCK_HZ = 1000
+MAX_TICKS_PER_MSG = 10000
+
+@api.websocket('/ws/simulate')
+async def simulate_ws(ws: WebSocket):
+    # client -> server (JSON):
+    #   {type: 'load', nodes, edges, inputs?} or {type: 'load', session: id}
+    #   {type: 'inputs', inputs: {id: bool}}
+    #   {type: 'tick', count?: int}     at most MAX_TICKS_PER_MSG edges
+    #   {type: 'clock', hz: float}      free-running clock; hz 0 stops it
+    # server -> client:
+    #   {type: 'frame', cycle, changed: {id: bool}}   only gates changed since the last frame
+    #   {type: 'loaded', gates} / {type: 'error', detail}
+    # Frames are produced by a single sender task: if the client reads slowly,
+    # changes keep accumulating and go out coalesced in the next frame.
+    # Loading, input changes and clock edges run on the pool's thread lane,
+    # holding the session's lock for a session-backed simulation.
+    await ws.accept()
+    state = {'live': None, 'clock': None}
+    outbox = []
+    wake = asyncio.Event()
+
+    async def sender():
+        while True:
+            await wake.wait()
+            wake.clear()
+            while outbox:
+                await ws.send_json(outbox.pop(0))
+            if state['live'] is not None:
+                frame = state['live'].frame(block=False)
+                if frame is None:
+                    # a job holds the circuit; its changes stay queued, retry shortly
+                    asyncio.get_running_loop().call_later(0.01, wake.set)
+                elif frame['changed']:
+                    await ws.send_json({'type': 'frame', **frame})
+
+    async def clock(hz):
+        loop = asyncio.get_running_loop()
+        period = 1.0 / hz
+        due = loop.time()
+        while True:
+            due += period
+            delay = due - loop.time()
+            if delay < 0:
+                # fell behind: drop the missed edges instead of bursting to catch up
+                due = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+            live = state['live']
+            try:
+                await offload(jobs.live_tick, live, 1, gates=len(live.circuit.gates), local=True)
+            except HTTPException:
+                continue  # pool full or timed out: drop the edge like a missed one
+            wake.set()
+
+    def stop_clock():
+        if state['clock'] is not None:
+            state['clock'].cancel()
+            state['clock'] = None
+
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            msg = await ws.receive_json()
+            kind = msg.get('type')
+            try:
+                if kind == 'load':
+                    stop_clock()
+                    state['live'] = None
+                    if 'session' in msg:
+                        s = sessions.get(msg['session'])
+                        if s is None:
+                            raise ValueError('Session not found or expired')
+                        live = await offload(jobs.live_simulation, msg, s, gates=len(s.circuit.gates),
+                                             local=True)
+                    else:
+                        live = await offload(jobs.live_simulation, msg, None,
+                                             metrics.GLOBAL if METRICS_ENABLED else None,
+                                             gates=len(msg.get('nodes', [])), local=True)
+                    state['live'] = live
+                    outbox.append({'type': 'loaded', 'gates': len(live.circuit.gates)})
+                elif state['live'] is None:
+                    raise ValueError('No circuit loaded')
+                elif kind == 'inputs':
+                    live = state['live']
+                    await offload(jobs.live_inputs, live, msg.get('inputs', {}),
+                                  gates=len(live.circuit.gates), local=True)
+                elif kind == 'tick':
+                    live = state['live']
+                    count = min(max(1, int(msg.get('count', 1))), MAX_TICKS_PER_MSG)
+                    await offload(jobs.live_tick, live, count, gates=len(live.circuit.gates), local=True)
+                elif kind == 'clock':
+                    stop_clock()
+                    hz = min(float(msg.get('hz', 0)), MAX_CLOCK_HZ)
+                    if hz > 0:
+                        state['clock'] = asyncio.create_task(clock(hz))
+                else:
+                    raise ValueError(f'Unknown message type: {kind}')
+            except HTTPException as exc:
+                outbox.append({'type': 'error', 'detail': exc.detail})
+            except Exception as exc:
+                outbox.append({'type': 'error', 'detail': str(exc)})
+            wake.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stop_clock()
+        send_task.cancel()
+
+# file endpoints are plain `def`: FastAPI runs them on its thread pool, off the event loop
+@api.post('/save')
+def save_circuit(payload: dict):
+    # binary netlist by default; payload format: 'json' keeps the pretty-printed JSON file
+    # (gates, wiring, values and positions; other node fields are only kept in JSON)
+    name = payload.get('name') or ('circuit_' + str(len(list(DATA_DIR.iterdir()))+1))
+    if payload.get('format') == 'json':
+        path = save_path(name, '.json')
+        path.write_text(_json.dumps(payload, indent=2))
+    else:
+        path = save_path(name, netlist.EXT)
+        try:
+            net = netlist.Netlist.from_payload(payload)
+        except (KeyError, ValueError) as exc:
+            raise HTTPException(status_code=400, detail=f'Invalid netlist: {exc}')
+        netlist.save(path, net, compress=payload.get('compress', True))
+    return {'saved': str(path.name)}
+
+def save_path(name, suffix: str) -> Path:
+    # a plain file name directly inside DATA_DIR, as saved_path() requires for loads
+    path = DATA_DIR / (str(name) + suffix)
+    if not isinstance(name, str) or name.startswith('.') or path.parent != DATA_DIR:
+        raise HTTPException(status_code=400, detail='Invalid file name')
+    return path
+
+@api.get('/list')
+def list_circuits():
+    files = []
+    details = []
+    for p in sorted(DATA_DIR.iterdir()):
+        if p.suffix == netlist.EXT:
+            try:
+                info = netlist.read_header(p)
+            except ValueError:
+                continue
+            details.append({'name': p.name, 'size': info['size'], 'gates': info['gates'], 'edges': info['edges']})
+        elif p.suffix == '.json':
+            details.append({'name': p.name, 'size': p.stat().st_size, 'gates': None, 'edges': None})
+        else:
+            continue
+        files.append(p.name)
+    return {'files': files, 'details': details}
+
+def saved_path(name: str) -> Path:
+    path = DATA_DIR / name
+    if path.parent != DATA_DIR or not path.is_file():
+        raise HTTPException(status_code=404, detail='Not found')
+    return path
+
+@api.get('/load')
+def load_circuit(name: str):
+    path = saved_path(name)
+    if path.suffix == netlist.EXT:
+        return {'name': path.stem, **netlist.load(path).to_payload()}
+    return _json.loads(path.read_text())
+
+@api.post('/evaluate_saved')
+async def evaluate_saved(payload: dict):
+    # { name: saved file, inputs: {id: bool} (optional) }; binary netlists compile straight
+    # from the file's arrays without building Gate objects
+    path = saved_path(payload.get('name', ''))
+    try:
+        gates = netlist.read_header(path)['gates'] if path.suffix == netlist.EXT else 0
+    except ValueError as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+    return await offload(jobs.evaluate_saved, str(path), payload.get('inputs', {}), pool.max_gates, gates=gates,
+                         work=gates if gates else pool.small_work + 1, timeout=payload.get('timeout'))
+
+@api.get('/metrics')
+async def metrics_endpoint():
+    # Prometheus text exposition format
+    text = metrics.GLOBAL.to_prometheus()
+    text += ('# HELP dlsim_sessions Live circuit sessions.\n# TYPE dlsim_sessions gauge\n'
+             f'dlsim_sessions {len(sessions)}\n'
+             '# HELP dlsim_session_bytes Estimated bytes held by sessions.\n# TYPE dlsim_session_bytes gauge\n'
+             f'dlsim_session_bytes {sessions.total_bytes}\n')
+    text += pool.to_prometheus()
+    return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
+
+def run_api():
+    uvicorn.run(api, host='0.0.0.0', port=8000, log_level='info')
+
+_started = threading.Lock()
+
+def start_in_background():
+    """Serve the API from a daemon thread of this process, once."""
+    if _started.acquire(blocking=False):
+        threading.Thread(target=run_api, daemon=True).start()
+
+if __name__ == '__main__':
+    # standalone server: DLSIM_API_WORKERS processes, each with its own job pool and sessions
+    uvicorn.run('api:api', host=os.environ.get('DLSIM_API_HOST', '0.0.0.0'),
+                port=int(os.environ.get('DLSIM_API_PORT', 8000)),
+                workers=int(os.environ.get('DLSIM_API_WORKERS', 1)), log_level='info')
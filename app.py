@@ -2,82 +2,15 @@ import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 from sim import Circuit, Gate
 import uuid
-from PIL import Image, ImageDraw, ImageFont
-
-# --- FastAPI backend for simulation and persistence ---
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-import threading
-import uvicorn
-import json as _json
-from pathlib import Path
-
-api = FastAPI()
-api.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
-
-DATA_DIR = Path(__file__).parent / 'data'
-DATA_DIR.mkdir(exist_ok=True)
-
-@api.post('/evaluate')
-async def evaluate_circuit(payload: dict):
-    # expected payload: { nodes: [...], edges: [...] , inputs: {id: bool, ...} (optional) }
-    try:
-        nodes = payload.get('nodes', [])
-        edges = payload.get('edges', [])
-        # build circuit
-        from sim import Circuit, Gate
-        c = Circuit()
-        for n in nodes:
-            g = Gate(n['id'], n['type'])
-            c.add_gate(g)
-        for e in edges:
-            # default to pin 'a' for connections
-            c.connect(e['from'], e['to'], 'a')
-        inputs = payload.get('inputs', {})
-        for iid, val in inputs.items():
-            if iid in c.gates:
-                try:
-                    c.set_input_value(iid, bool(val))
-                except Exception:
-                    pass
-        vals = c.evaluate()
-        try:
-            import networkx as _nx
-            order = list(_nx.topological_sort(c.G))
-        except Exception:
-            order = list(vals.keys())
-        return {'values': vals, 'order': order}
-        return {'values': vals}
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=str(exc))
-
-@api.post('/save')
-async def save_circuit(payload: dict):
-    name = payload.get('name') or ('circuit_' + str(len(list(DATA_DIR.iterdir()))+1))
-    path = DATA_DIR / (name + '.json')
-    path.write_text(_json.dumps(payload, indent=2))
-    return {'saved': str(path.name)}
-
-@api.get('/list')
-async def list_circuits():
-    files = [p.name for p in DATA_DIR.glob('*.json')]
-    return {'files': files}
-
-@api.get('/load')
-async def load_circuit(name: str):
-    path = DATA_DIR / name
-    if not path.exists():
-        raise HTTPException(status_code=404, detail='Not found')
-    return _json.loads(path.read_text())
-
-def run_api():
-    uvicorn.run(api, host='0.0.0.0', port=8000, log_level='info')
-
-# start API in background thread if not already started
-if 'api_thread_started' not in globals():
-    t = threading.Thread(target=run_api, daemon=True)
-    t.start()
-    globals()['api_thread_started'] = True
+from render import CanvasRenderer
+
+# --- FastAPI backend (api.py) ---
+# Started in a background thread for the single-process setup; with DLSIM_EMBED_API=0
+# the API runs as its own server instead (python api.py, or uvicorn api:api --workers N).
+import os
+if os.environ.get('DLSIM_EMBED_API', '1') != '0':
+    from api import start_in_background
+    start_in_background()
 # --- end FastAPI backend ---
 
 
@@ -111,6 +44,11 @@ def ensure_state():
         st.session_state.connect_src = None
     if "last_eval" not in st.session_state:
         st.session_state.last_eval = {}
+    if "renderer" not in st.session_state:
+        # keeps the drawn canvas between reruns and redraws only what changed
+        st.session_state.renderer = CanvasRenderer(900, 600)
+    if "viewport" not in st.session_state:
+        st.session_state.viewport = (0, 0)
 
 ensure_state()
 
@@ -164,9 +102,10 @@ with col_left:
 
     if st.button("Evaluate"):
         try:
-            vals = st.session_state.circuit.evaluate()
-            st.session_state.last_eval = vals
-            st.success("Evaluated")
+            circuit = st.session_state.circuit
+            vals = circuit.evaluate_incremental()
+            st.session_state.last_eval = dict(vals)
+            st.success(f"Evaluated ({circuit.last_eval_count} of {len(circuit.gates)} gates re-evaluated)")
         except Exception as e:
             st.error(str(e))
 
@@ -180,35 +119,21 @@ with col_canvas:
     st.header("Canvas")
     canvas_width = 900
     canvas_height = 600
-    bg = Image.new("RGBA",(canvas_width,canvas_height),(255,255,255,255))
-    draw = ImageDraw.Draw(bg)
-    font = None
-    try:
-        font = ImageFont.truetype("DejaVuSans.ttf", 14)
-    except Exception:
-        from PIL import ImageFont as _ImageFont
-        font = _ImageFont.load_default()
-    for gid, node in st.session_state.nodes.items():
-        x = node["x"]; y = node["y"]; w = node.get("w",100); h = node.get("h",50)
-        rect = [x,y,x+w,y+h]
-        val = bool(st.session_state.last_eval.get(gid, False)) if st.session_state.last_eval else None
-        fill = (240,240,240,255)
-        if node["type"] == "INPUT":
-            fill = (220,255,220,255) if val else (255,230,230,255)
-        elif node["type"] == "OUTPUT":
-            fill = (200,200,255,255) if val else (240,240,255,255)
-        draw.rectangle(rect, fill=fill, outline=(0,0,0))
-        draw.text((x+6,y+6), f"{node['type']}\n{gid[:8]}", font=font, fill=(0,0,0))
-    for src, dst, data in st.session_state.circuit.G.edges(data=True):
-        src_node = st.session_state.nodes.get(src)
-        dst_node = st.session_state.nodes.get(dst)
-        if src_node and dst_node:
-            sx = src_node["x"] + src_node.get("w",100)
-            sy = src_node["y"] + src_node.get("h",50)/2
-            dx = dst_node["x"]
-            dy = dst_node["y"] + dst_node.get("h",50)/2
-            draw.line((sx,sy,dx,dy), fill=(60,60,60), width=3)
-            draw.text(((sx+dx)/2, (sy+dy)/2-10), data.get("pin","a"), font=font, fill=(0,0,0))
+    pan_cols = st.columns([1,1,1,1])
+    vx, vy = st.session_state.viewport
+    if pan_cols[0].button("View ←"):
+        vx -= 200
+    if pan_cols[1].button("View →"):
+        vx += 200
+    if pan_cols[2].button("View ↑"):
+        vy -= 200
+    if pan_cols[3].button("View ↓"):
+        vy += 200
+    st.session_state.viewport = (vx, vy)
+    # only gates and wires inside the viewport are drawn, and only where something changed
+    edges = ((src, dst, data.get("pin","a")) for src, dst, data in st.session_state.circuit.G.edges(data=True))
+    bg = st.session_state.renderer.render(st.session_state.nodes, edges, st.session_state.last_eval,
+                                          viewport=st.session_state.viewport)
 
     canvas_result = st_canvas(
         fill_color="rgba(0,0,0,0)",
@@ -0,0 +1,351 @@
+"""Symbolic evaluation with reduced ordered binary decision diagrams.
+
+A BDD manager holds nodes in flat arrays (variable level, low child, high
+child). Node 0 is False, node 1 is True, and the unique table keeps each
+(level, low, high) triple once, so equal functions are the same node.
+Everything is built from ite() (if-then-else), which memoizes its results
+in an operation cache.
+
+circuit_bdds() turns every gate of a circuit's compiled form into a node,
+one truth-table expansion per gate. INPUT gates, and DFF states in the
+sequential form, become variables named after their gate ids. The variable
+order is a depth-first walk from the outputs, reversed: related inputs stay
+adjacent and the ones feeding later outputs come first (..., b1, a1, cin,
+b0, a0 for an adder), so each carry's BDD is built on the one below it and
+the adder stays linear in size. On top of that:
+
+- equivalent() compares two circuits output by output and returns a
+  counterexample input assignment when they differ;
+- satisfy() finds an input assignment driving an OUTPUT to a value;
+- minimize() gives an irredundant sum of products for an OUTPUT
+  (Minato-Morreale ISOP).
+
+A circuit with dozens of inputs is handled in well under a second when its
+functions have compact BDDs (adders, comparators, parity, multiplexers).
+Multipliers are exponential in any variable order, so `max_nodes` bounds
+the work instead.
+"""
+import sys
+from typing import Dict, Any
+
+from sim import Circuit, base_type, gate_type
+
+_TERMINAL = sys.maxsize  # level of the two constant nodes, below every variable
+MAX_NODES = 2000000
+
+class BDD:
+    """Manager for ROBDDs over named variables, ordered by creation.
+
+    Operations walk the diagrams on explicit stacks, so the number of
+    variables is not bounded by Python's recursion limit. `max_nodes` caps
+    the node table (MemoryError past it) and the ite() cache, which is
+    cleared whenever it fills up."""
+
+    def __init__(self, max_nodes: int = MAX_NODES):
+        self.max_nodes = max_nodes
+        self.level = [_TERMINAL, _TERMINAL]
+        self.low = [0, 1]
+        self.high = [0, 1]
+        self.names = []   # level -> variable name
+        self.index = {}   # variable name -> level
+        self._unique = {}
+        self._ite = {}
+
+    def __len__(self):
+        return len(self.level)
+
+    def var(self, name: str) -> int:
+        """Node of variable `name`, created (below all existing ones) on first use."""
+        lv = self.index.get(name)
+        if lv is None:
+            lv = self.index[name] = len(self.names)
+            self.names.append(name)
+        return self._mk(lv, 0, 1)
+
+    def _mk(self, lv: int, lo: int, hi: int) -> int:
+        if lo == hi:
+            return lo
+        key = (lv, lo, hi)
+        u = self._unique.get(key)
+        if u is None:
+            u = len(self.level)
+            if u >= self.max_nodes:
+                raise MemoryError(f"BDD grew past {self.max_nodes} nodes")
+            self.level.append(lv)
+            self.low.append(lo)
+            self.high.append(hi)
+            self._unique[key] = u
+        return u
+
+    def ite(self, f: int, g: int, h: int) -> int:
+        """if f then g else h."""
+        # iterative Shannon expansion: a (f, g, h, None) entry asks for a result,
+        # a (f, g, h, level) entry combines the two cofactor results below it
+        level, low, high, cache = self.level, self.low, self.high, self._ite
+        results = []
+        todo = [(f, g, h, None)]
+        while todo:
+            f, g, h, v = todo.pop()
+            if v is not None:
+                hi = results.pop()
+                r = self._mk(v, results.pop(), hi)
+                if len(cache) >= self.max_nodes:
+                    cache.clear()  # the operation cache is bounded like the node table
+                cache[(f, g, h)] = r
+                results.append(r)
+                continue
+            if f == 1 or g == h:
+                results.append(g)
+                continue
+            if f == 0:
+                results.append(h)
+                continue
+            if g == 1 and h == 0:
+                results.append(f)
+                continue
+            r = cache.get((f, g, h))
+            if r is not None:
+                results.append(r)
+                continue
+            v = min(level[f], level[g], level[h])
+            f0, f1 = (low[f], high[f]) if level[f] == v else (f, f)
+            g0, g1 = (low[g], high[g]) if level[g] == v else (g, g)
+            h0, h1 = (low[h], high[h]) if level[h] == v else (h, h)
+            todo += [(f, g, h, v), (f1, g1, h1, None), (f0, g0, h0, None)]
+        return results[0]
+
+    def negate(self, f: int) -> int:
+        return self.ite(f, 0, 1)
+
+    def conj(self, f: int, g: int) -> int:
+        return self.ite(f, g, 0)
+
+    def disj(self, f: int, g: int) -> int:
+        return self.ite(f, 1, g)
+
+    def xor(self, f: int, g: int) -> int:
+        return self.ite(f, self.negate(g), g)
+
+    def from_table(self, table, args) -> int:
+        """Node of the truth table `table` (bit k of the index = args[k]) applied to `args`."""
+        def expand(j, idx):
+            if j == len(args):
+                return 1 if table[idx] else 0
+            return self.ite(args[j], expand(j + 1, idx | 1 << j), expand(j + 1, idx))
+        return expand(0, 0)
+
+    def support(self, f: int) -> list:
+        """Names of the variables `f` depends on, in order."""
+        seen, stack, levels = set(), [f], set()
+        while stack:
+            u = stack.pop()
+            if u < 2 or u in seen:
+                continue
+            seen.add(u)
+            levels.add(self.level[u])
+            stack += [self.low[u], self.high[u]]
+        return [self.names[lv] for lv in sorted(levels)]
+
+    def sat_one(self, f: int):
+        """One satisfying assignment {name: bool} of the variables on a path to
+        True (the others are free), or None when `f` is False."""
+        if f == 0:
+            return None
+        out = {}
+        while f > 1:
+            name = self.names[self.level[f]]
+            if self.low[f] != 0:
+                out[name] = False
+                f = self.low[f]
+            else:
+                out[name] = True
+                f = self.high[f]
+        return out
+
+    def sat_count(self, f: int, nvars: int = None) -> int:
+        """Satisfying assignments of `f` over the first `nvars` variables (default: all)."""
+        n = len(self.names) if nvars is None else nvars
+        level, low, high = self.level, self.low, self.high
+        memo = {0: 0, 1: 1}
+
+        def lv(u):
+            return n if u < 2 else level[u]
+
+        stack = [f]
+        while stack:
+            u = stack[-1]
+            if u in memo:
+                stack.pop()
+                continue
+            lo, hi = low[u], high[u]
+            if lo in memo and hi in memo:
+                memo[u] = (memo[lo] << (lv(lo) - lv(u) - 1)) + (memo[hi] << (lv(hi) - lv(u) - 1))
+                stack.pop()
+            else:
+                stack += [x for x in (lo, hi) if x not in memo]
+        return memo[f] << lv(f)
+
+    def isop(self, f: int) -> list:
+        """Irredundant sum of products of `f`: a list of cubes {name: bool}."""
+        memo = {}
+
+        def rec(lo_f, up_f):
+            # cover of some function between lo_f and up_f, and that function's node;
+            # sub-problems are yielded to _trampoline instead of recursing
+            if lo_f == 0:
+                return [], 0
+            if up_f == 1:
+                return [{}], 1
+            key = (lo_f, up_f)
+            if key in memo:
+                return memo[key]
+            level, low, high = self.level, self.low, self.high
+            v = min(level[lo_f], level[up_f])
+            l0, l1 = (low[lo_f], high[lo_f]) if level[lo_f] == v else (lo_f, lo_f)
+            u0, u1 = (low[up_f], high[up_f]) if level[up_f] == v else (up_f, up_f)
+            c0, z0 = yield self.conj(l0, self.negate(u1)), u0
+            c1, z1 = yield self.conj(l1, self.negate(u0)), u1
+            rest = self.disj(self.conj(l0, self.negate(z0)), self.conj(l1, self.negate(z1)))
+            cd, zd = yield rest, self.conj(u0, u1)
+            name = self.names[v]
+            cubes = [{name: False, **c} for c in c0] + [{name: True, **c} for c in c1] + cd
+            r = memo[key] = (cubes, self.disj(self._mk(v, z0, z1), zd))
+            return r
+        return _trampoline(rec, f, f)[0]
+
+def _trampoline(fn, *args):
+    # run the generator function `fn` as a recursive function whose recursive
+    # calls are its yields (of argument tuples), on an explicit stack
+    stack = [fn(*args)]
+    value = None
+    while stack:
+        try:
+            call = stack[-1].send(value)
+        except StopIteration as done:
+            stack.pop()
+            value = done.value
+            continue
+        stack.append(fn(*call))
+        value = None
+    return value
+
+def _order(cc, roots) -> list:
+    # source slots in depth-first order from `roots`, fan-ins in pin order
+    seen = set()
+    order = []
+    sources = set(cc.sources)
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            i, done = stack.pop()
+            if done:
+                if i in sources:
+                    order.append(i)
+                continue
+            if i in seen or i == cc.size:
+                continue
+            seen.add(i)
+            stack.append((i, True))
+            if i in sources:
+                continue
+            if i in cc.wide:
+                fanin = cc.wide[i]
+                ins = [fanin[p] for p in gate_type(cc.types[i]).pins if p in fanin]
+            else:
+                ins = [cc.fanin_a[i], cc.fanin_b[i]]
+            stack += [(j, False) for j in reversed(ins)]
+    return order
+
+def _roots(cc) -> list:
+    outs = [i for i, t in enumerate(cc.types) if base_type(t) == "OUTPUT"]
+    return outs + cc.dff_d
+
+def circuit_bdds(circuit: Circuit, manager: BDD = None, sequential: bool = False):
+    """(manager, {gate id: node}) for every gate of `circuit`. Combinationally
+    a DFF reads as False, as in Circuit.evaluate; with `sequential` each DFF
+    state is a variable and "<id>.d" maps to its next-state function."""
+    cc = circuit.compile(sequential=sequential)
+    if cc.widths is not None:
+        raise ValueError("BDDs need a circuit without word-level gates")
+    m = manager or BDD()
+    node = [0] * (cc.size + 1)
+    for i in _order(cc, _roots(cc))[::-1] + cc.sources:
+        node[i] = m.var(cc.ids[i])
+    for i, table, a, b in cc.program:
+        if table is None:
+            fanin = cc.wide[i]
+            op = gate_type(cc.types[i])
+            node[i] = m.from_table(op.table, [node[fanin.get(p, cc.size)] for p in op.pins])
+        else:
+            node[i] = m.from_table(table, [node[a], node[b]])
+    nodes = {gid: node[i] for i, gid in enumerate(cc.ids)}
+    for i, d in zip(cc.states, cc.dff_d):
+        nodes[cc.ids[i] + ".d"] = node[d]
+    return m, nodes
+
+def _signals(circuit: Circuit, sequential: bool) -> list:
+    cc = circuit.compile(sequential=sequential)
+    return [gid for gid, t in zip(cc.ids, cc.types) if base_type(t) == "OUTPUT"] + \
+           [cc.ids[i] + ".d" for i in cc.states]
+
+def _assignment(partial, names) -> Dict[str, bool]:
+    return {name: bool(partial.get(name, False)) for name in names}
+
+def equivalent(first: Circuit, second: Circuit, outputs=None, sequential: bool = False,
+               max_nodes: int = MAX_NODES) -> Dict[str, Any]:
+    """Check that `first` and `second` compute the same function on every
+    OUTPUT they share (or the ids in `outputs`), and with `sequential` the
+    same next state for every DFF they share ("<id>.d"), with DFF states as
+    free variables. Inputs and DFFs are matched by gate id. Returns whether
+    they are equivalent, the first differing signal with a counterexample
+    assignment of every input, and the signals only one circuit has."""
+    m = BDD(max_nodes)
+    m, f1 = circuit_bdds(first, m, sequential)
+    m, f2 = circuit_bdds(second, m, sequential)
+    s1, s2 = _signals(first, sequential), _signals(second, sequential)
+    if outputs is None:
+        shared = set(s2)
+        common = [s for s in s1 if s in shared]
+    else:
+        common = list(outputs)
+        for s in common:
+            if s not in f1 or s not in f2:
+                raise ValueError(f"Gate id not found in both circuits: {s}")
+    result = {"equivalent": True, "compared": len(common), "mismatch": None, "counterexample": None,
+              "only_in_first": [s for s in s1 if s not in f2], "only_in_second": [s for s in s2 if s not in f1]}
+    for s in common:
+        diff = m.xor(f1[s], f2[s])
+        if diff != 0:
+            names = sorted(set(m.index) & (set(f1) | set(f2)), key=m.index.get)
+            result.update(equivalent=False, mismatch=s,
+                          counterexample=_assignment(m.sat_one(diff), names))
+            break
+    return result
+
+def satisfy(circuit: Circuit, output: str, value: bool = True, sequential: bool = False) -> Dict[str, Any]:
+    """An assignment of every input (and DFF state, with `sequential`) that
+    drives `output` to `value`, or None if there is none, plus how many
+    assignments do."""
+    m, f = circuit_bdds(circuit, sequential=sequential)
+    if output not in f:
+        raise ValueError(f"Gate id not found: {output}")
+    g = f[output] if value else m.negate(f[output])
+    hit = m.sat_one(g)
+    return {"assignment": None if hit is None else _assignment(hit, m.names),
+            "count": m.sat_count(g), "variables": len(m.names)}
+
+def minimize(circuit: Circuit, output: str, sequential: bool = False) -> Dict[str, Any]:
+    """Irredundant sum-of-products cover of `output` as cubes {input: bool}
+    and as an expression string."""
+    m, f = circuit_bdds(circuit, sequential=sequential)
+    if output not in f:
+        raise ValueError(f"Gate id not found: {output}")
+    cubes = m.isop(f[output])
+    return {"cubes": cubes, "expression": sop_expression(cubes)}
+
+def sop_expression(cubes) -> str:
+    """'a & ~b | c' for a list of cubes; '0' / '1' for the constants."""
+    if not cubes:
+        return "0"
+    terms = [" & ".join(name if val else "~" + name for name, val in cube.items()) or "1" for cube in cubes]
+    return " | ".join(terms)
@@ -0,0 +1,190 @@
+"""Benchmark harness for the simulator.
+
+    python bench.py                                  # all generators, 100 .. 1M gates
+    python bench.py --sizes 100,10000 --kinds ripple_adder,counter
+    python bench.py --url http://localhost:8000      # also time POST /evaluate
+    python bench.py --save-baseline                  # store results as the baseline
+    python bench.py --baseline                       # fail (exit 1) on regressions against
+                                                     # bench_baseline.json (or --baseline FILE)
+
+For every generated circuit (see generators.py) it records build time, first
+evaluate (compile included), steady-state evaluate latency and gate-evals/sec;
+for sequential circuits also evaluate_with_tick latency and run() cycles/sec;
+and the peak traced memory of building + evaluating, measured in a separate
+pass so tracemalloc does not skew the timings. Results are written as JSON.
+
+With a baseline, every lower-is-better metric that got slower / bigger by more
+than --tolerance (and by more than --min-delta seconds for timings) is listed
+and the exit status is 1. Timings only compare on the machine that recorded
+them, so no baseline is shipped: when the baseline file does not exist yet the
+comparison is skipped with a note (exit 0); record one with --save-baseline.
+"""
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+from typing import Dict, Any, List
+
+import generators
+from sim import base_type
+
+SIZES = (100, 1000, 10000, 100000, 1000000)
+RESULTS = "bench_results.json"
+BASELINE = "bench_baseline.json"
+# lower is better; compared against the baseline
+METRICS = ("build_s", "first_eval_s", "eval_s", "tick_s", "endpoint_s", "peak_bytes")
+
+def _timed(fn, min_time: float = 0.2, max_repeat: int = 50) -> float:
+    """Median wall time of fn(), repeated until `min_time` has passed (at least 3 runs)."""
+    times = []
+    start = time.perf_counter()
+    while len(times) < 3 or (len(times) < max_repeat and time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+def _payload(c) -> dict:
+    # same shape as the /evaluate payload
+    return {
+        "nodes": [{"id": gid, "type": g.type} for gid, g in c.gates.items()],
+        "edges": [{"from": s, "to": d, "pin": data.get("pin", "a")} for s, d, data in c.G.edges(data=True)],
+        "inputs": {gid: g.value for gid, g in c.gates.items() if base_type(g.type) == "INPUT"},
+    }
+
+def _post(url: str, body: bytes):
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req) as resp:
+        resp.read()
+
+def bench_case(kind: str, size: int, url: str = None, memory: bool = True, cycles: int = 100) -> Dict[str, Any]:
+    gc.collect()
+    t0 = time.perf_counter()
+    c = generators.sized(kind, size)
+    build = time.perf_counter() - t0
+    gates = len(c.gates)
+    inputs = [gid for gid, g in c.gates.items() if base_type(g.type) == "INPUT"]
+    for k, gid in enumerate(inputs):
+        c.set_input_value(gid, k % 3 == 0)
+    sequential = kind in generators.SEQUENTIAL
+    # DFF feedback is only legal in sequential mode
+    evaluate = (lambda: c.evaluate_with_tick(False)) if sequential else c.evaluate
+    t0 = time.perf_counter()
+    evaluate()
+    first = time.perf_counter() - t0
+    eval_s = _timed(evaluate)
+    result = {
+        "kind": kind, "size": size, "gates": gates, "edges": c.number_of_edges(),
+        "build_s": build, "first_eval_s": first, "eval_s": eval_s,
+        "gate_evals_per_s": gates / eval_s if eval_s else None,
+    }
+    if sequential:
+        result["tick_s"] = _timed(lambda: c.evaluate_with_tick(True))
+        t0 = time.perf_counter()
+        c.run(cycles)
+        result["cycles_per_s"] = cycles / (time.perf_counter() - t0)
+    if url and not sequential:  # /evaluate is combinational only
+        body = json.dumps(_payload(c)).encode()
+        endpoint = url.rstrip("/") + "/evaluate"
+        result["endpoint_s"] = _timed(lambda: _post(endpoint, body), min_time=1.0, max_repeat=10)
+    del c
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        c = generators.sized(kind, size)
+        c.evaluate_with_tick(False) if sequential else c.evaluate()
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del c
+    return result
+
+def run_suite(kinds, sizes, url: str = None, memory: bool = True, verbose: bool = True) -> Dict[str, Any]:
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            r = bench_case(kind, size, url=url, memory=memory)
+            results.append(r)
+            if verbose:
+                line = (f"{kind:>16} {r['gates']:>8} gates  build {r['build_s'] * 1e3:9.2f} ms  "
+                        f"eval {r['eval_s'] * 1e3:9.3f} ms  {r['gate_evals_per_s'] / 1e6:6.2f} M evals/s")
+                if "tick_s" in r:
+                    line += f"  tick {r['tick_s'] * 1e3:8.3f} ms"
+                if "endpoint_s" in r:
+                    line += f"  /evaluate {r['endpoint_s'] * 1e3:9.2f} ms"
+                if "peak_bytes" in r:
+                    line += f"  peak {r['peak_bytes'] / 2 ** 20:8.1f} MiB"
+                print(line, flush=True)
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25,
+            min_delta: float = 0.001) -> List[str]:
+    """Regressions of `current` against `baseline`, as readable lines (empty if none)."""
+    base = {(r["kind"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in current["results"]:
+        b = base.get((r["kind"], r["size"]))
+        if b is None:
+            continue
+        for m in METRICS:
+            old, new = b.get(m), r.get(m)
+            if old is None or new is None or new <= old * (1 + tolerance):
+                continue
+            if m.endswith("_s") and new - old < min_delta:
+                continue
+            regressions.append(f"{r['kind']} @ {r['size']}: {m} {old:.6g} -> {new:.6g} "
+                               f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Simulator benchmarks")
+    ap.add_argument("--kinds", default=",".join(generators.GENERATORS),
+                    help="comma-separated generators (default: all)")
+    ap.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated gate counts")
+    ap.add_argument("--url", help="base URL of a running API to time POST /evaluate against")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--output", default=RESULTS, help=f"results file (default {RESULTS})")
+    ap.add_argument("--baseline", nargs="?", const=BASELINE,
+                    help=f"baseline results to compare against (default {BASELINE}); "
+                         "skipped when the file does not exist")
+    ap.add_argument("--save-baseline", action="store_true", help=f"also write the results to {BASELINE}")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio (default 0.25)")
+    ap.add_argument("--min-delta", type=float, default=0.001,
+                    help="ignore timing regressions smaller than this many seconds")
+    args = ap.parse_args(argv)
+
+    kinds = [k for k in args.kinds.split(",") if k]
+    unknown = [k for k in kinds if k not in generators.GENERATORS]
+    if unknown:
+        ap.error(f"unknown generator(s): {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    current = run_suite(kinds, sizes, url=args.url, memory=not args.no_memory)
+    Path(args.output).write_text(json.dumps(current, indent=1))
+    print(f"results written to {args.output}")
+    if args.save_baseline:
+        Path(BASELINE).write_text(json.dumps(current, indent=1))
+        print(f"baseline written to {BASELINE}")
+    if args.baseline and not Path(args.baseline).is_file():
+        print(f"no baseline at {args.baseline}, comparison skipped (record one with --save-baseline)")
+    elif args.baseline:
+        regressions = compare(current, json.loads(Path(args.baseline).read_text()),
+                              tolerance=args.tolerance, min_delta=args.min_delta)
+        if regressions:
+            print(f"REGRESSIONS against {args.baseline}:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print(f"no regressions against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""Array-backed Circuit storage for very large netlists.
+
+CompactCircuit keeps the same public API as Circuit (add_gate, connect,
+disconnect, remove_gate, set_input_value, evaluate, ...) but stores gates as
+rows of flat arrays (integer type codes, a value byte, float32 position) and
+connectivity as linked edge lists threaded through flat arrays, instead of
+Gate objects and a networkx DiGraph. `gates` is a read/write view returning
+lightweight GateView handles, and `G` builds a networkx graph on demand for
+code that still wants one.
+"""
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Any
+
+import networkx as nx
+
+from sim import Circuit, Gate, MODULES, base_type, deep_sizeof, expand_modules, gate_type, _report
+
+# Shared code tables: type / pin name <-> small integer.
+TYPE_NAMES = []
+PIN_NAMES = []
+_TYPE_CODES = {}
+_PIN_CODES = {}
+_DEAD = 0xFFFF    # type code of a removed gate row
+_NONE = 2         # value byte of a gate whose value was never set
+_NIL = -1         # end of an edge list
+
+def _code(name: str, names: list, codes: dict, limit: int) -> int:
+    c = codes.get(name)
+    if c is None:
+        if len(names) >= limit:
+            raise ValueError(f"More than {limit} distinct names in a code table")
+        c = codes[name] = len(names)
+        names.append(name)
+    return c
+
+def _pins(type_name: str) -> tuple:
+    return gate_type(type_name).pins
+
+class GateView:
+    """Gate-like handle onto one row of a CompactCircuit's gate table."""
+    __slots__ = ("_c", "_i")
+
+    def __init__(self, circuit: "CompactCircuit", row: int):
+        self._c = circuit
+        self._i = row
+
+    @property
+    def id(self) -> str:
+        return self._c._ids[self._i]
+
+    @property
+    def type(self) -> str:
+        return TYPE_NAMES[self._c._types[self._i]]
+
+    @property
+    def inputs(self) -> tuple:
+        return _pins(self.type)
+
+    @property
+    def value(self):
+        wide = self._c._wide.get(self._i)
+        if wide is not None:
+            return wide
+        v = self._c._values[self._i]
+        return None if v == _NONE else bool(v)
+
+    @value.setter
+    def value(self, value):
+        self._c._set_value(self._i, value)
+
+    @property
+    def position(self) -> tuple:
+        pos = self._c._pos
+        return (pos[2 * self._i], pos[2 * self._i + 1])
+
+    def eval(self, input_values: Dict[str, bool]) -> bool:
+        g = Gate(self.id, self.type)
+        g.value = self.value
+        return g.eval(input_values)
+
+class _GateTable(Mapping):
+    __slots__ = ("_c",)
+
+    def __init__(self, circuit: "CompactCircuit"):
+        self._c = circuit
+
+    def __getitem__(self, gid: str) -> GateView:
+        return GateView(self._c, self._c._index[gid])
+
+    def __contains__(self, gid) -> bool:
+        return gid in self._c._index
+
+    def __iter__(self):
+        return (gid for gid in self._c._ids if gid is not None)
+
+    def __len__(self) -> int:
+        return len(self._c._index)
+
+class CompactCircuit(Circuit):
+    """Circuit with array-backed gate and edge tables.
+
+    Removed gate rows are left as tombstones (their ids stop resolving);
+    removed edge slots are reused by later connects."""
+
+    def _init_storage(self):
+        # gate rows
+        self._ids = []
+        self._index = {}
+        self._types = array("H")
+        self._values = bytearray()
+        self._pos = array("f")
+        self._head_in = array("i")
+        self._head_out = array("i")
+        # edge slots; each edge is on its destination's in-list (in connection
+        # order) and its source's out-list
+        self._src = array("I")
+        self._dst = array("I")
+        self._pin = array("H")
+        self._next_in = array("i")
+        self._next_out = array("i")
+        self._free_edges = []
+        # output-port names of edges leaving module instances (rare, so kept sparse)
+        self._src_pins = {}
+        # integer values of word-level gates (bus inputs, registers), by row
+        self._wide = {}
+        self._m = 0
+        self._graph = None
+
+    @property
+    def gates(self) -> _GateTable:
+        return _GateTable(self)
+
+    @property
+    def G(self) -> nx.DiGraph:
+        """networkx view of the structure, rebuilt after structural changes."""
+        if self._graph is None:
+            G = nx.DiGraph()
+            ids = self._ids
+            G.add_nodes_from(gid for gid in ids if gid is not None)
+            for d, gid in enumerate(ids):
+                if gid is not None:
+                    for e in self._in_edges(d):
+                        G.add_edge(ids[self._src[e]], gid, pin=PIN_NAMES[self._pin[e]])
+                        if e in self._src_pins:
+                            G.edges[ids[self._src[e]], gid]["src_pin"] = self._src_pins[e]
+            self._graph = G
+        return self._graph
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._graph = None
+
+    def _in_edges(self, row: int):
+        e = self._head_in[row]
+        while e != _NIL:
+            yield e
+            e = self._next_in[e]
+
+    def _out_edges(self, row: int):
+        e = self._head_out[row]
+        while e != _NIL:
+            yield e
+            e = self._next_out[e]
+
+    def add_gate(self, gate: Gate):
+        row = self._index.get(gate.id)
+        existed = row is not None
+        if row is None:
+            row = self._index[gate.id] = len(self._ids)
+            self._ids.append(gate.id)
+            self._types.append(0)
+            self._values.append(_NONE)
+            self._pos.extend((0.0, 0.0))
+            self._head_in.append(_NIL)
+            self._head_out.append(_NIL)
+        self._types[row] = _code(gate.type, TYPE_NAMES, _TYPE_CODES, _DEAD)
+        self._set_value(row, gate.value)
+        self._pos[2 * row] = float(gate.position[0])
+        self._pos[2 * row + 1] = float(gate.position[1])
+        self._topo_add(gate.id, existed)
+        self._invalidate()
+
+    def _set_value(self, row: int, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            self._wide[row] = value
+            self._values[row] = 1 if value else 0
+        else:
+            self._wide.pop(row, None)
+            self._values[row] = _NONE if value is None else (1 if value else 0)
+
+    def _unlink_out(self, s: int, edge: int):
+        prev = _NIL
+        for e in self._out_edges(s):
+            if e == edge:
+                if prev == _NIL:
+                    self._head_out[s] = self._next_out[e]
+                else:
+                    self._next_out[prev] = self._next_out[e]
+                return
+            prev = e
+
+    def _unlink_in(self, d: int, edge: int):
+        prev = _NIL
+        for e in self._in_edges(d):
+            if e == edge:
+                if prev == _NIL:
+                    self._head_in[d] = self._next_in[e]
+                else:
+                    self._next_in[prev] = self._next_in[e]
+                return
+            prev = e
+
+    def _free(self, edge: int):
+        self._src_pins.pop(edge, None)
+        self._free_edges.append(edge)
+        self._m -= 1
+
+    def remove_gate(self, gid: str):
+        if gid not in self._index:
+            return
+        seeds = self._topo_remove(gid)
+        row = self._index.pop(gid)
+        for e in list(self._in_edges(row)):
+            self._unlink_out(self._src[e], e)
+            self._free(e)
+        for e in list(self._out_edges(row)):
+            d = self._dst[e]
+            if d != row:
+                self._unlink_in(d, e)
+                self._free(e)
+        self._head_in[row] = self._head_out[row] = _NIL
+        self._ids[row] = None
+        self._types[row] = _DEAD
+        self._wide.pop(row, None)
+        self._relevel(seeds)
+        self._invalidate()
+
+    def connect(self, src_id: str, dst_id: str, dst_pin: str = "a", src_pin: str = None):
+        s = self._index.get(src_id)
+        d = self._index.get(dst_id)
+        if s is None or d is None:
+            raise ValueError("Gate id not found")
+        pin = _code(dst_pin, PIN_NAMES, _PIN_CODES, 0x10000)
+        last = _NIL
+        for e in self._in_edges(d):
+            if self._src[e] == s:
+                # reconnecting keeps the edge's place and updates its pin, like DiGraph.add_edge
+                self._pin[e] = pin
+                self._set_src_pin(e, src_pin)
+                self._invalidate()
+                return
+            last = e
+        self._topo_connect(src_id, dst_id)
+        if self._free_edges:
+            e = self._free_edges.pop()
+            self._src[e] = s
+            self._dst[e] = d
+            self._pin[e] = pin
+            self._next_in[e] = _NIL
+        else:
+            e = len(self._src)
+            self._src.append(s)
+            self._dst.append(d)
+            self._pin.append(pin)
+            self._next_in.append(_NIL)
+            self._next_out.append(_NIL)
+        if last == _NIL:
+            self._head_in[d] = e
+        else:
+            self._next_in[last] = e
+        self._next_out[e] = self._head_out[s]
+        self._head_out[s] = e
+        self._set_src_pin(e, src_pin)
+        self._m += 1
+        self._raise_level(src_id, dst_id)
+        self._invalidate()
+
+    def _set_src_pin(self, edge: int, src_pin: str):
+        if src_pin is None:
+            self._src_pins.pop(edge, None)
+        else:
+            self._src_pins[edge] = src_pin
+
+    def disconnect(self, src_id: str, dst_id: str):
+        s = self._index.get(src_id)
+        d = self._index.get(dst_id)
+        if s is None or d is None:
+            return
+        for e in self._in_edges(d):
+            if self._src[e] == s:
+                self._unlink_in(d, e)
+                self._unlink_out(s, e)
+                self._free(e)
+                self._topo_disconnect(dst_id)
+                self._invalidate()
+                return
+
+    def netlist_arrays(self):
+        ids = [gid for gid in self._ids if gid is not None]
+        live = [row for row, gid in enumerate(self._ids) if gid is not None]
+        pos = {row: i for i, row in enumerate(live)}
+        src, dst, pins, src_pins = [], [], [], []
+        for d, row in enumerate(live):
+            for e in self._in_edges(row):
+                src.append(pos[self._src[e]])
+                dst.append(d)
+                pins.append(PIN_NAMES[self._pin[e]])
+                src_pins.append(self._src_pins.get(e))
+        return expand_modules(ids, [TYPE_NAMES[self._types[row]] for row in live], src, dst, pins, src_pins)
+
+    def _preds(self, gid: str) -> list:
+        ids, src = self._ids, self._src
+        return [ids[src[e]] for e in self._in_edges(self._index[gid])]
+
+    def _succs(self, gid: str) -> list:
+        ids, dst = self._ids, self._dst
+        return [ids[dst[e]] for e in self._out_edges(self._index[gid])]
+
+    def _cut(self, gid: str) -> bool:
+        t = TYPE_NAMES[self._types[self._index[gid]]]
+        return base_type(t) == "DFF" or t in MODULES
+
+    def number_of_edges(self) -> int:
+        return self._m
+
+    def memory_report(self) -> Dict[str, Any]:
+        gate_bytes = deep_sizeof((self._ids, self._index, self._types, self._values, self._wide,
+                                  self._pos, self._head_in, self._head_out))
+        edge_bytes = deep_sizeof((self._src, self._dst, self._pin, self._next_in, self._next_out,
+                                  self._free_edges, self._src_pins))
+        return _report(len(self._index), self._m, gate_bytes, edge_bytes)
+
+    def clear(self):
+        self._init_storage()
+        self._reset_topology()
+        self._dirty.clear()
+        self._hidden.clear()
+        self._invalidate()
@@ -0,0 +1,110 @@
+"""Stuck-at fault simulation for grading test vectors.
+
+fault_coverage() checks a set of input vectors against single stuck-at-0 /
+stuck-at-1 faults on gate outputs. Vectors are packed into words as in
+Circuit.evaluate_batch, `block` vectors at a time. Each block computes the
+fault-free words once. Then, for every fault not yet detected, it forces the
+faulty gate's word to all zeros or all ones and re-evaluates only that gate's
+fan-out cone, stopping wherever a faulty word equals the fault-free one
+(parallel-pattern single-fault propagation). A fault is detected when any
+observed gate (default: every OUTPUT) differs in any vector of the block. It
+is then dropped, so later blocks only simulate faults that are still open.
+
+Faulty machines run the compiled circuit's bit-parallel program, which is
+built from the same gate-type truth tables as Gate.eval. A fault therefore
+behaves exactly like evaluating the circuit with that gate's output tied to a
+constant.
+"""
+import heapq
+from typing import Dict, Any
+
+from sim import Circuit, base_type
+
+def stuck_at_faults(circuit: Circuit) -> list:
+    """Every (gate id, stuck value) fault on a gate output, in compiled order."""
+    return [(gid, v) for gid in circuit.compile().ids for v in (0, 1)]
+
+def fault_coverage(circuit: Circuit, vectors, inputs=None, faults=None, observe=None,
+                   block: int = 256) -> Dict[str, Any]:
+    """Grade `vectors` (rows as for Circuit.evaluate_batch) against `faults`,
+    a list of (gate id, 0/1) pairs (default: stuck_at_faults(circuit)). A
+    fault counts as detected when a gate in `observe` (default: every OUTPUT)
+    differs from the fault-free circuit. Returns the fault count, the number
+    detected, the coverage fraction, the undetected faults, and for each
+    detected fault the index of the first vector that detects it."""
+    cc = circuit.compile()
+    if faults is None:
+        faults = stuck_at_faults(circuit)
+    if observe is None:
+        observed = {i for i, t in enumerate(cc.types) if base_type(t) == "OUTPUT"}
+    else:
+        observed = set()
+        for gid in observe:
+            i = cc.index.get(gid)
+            if i is None:
+                raise ValueError(f"Gate id not found: {gid}")
+            observed.add(i)
+    sites = []
+    for gid, v in faults:
+        i = cc.index.get(gid)
+        if i is None:
+            raise ValueError(f"Gate id not found: {gid}")
+        sites.append((i, 1 if v else 0))
+    ops = {i: (op, a, b) for i, op, a, b in cc.batch_program}
+    fanout = cc.fanout
+    defaults = {i: bool(circuit.gate_value(cc.ids[i])) for i in cc.inputs}
+    first = [None] * len(sites)
+    remaining = list(range(len(sites)))
+    for start in range(0, len(vectors), block):
+        if not remaining:
+            break
+        chunk = vectors[start:start + block]
+        mask = (1 << len(chunk)) - 1
+        good = cc.run_batch(cc.batch_words(chunk, inputs, defaults), len(chunk))
+        still = []
+        for f in remaining:
+            i, v = sites[f]
+            diff = _propagate(i, mask if v else 0, good, mask, ops, fanout, observed)
+            if diff:
+                first[f] = start + (diff & -diff).bit_length() - 1
+            else:
+                still.append(f)
+        remaining = still
+    undetected = [(faults[f][0], sites[f][1]) for f in range(len(sites)) if first[f] is None]
+    total = len(sites)
+    return {
+        "faults": total,
+        "detected": total - len(undetected),
+        "coverage": (total - len(undetected)) / total if total else 1.0,
+        "undetected": undetected,
+        "first_detection": [(faults[f][0], sites[f][1], first[f])
+                            for f in range(len(sites)) if first[f] is not None],
+    }
+
+def _propagate(site: int, forced: int, good: list, mask: int, ops, fanout, observed) -> int:
+    # faulty words differing from `good`, evaluated in slot (levelized) order
+    # through the fan-out cone of `site`; returns the observed difference bits
+    if forced == good[site]:
+        return 0  # not excited by any vector of the block
+    bad = {site: forced}
+    diff = forced ^ good[site] if site in observed else 0
+    heap = list(fanout[site])
+    queued = set(heap)
+    heapq.heapify(heap)
+    while heap:
+        j = heapq.heappop(heap)
+        op, a, b = ops[j]
+        if op is None:
+            x = a(*[bad.get(s, good[s]) for s in b], mask)
+        else:
+            x = op(bad.get(a, good[a]), bad.get(b, good[b]), mask)
+        if x == good[j]:
+            continue
+        bad[j] = x
+        if j in observed:
+            diff |= x ^ good[j]
+        for k in fanout[j]:
+            if k not in queued:
+                queued.add(k)
+                heapq.heappush(heap, k)
+    return diff
@@ -0,0 +1,189 @@
+"""Parameterized circuit generators for benchmarks and tests.
+
+Every generator returns a Circuit built only from the built-in gate types, with
+INPUT gates named in0, in1, ... (or a0.., b0.. for the arithmetic circuits)
+and OUTPUT gates on the results. `sized(kind, gates)` picks the generator's
+parameter so the circuit has roughly `gates` gates.
+"""
+import random
+from typing import Dict
+
+from sim import Circuit, Gate
+
+class _Builder:
+    """Thin helper numbering gates g0, g1, ... and wiring them on creation."""
+
+    def __init__(self, circuit: Circuit = None):
+        self.c = circuit if circuit is not None else Circuit()
+        self.n = 0
+
+    def gate(self, gtype: str, a: str = None, b: str = None, gid: str = None) -> str:
+        if gid is None:
+            gid = f"g{self.n}"
+            self.n += 1
+        self.c.add_gate(Gate(gid, gtype))
+        if a is not None:
+            self.c.connect(a, gid, "d" if gtype.startswith("DFF") else "a")
+        if b is not None:
+            self.c.connect(b, gid, "b")
+        return gid
+
+    def full_adder(self, a: str, b: str, cin: str):
+        p = self.gate("XOR", a, b)
+        s = self.gate("XOR", p, cin)
+        cout = self.gate("OR", self.gate("AND", a, b), self.gate("AND", p, cin))
+        return s, cout
+
+    def tree(self, gtype: str, signals: list) -> str:
+        """Balanced tree of 2-input `gtype` gates over `signals`."""
+        while len(signals) > 1:
+            nxt = [self.gate(gtype, signals[k], signals[k + 1]) for k in range(0, len(signals) - 1, 2)]
+            if len(signals) % 2:
+                nxt.append(signals[-1])
+            signals = nxt
+        return signals[0]
+
+def _operands(b: _Builder, bits: int):
+    a = [b.gate("INPUT", gid=f"a{i}") for i in range(bits)]
+    x = [b.gate("INPUT", gid=f"b{i}") for i in range(bits)]
+    return a, x
+
+def _outputs(b: _Builder, signals: list, prefix: str = "s"):
+    for i, s in enumerate(signals):
+        b.gate("OUTPUT", s, gid=f"{prefix}{i}")
+
+def ripple_adder(bits: int) -> Circuit:
+    """`bits`-bit ripple-carry adder: inputs a*, b*, cin; outputs s0..s{bits}."""
+    b = _Builder()
+    a, x = _operands(b, bits)
+    carry = b.gate("INPUT", gid="cin")
+    sums = []
+    for i in range(bits):
+        s, carry = b.full_adder(a[i], x[i], carry)
+        sums.append(s)
+    _outputs(b, sums + [carry])
+    return b.c
+
+def cla_adder(bits: int, block: int = 4) -> Circuit:
+    """Carry-lookahead adder: full lookahead inside `block`-bit groups, groups rippled."""
+    b = _Builder()
+    a, x = _operands(b, bits)
+    carry = b.gate("INPUT", gid="cin")
+    p = [b.gate("XOR", a[i], x[i]) for i in range(bits)]
+    g = [b.gate("AND", a[i], x[i]) for i in range(bits)]
+    sums = []
+    for lo in range(0, bits, block):
+        c0 = carry
+        for i in range(lo, min(lo + block, bits)):
+            carry_in = c0 if i == lo else carry
+            sums.append(b.gate("XOR", p[i], carry_in))
+            # c[i+1] = g[i] | p[i]g[i-1] | ... | p[i]..p[lo]c0, each term its own AND chain
+            terms = [g[i]]
+            for j in range(i - 1, lo - 2, -1):
+                tail = g[j] if j >= lo else c0
+                terms.append(b.tree("AND", p[j + 1:i + 1] + [tail]))
+            carry = b.tree("OR", terms)
+    _outputs(b, sums + [carry])
+    return b.c
+
+def array_multiplier(bits: int) -> Circuit:
+    """`bits` x `bits` unsigned array multiplier: AND partial products summed by rows of full adders."""
+    b = _Builder()
+    a, x = _operands(b, bits)
+    zero = b.gate("AND")  # unconnected AND reads False
+    row = [b.gate("AND", a[i], x[0]) for i in range(bits)] + [zero]
+    product = []
+    for j in range(1, bits):
+        product.append(row[0])
+        carry = zero
+        nxt = []
+        for i in range(bits):
+            s, carry = b.full_adder(row[i + 1], b.gate("AND", a[i], x[j]), carry)
+            nxt.append(s)
+        row = nxt + [carry]
+    product += row
+    _outputs(b, product[:2 * bits], prefix="p")
+    return b.c
+
+def random_dag(width: int, depth: int, seed: int = 0, fanin_window: int = 2) -> Circuit:
+    """`depth` layers of `width` random 2-input gates over `width` inputs. Each
+    gate reads gates from the previous `fanin_window` layers; the last layer
+    drives OUTPUTs."""
+    r = random.Random(seed)
+    b = _Builder()
+    types = ("AND", "OR", "NAND", "NOR", "XOR", "NOT")
+    layers = [[b.gate("INPUT", gid=f"in{i}") for i in range(width)]]
+    for _ in range(depth):
+        pool = [gid for layer in layers[-fanin_window:] for gid in layer]
+        prev = layers[-1]
+        layer = []
+        for k in range(width):
+            t = r.choice(types)
+            # always read the previous layer so the depth is real
+            layer.append(b.gate(t, prev[k if r.random() < 0.5 else r.randrange(width)],
+                                None if t == "NOT" else r.choice(pool)))
+        layers.append(layer)
+    _outputs(b, layers[-1], prefix="out")
+    return b.c
+
+def lfsr(bits: int, taps=None) -> Circuit:
+    """Fibonacci LFSR of `bits` DFFs, seeded by INPUT in0 XORed into the feedback."""
+    b = _Builder()
+    seed = b.gate("INPUT", gid="in0")
+    if taps is None:
+        taps = sorted({bits - 1, bits - 2, bits // 2, 0}) if bits > 2 else list(range(bits))
+    q = [f"q{i}" for i in range(bits)]
+    for gid in q:
+        b.gate("DFF", gid=gid)
+    feedback = b.tree("XOR", [q[t] for t in taps] + [seed])
+    b.c.connect(feedback, q[0], "d")
+    for i in range(1, bits):
+        b.c.connect(q[i - 1], q[i], "d")
+    _outputs(b, q, prefix="out")
+    return b.c
+
+def counter(bits: int) -> Circuit:
+    """Synchronous `bits`-bit binary counter with an INPUT enable (in0)."""
+    b = _Builder()
+    carry = b.gate("INPUT", gid="in0")
+    q = []
+    for i in range(bits):
+        qi = b.gate("DFF", gid=f"q{i}")
+        b.c.connect(b.gate("XOR", qi, carry), qi, "d")
+        carry = b.gate("AND", qi, carry)
+        q.append(qi)
+    _outputs(b, q, prefix="out")
+    return b.c
+
+def accumulators(count: int, width: int = 32) -> Circuit:
+    """`count` word-level `width`-bit accumulators (DFF:width fed back through
+    ADD:width), all adding the bus INPUT in0 every clock edge."""
+    b = _Builder()
+    step = b.gate(f"INPUT:{width}", gid="in0")
+    q = []
+    for i in range(count):
+        qi = b.gate(f"DFF:{width}", gid=f"q{i}")
+        b.c.connect(b.gate(f"ADD:{width}", qi, step), qi, "d")
+        q.append(qi)
+    for i, s in enumerate(q):
+        b.gate(f"OUTPUT:{width}", s, gid=f"out{i}")
+    return b.c
+
+# name -> (generator taking a size parameter, approximate gates per parameter unit, exponent)
+GENERATORS: Dict[str, tuple] = {
+    "ripple_adder": (ripple_adder, 8.0, 1),
+    "cla_adder": (cla_adder, 14.0, 1),
+    "array_multiplier": (array_multiplier, 7.0, 2),
+    "random_dag": (lambda n: random_dag(max(1, n // 32), 32), 1.0, 1),
+    "lfsr": (lfsr, 2.0, 1),
+    "counter": (counter, 4.0, 1),
+    "accumulators": (accumulators, 3.0, 1),
+}
+
+def sized(kind: str, gates: int) -> Circuit:
+    """Build a `kind` circuit (a key of GENERATORS) with about `gates` gates."""
+    gen, per_unit, exp = GENERATORS[kind]
+    n = max(2, round((gates / per_unit) ** (1.0 / exp)))
+    return gen(n)
+
+SEQUENTIAL = ("lfsr", "counter", "accumulators")
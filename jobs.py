@@ -0,0 +1,269 @@
+"""Bounded offload of CPU-bound API work.
+
+JobPool runs each job in one of two lanes, chosen by its estimated work. The
+work is the gate count, scaled up for batches of vectors.
+
+- Small jobs run on a thread pool. The event loop stays free while they run,
+  and they start in well under a millisecond.
+- Large jobs run in a process pool. They neither block the event loop nor
+  hold the GIL that small jobs and the server itself need.
+
+Each lane has a fixed number of workers and a bounded queue. run() raises:
+
+- TooLarge for a job over the gate limit;
+- Busy when the lane is full;
+- asyncio.TimeoutError past the job's timeout.
+
+A job that timed out keeps its slot until its worker finishes it, so timed-out
+work cannot pile up behind the limits.
+
+The job functions below take plain payloads and return plain data, so they
+can be pickled to worker processes. Each one records its gate evaluations in
+a fresh metrics.Stats, and run() merges that into the pool's stats.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any
+
+import metrics
+import netlist
+from sim import Circuit, Gate, base_type
+
+class Busy(RuntimeError):
+    """Every worker of the lane is busy and its queue is full."""
+
+class TooLarge(ValueError):
+    """The circuit has more gates than the pool accepts."""
+
+def build_circuit(payload: dict, stats: metrics.Stats = None) -> Circuit:
+    # build a Circuit from { nodes: [{id, type}, ...], edges: [{from, to, pin?}, ...] }
+    c = Circuit()
+    for n in payload.get('nodes', []):
+        c.add_gate(Gate(n['id'], n['type']))
+    for e in payload.get('edges', []):
+        # default to pin 'a' for connections
+        c.connect(e['from'], e['to'], e.get('pin', 'a'))
+    if stats is not None:
+        c.enable_stats(stats)
+    return c
+
+def apply_inputs(c: Circuit, inputs: dict):
+    for iid, val in inputs.items():
+        if iid in c.gates:
+            try:
+                c.set_input_value(iid, val)
+            except Exception:
+                pass
+
+def evaluate(payload: dict, stats: metrics.Stats = None) -> Dict[str, Any]:
+    c = build_circuit(payload, stats)
+    apply_inputs(c, payload.get('inputs', {}))
+    vals = c.evaluate()
+    # the compiled gate order is already a topological order
+    return {'values': vals, 'order': list(c.compile().ids)}
+
+def evaluate_batch(payload: dict, stats: metrics.Stats = None) -> Dict[str, Any]:
+    c = build_circuit(payload, stats)
+    vectors = payload.get('vectors', [])
+    vals = c.evaluate_batch(vectors, inputs=payload.get('input_ids'))
+    watch = payload.get('watch')
+    if watch is not None:
+        missing = [gid for gid in watch if gid not in vals]
+        if missing:
+            raise ValueError(f'Gate id not found: {missing[0]}')
+        vals = {gid: vals[gid] for gid in watch}
+    return {'values': vals, 'count': len(vectors)}
+
+def split_batch(payload: dict, shards: int) -> list:
+    """`payload` for evaluate_batch as up to `shards` payloads over consecutive slices of its vectors."""
+    vectors = payload.get('vectors', [])
+    size = max(1, -(-len(vectors) // max(1, shards)))
+    return [dict(payload, vectors=vectors[k:k + size]) for k in range(0, len(vectors), size)] or [payload]
+
+def merge_batches(parts: list) -> Dict[str, Any]:
+    """Concatenate evaluate_batch results of split_batch shards, in order."""
+    return {'values': {gid: [x for p in parts for x in p['values'][gid]] for gid in parts[0]['values']},
+            'count': sum(p['count'] for p in parts)}
+
+def fault_coverage(payload: dict, stats: metrics.Stats = None) -> Dict[str, Any]:
+    from faults import fault_coverage
+    c = build_circuit(payload, stats)
+    faults = payload.get('faults')
+    return fault_coverage(c, payload.get('vectors', []), inputs=payload.get('input_ids'),
+                          faults=[tuple(f) for f in faults] if faults is not None else None,
+                          observe=payload.get('observe'))
+
+def equivalence(payload: dict, stats: metrics.Stats = None) -> Dict[str, Any]:
+    from bdd import equivalent, MAX_NODES
+    # the node limit bounds memory; a payload may lower it but not raise it
+    return equivalent(build_circuit(payload['first'], stats), build_circuit(payload['second'], stats),
+                      outputs=payload.get('outputs'), sequential=bool(payload.get('sequential')),
+                      max_nodes=min(int(payload.get('max_nodes', MAX_NODES)), MAX_NODES))
+
+# Session jobs work on a sessions.Session of this process, so they run with
+# local=True; the session lock keeps one job per session at a time.
+
+def new_session_circuit(payload: dict, circuit_stats: metrics.Stats = None, stats: metrics.Stats = None) -> Circuit:
+    # `circuit_stats` stays attached to the session's circuit for its lifetime
+    c = build_circuit(payload, circuit_stats)
+    c.compile()
+    if any(base_type(g.type) == 'DFF' for g in c.gates.values()):
+        c.compile(sequential=True)  # clocked evaluation and traces use the cut form
+    apply_inputs(c, payload.get('inputs', {}))
+    return c
+
+def evaluate_session(s, payload: dict, stats: metrics.Stats = None) -> Dict[str, Any]:
+    with s.lock:
+        c = s.circuit
+        apply_inputs(c, payload.get('inputs', {}))
+        vals = c.evaluate_incremental()
+        return {'values': dict(vals), 'order': list(c.compile().ids), 'evaluated': c.last_eval_count}
+
+def record_trace(s, payload: dict, max_window: int, stats: metrics.Stats = None) -> Dict[str, Any]:
+    from waveform import Trace
+    with s.lock:
+        if s.trace is None or payload.get('reset') or 'signals' in payload or 'window' in payload:
+            window = min(int(payload.get('window', max_window)), max_window)
+            s.trace = Trace(s.circuit, payload.get('signals'), window=window)
+        s.trace.capture(int(payload.get('cycles', 1)), payload.get('stimulus'))
+        return {'start': s.trace.first_cycle, 'end': s.trace.cycle, 'changes': s.trace.change_count}
+
+def trace_slice(s, start: int = None, end: int = None, vcd: bool = False, stats: metrics.Stats = None):
+    # None when the session has no trace
+    with s.lock:
+        if s.trace is None:
+            return None
+        return s.trace.to_vcd(start, end) if vcd else s.trace.slice(start, end)
+
+# Live (WebSocket) simulations stay in this process too; see live.py.
+
+def live_simulation(payload: dict, session=None, circuit_stats: metrics.Stats = None,
+                    stats: metrics.Stats = None):
+    # on a session's circuit, sharing its lock, or on a circuit built from `payload`
+    from live import LiveSimulation
+    if session is not None:
+        return LiveSimulation(session.circuit, lock=session.lock)
+    c = build_circuit(payload, circuit_stats)
+    apply_inputs(c, payload.get('inputs', {}))
+    return LiveSimulation(c)
+
+def live_inputs(live, inputs: dict, stats: metrics.Stats = None) -> int:
+    return live.set_inputs(inputs)
+
+def live_tick(live, count: int, stats: metrics.Stats = None) -> int:
+    return live.tick(count)
+
+def evaluate_saved(path: str, inputs: dict, max_gates: int = None, stats: metrics.Stats = None) -> Dict[str, Any]:
+    # binary netlists compile straight from the file's arrays without building Gate objects;
+    # their gate count is checked from the header before the job, JSON files' here
+    if path.endswith(netlist.EXT):
+        net = netlist.load(path)
+    else:
+        import json
+        with open(path) as f:
+            payload = json.load(f)
+        gates = len(payload.get('nodes', []))
+        if max_gates is not None and gates > max_gates:
+            raise TooLarge(f'Circuit has {gates} gates, over the limit of {max_gates}')
+        net = netlist.Netlist.from_payload(payload)
+    vals = netlist.evaluate(net, inputs)
+    return {'values': vals, 'order': list(vals)}
+
+def _run(fn, args, collect: bool):
+    stats = metrics.Stats() if collect else None
+    result = fn(*args, stats=stats)
+    return result, stats.snapshot() if stats is not None else None
+
+class JobPool:
+    """Two-lane worker pool; see the module docstring. Settings default to
+    DLSIM_EVAL_THREADS, DLSIM_EVAL_PROCESSES, DLSIM_EVAL_QUEUE,
+    DLSIM_SMALL_WORK, DLSIM_MAX_GATES and DLSIM_EVAL_TIMEOUT (seconds)."""
+
+    def __init__(self, threads: int = None, processes: int = None, queue: int = None,
+                 small_work: int = None, max_gates: int = None, timeout: float = None,
+                 stats: metrics.Stats = None):
+        env = os.environ.get
+        cpus = os.cpu_count() or 1
+        self.threads = threads or int(env('DLSIM_EVAL_THREADS', 4))
+        self.processes = processes or int(env('DLSIM_EVAL_PROCESSES', cpus))
+        self.queue = int(env('DLSIM_EVAL_QUEUE', 64)) if queue is None else queue
+        self.small_work = small_work or int(env('DLSIM_SMALL_WORK', 20000))
+        self.max_gates = max_gates or int(env('DLSIM_MAX_GATES', 2000000))
+        self.timeout = timeout or float(env('DLSIM_EVAL_TIMEOUT', 30))
+        self.stats = stats
+        self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix='dlsim-eval')
+        self._process_pool = None  # started on the first large job
+        self._lock = threading.Lock()
+        self.inflight = {'small': 0, 'large': 0}
+        self.rejected = {'small': 0, 'large': 0}
+        self.timeouts = {'small': 0, 'large': 0}
+
+    def check(self, gates: int):
+        if gates > self.max_gates:
+            raise TooLarge(f'Circuit has {gates} gates, over the limit of {self.max_gates}')
+
+    def lane(self, work: int, local: bool = False) -> str:
+        return 'small' if local or work <= self.small_work else 'large'
+
+    def _executor(self, lane: str):
+        if lane == 'small':
+            return self._thread_pool
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(self.processes)
+            return self._process_pool
+
+    def _release(self, lane: str):
+        with self._lock:
+            self.inflight[lane] -= 1
+
+    async def run(self, fn, *args, gates: int, work: int = None, local: bool = False,
+                  timeout: float = None):
+        """Run fn(*args, stats=...) in a worker and return its result. `work`
+        (default `gates`) picks the lane; `local` keeps the job in this process
+        (on the thread lane) for jobs on in-memory state such as sessions.
+        `timeout` is capped at the pool's."""
+        self.check(gates)
+        lane = self.lane(gates if work is None else work, local)
+        limit = (self.threads if lane == 'small' else self.processes) + self.queue
+        with self._lock:
+            if self.inflight[lane] >= limit:
+                self.rejected[lane] += 1
+                raise Busy(f'Too many {lane} jobs queued, try again later')
+            self.inflight[lane] += 1
+        try:
+            fut = self._executor(lane).submit(_run, fn, args, self.stats is not None)
+        except BaseException:
+            self._release(lane)
+            raise
+        fut.add_done_callback(lambda _: self._release(lane))
+        limit_s = self.timeout if timeout is None else min(timeout, self.timeout)
+        try:
+            result, snap = await asyncio.wait_for(asyncio.wrap_future(fut), limit_s)
+        except asyncio.TimeoutError:
+            fut.cancel()  # drops it if still queued; a running job finishes and frees its slot
+            with self._lock:
+                self.timeouts[lane] += 1
+            raise
+        if snap is not None:
+            self.stats.merge(snap)
+        return result
+
+    def to_prometheus(self, prefix: str = 'dlsim') -> str:
+        out = []
+        for name, help_text, kind, samples in (
+                ('jobs_inflight', 'Jobs running or queued per lane.', 'gauge', self.inflight),
+                ('jobs_rejected_total', 'Jobs rejected with a full queue.', 'counter', self.rejected),
+                ('jobs_timeouts_total', 'Jobs that ran past their timeout.', 'counter', self.timeouts)):
+            out.append(f'# HELP {prefix}_{name} {help_text}')
+            out.append(f'# TYPE {prefix}_{name} {kind}')
+            for lane, value in sorted(samples.items()):
+                out.append(f'{prefix}_{name}{{lane="{lane}"}} {value}')
+        return '\n'.join(out) + '\n'
+
+    def shutdown(self, wait: bool = True):
+        self._thread_pool.shutdown(wait=wait)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
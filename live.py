@@ -0,0 +1,92 @@
+"""Live, event-driven simulation of a clocked circuit for streaming front ends.
+
+LiveSimulation keeps the slot values of a circuit's sequential compiled form
+between messages. Input changes and clock edges only re-evaluate the fan-out
+cone of what changed, and frame() reports the gates whose value differs from
+the previous frame, so a slow client can skip frames without losing changes.
+"""
+import threading
+from typing import Dict
+
+from sim import Circuit, base_type
+
+class LiveSimulation:
+    """Every method holds `lock` while it touches the circuit. Pass the lock of
+    whatever else uses the circuit (a session's jobs) to share it; frame() can
+    skip instead of waiting for it."""
+
+    def __init__(self, circuit: Circuit, lock=None):
+        self.lock = lock if lock is not None else threading.Lock()
+        self.circuit = circuit
+        with self.lock:
+            self.cc = circuit.compile(sequential=True)
+            self.v = self.cc.run(circuit)
+        self.cycle = 0
+        # values as of the last frame; None forces every gate into the first frame
+        self._sent = [None] * self.cc.size
+        self._pending = set(range(self.cc.size))
+
+    def set_inputs(self, inputs: Dict[str, bool]) -> int:
+        """Apply INPUT changes and propagate them; returns the number of gates re-evaluated."""
+        cc, v = self.cc, self.v
+        with self.lock:
+            seeds = []
+            for iid, val in inputs.items():
+                i = cc.index.get(iid)
+                if i is None or base_type(cc.types[i]) != "INPUT":
+                    raise ValueError(f"Not an input gate: {iid}")
+                new = cc.to_slot(i, val)
+                # through the circuit, so its own incremental evaluation sees the change
+                self.circuit.set_input_value(iid, cc.from_slot(i, new))
+                if v[i] != new:
+                    v[i] = new
+                    seeds.append(i)
+            self._pending.update(seeds)
+            return cc.propagate(v, seeds, changed=self._pending)
+
+    def tick(self, count: int = 1) -> int:
+        """Clock `count` edges and write the DFF states back; returns the number
+        of gates re-evaluated."""
+        cc, v = self.cc, self.v
+        evaluated = 0
+        with self.lock:
+            for _ in range(count):
+                old = [v[i] for i in cc.states]
+                cc.clock(v)
+                seeds = [i for i, q in zip(cc.states, old) if v[i] != q]
+                self._pending.update(seeds)
+                evaluated += cc.propagate(v, seeds, changed=self._pending)
+                self.cycle += 1
+            self._write_back()
+        return evaluated
+
+    def sync(self):
+        """Write the current DFF states back to the circuit's gates."""
+        with self.lock:
+            self._write_back()
+
+    def _write_back(self):
+        for i in self.cc.states:
+            self.circuit.set_gate_value(self.cc.ids[i], self.cc.from_slot(i, self.v[i]))
+
+    def values(self) -> Dict[str, bool]:
+        with self.lock:
+            return self.cc.values(self.v)
+
+    def frame(self, block: bool = True):
+        """Gate values that changed since the previous frame (changes that were
+        undone in between are left out); None without `block` while another
+        thread holds the lock, the changes staying queued for the next frame."""
+        if not self.lock.acquire(blocking=block):
+            return None
+        try:
+            ids, v, sent = self.cc.ids, self.v, self._sent
+            changed = {}
+            for i in self._pending:
+                if sent[i] != v[i]:
+                    sent[i] = v[i]
+                    changed[ids[i]] = self.cc.from_slot(i, v[i])
+            self._pending.clear()
+            return {"cycle": self.cycle, "changed": changed}
+        finally:
+            self.lock.release()
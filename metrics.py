@@ -0,0 +1,127 @@
+"""Opt-in simulator instrumentation.
+
+A Stats object collects, for every Circuit it is attached to
+(Circuit.enable_stats):
+
+- per-phase call counts and wall time: netlist (reading the structure and
+  flattening modules), levelize (topological sort + cycle check + program
+  build), load (reading INPUT values / DFF states), settle (gate evaluation),
+  values (building the result dict), propagate (incremental cone walk),
+  clock, writeback (DFF states back to the gates), run, batch
+- gate evaluations per gate type
+- graph walks by kind (netlist, levelize, propagate)
+- cache hits / misses of the compiled form and the incremental state
+- evaluations by mode (full, incremental, tick, run, batch)
+
+A Circuit without stats pays one attribute check per call. to_prometheus()
+renders the counters in the Prometheus text exposition format; the FastAPI app
+serves the process-wide GLOBAL instance at /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}       # phase -> [calls, seconds]
+            self.gate_evals = {}   # gate type -> evaluations
+            self.walks = {}        # walk kind -> count
+            self.cache = {}        # cache name -> [hits, misses]
+            self.evaluations = {}  # mode -> count
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                p = self.phases.setdefault(name, [0, 0.0])
+                p[0] += 1
+                p[1] += dt
+
+    def walk(self, kind: str):
+        with self._lock:
+            self.walks[kind] = self.walks.get(kind, 0) + 1
+
+    def lookup(self, cache: str, hit: bool):
+        with self._lock:
+            c = self.cache.setdefault(cache, [0, 0])
+            c[0 if hit else 1] += 1
+
+    def evaluated(self, mode: str, type_counts: Dict[str, int], times: int = 1):
+        """Record one evaluation in `mode` that evaluated `type_counts` gates per type, `times` over."""
+        with self._lock:
+            self.evaluations[mode] = self.evaluations.get(mode, 0) + 1
+        self.gates(type_counts, times)
+
+    def gates(self, type_counts: Dict[str, int], times: int = 1):
+        with self._lock:
+            for t, k in type_counts.items():
+                self.gate_evals[t] = self.gate_evals.get(t, 0) + k * times
+
+    def merge(self, snap: Dict[str, Any]):
+        """Add the counters of another Stats' snapshot() (e.g. from a worker process)."""
+        with self._lock:
+            for k, p in snap["phases"].items():
+                mine = self.phases.setdefault(k, [0, 0.0])
+                mine[0] += p["calls"]
+                mine[1] += p["seconds"]
+            for k, c in snap["cache"].items():
+                mine = self.cache.setdefault(k, [0, 0])
+                mine[0] += c["hits"]
+                mine[1] += c["misses"]
+            for name in ("gate_evals", "walks", "evaluations"):
+                mine = getattr(self, name)
+                for k, n in snap[name].items():
+                    mine[k] = mine.get(k, 0) + n
+
+    def hit_rate(self, cache: str):
+        hits, misses = self.cache.get(cache, (0, 0))
+        return hits / (hits + misses) if hits + misses else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "phases": {k: {"calls": c, "seconds": s} for k, (c, s) in self.phases.items()},
+                "gate_evals": dict(self.gate_evals),
+                "walks": dict(self.walks),
+                "cache": {k: {"hits": h, "misses": m, "hit_rate": h / (h + m) if h + m else None}
+                          for k, (h, m) in self.cache.items()},
+                "evaluations": dict(self.evaluations),
+            }
+
+    def to_prometheus(self, prefix: str = "dlsim") -> str:
+        s = self.snapshot()
+        out = []
+
+        def family(name, help_text, kind, label, samples):
+            out.append(f"# HELP {prefix}_{name} {help_text}")
+            out.append(f"# TYPE {prefix}_{name} {kind}")
+            for key, value in sorted(samples.items()):
+                out.append(f'{prefix}_{name}{{{label}="{_escape(key)}"}} {value}')
+
+        family("phase_calls_total", "Calls per simulation phase.", "counter", "phase",
+               {k: v["calls"] for k, v in s["phases"].items()})
+        family("phase_seconds_total", "Wall time per simulation phase.", "counter", "phase",
+               {k: v["seconds"] for k, v in s["phases"].items()})
+        family("gate_evals_total", "Gate evaluations per gate type.", "counter", "type", s["gate_evals"])
+        family("graph_walks_total", "Walks over the circuit graph.", "counter", "kind", s["walks"])
+        family("cache_hits_total", "Cache hits.", "counter", "cache",
+               {k: v["hits"] for k, v in s["cache"].items()})
+        family("cache_misses_total", "Cache misses.", "counter", "cache",
+               {k: v["misses"] for k, v in s["cache"].items()})
+        family("evaluations_total", "Circuit evaluations per mode.", "counter", "mode", s["evaluations"])
+        return "\n".join(out) + "\n"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+GLOBAL = Stats()
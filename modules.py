@@ -0,0 +1,116 @@
+"""Hierarchical subcircuits (modules).
+
+A Circuit registered with register_module becomes a gate type: add
+Gate('h1', 'HALF_ADDER') to any circuit, drive its input ports with
+connect(src, 'h1', port) and read an output port with
+connect('h1', dst, pin, src_pin=port). Compiling the parent flattens every
+instance into gates named '<instance>/<gate id>'.
+
+Each module flattens its own circuit once (nested instances included) and
+caches the result as flat arrays, so each instance costs an id prefix and an
+offset copy of those arrays. Registering or removing a module bumps
+sim.MODULE_GENERATION, which makes those caches and every parent circuit's
+compiled form rebuild, so a redefined module takes effect everywhere. Input ports become pass-through gates (OUTPUT
+semantics: the value of pin 'a'), so the flattened circuit evaluates exactly
+like the same logic drawn by hand.
+"""
+from typing import Dict
+
+import sim
+from sim import Circuit, MODULES, GATE_TYPES, base_type, modules_changed
+
+class Module:
+    """A registered subcircuit. `inputs` / `outputs` map port names to gate ids
+    of `circuit`; by default every INPUT gate is an input port and every OUTPUT
+    gate an output port, named after the gate. The circuit's structure is
+    snapshotted on first use."""
+
+    def __init__(self, name: str, circuit: Circuit, inputs=None, outputs=None):
+        self.name = name.upper()
+        self.circuit = circuit
+        if inputs is None:
+            inputs = [gid for gid, g in circuit.gates.items() if base_type(g.type) == "INPUT"]
+        if outputs is None:
+            outputs = [gid for gid, g in circuit.gates.items() if base_type(g.type) == "OUTPUT"]
+        self.inputs = dict(inputs) if isinstance(inputs, dict) else {p: p for p in inputs}
+        self.outputs = dict(outputs) if isinstance(outputs, dict) else {p: p for p in outputs}
+        for gid in list(self.inputs.values()) + list(self.outputs.values()):
+            if gid not in circuit.gates:
+                raise ValueError(f"Gate id not found: {gid}")
+        for port, gid in self.inputs.items():
+            if base_type(circuit.gates[gid].type) != "INPUT":
+                raise ValueError(f"Input port {port} must be an INPUT gate")
+        self._flat = None
+        self._flat_generation = None
+
+    def flat(self):
+        """(ids, types, src, dst, pins, input port index, output port index) of the
+        flattened module, computed once per module generation."""
+        if self._flat is None or self._flat_generation != sim.MODULE_GENERATION:
+            ids, types, src, dst, pins = self.circuit.netlist_arrays()
+            index = {gid: i for i, gid in enumerate(ids)}
+            in_ports = {p: index[gid] for p, gid in self.inputs.items()}
+            out_ports = {p: index[gid] for p, gid in self.outputs.items()}
+            types = list(types)
+            for i in in_ports.values():
+                # same width: "INPUT:8" -> "OUTPUT:8"
+                types[i] = "OUTPUT" + types[i][len("INPUT"):]
+            self._flat = (list(ids), types, list(src), list(dst), list(pins), in_ports, out_ports)
+            self._flat_generation = sim.MODULE_GENERATION
+        return self._flat
+
+def register_module(name: str, circuit: Circuit, inputs=None, outputs=None) -> Module:
+    """Register `circuit` as the gate type `name` and return the Module."""
+    m = Module(name, circuit, inputs, outputs)
+    if m.name in GATE_TYPES:
+        raise ValueError(f"{m.name} is a registered gate type")
+    MODULES[m.name] = m
+    modules_changed()
+    return m
+
+def unregister_module(name: str):
+    if MODULES.pop(name.upper(), None) is not None:
+        modules_changed()
+
+def _port(ports: Dict[str, int], port, inst: str, kind: str) -> int:
+    if port is None and kind == "output" and len(ports) == 1:
+        return next(iter(ports.values()))
+    if port not in ports:
+        raise ValueError(f"Unknown {kind} port {port!r} on instance {inst}")
+    return ports[port]
+
+def flatten(ids, types, src, dst, pins, src_pins):
+    """Expand module instances in flat netlist arrays (see Circuit.netlist_arrays)."""
+    out_ids, out_types, out_src, out_dst, out_pins = [], [], [], [], []
+    base = []
+    for gid, t in zip(ids, types):
+        base.append(len(out_ids))
+        m = MODULES.get(t)
+        if m is None:
+            out_ids.append(gid)
+            out_types.append(t)
+            continue
+        m_ids, m_types, m_src, m_dst, m_pins, _, _ = m.flat()
+        off = len(out_ids)
+        prefix = gid + "/"
+        out_ids.extend([prefix + x for x in m_ids])
+        out_types.extend(m_types)
+        out_src.extend([x + off for x in m_src])
+        out_dst.extend([x + off for x in m_dst])
+        out_pins.extend(m_pins)
+    for s, d, pin, sp in zip(src, dst, pins, src_pins):
+        ms = MODULES.get(types[s])
+        md = MODULES.get(types[d])
+        if ms is not None:
+            s_flat = base[s] + _port(ms.flat()[6], sp, ids[s], "output")
+        else:
+            s_flat = base[s]
+        if md is not None:
+            d_flat = base[d] + _port(md.flat()[5], pin, ids[d], "input")
+            pin = "a"
+        else:
+            d_flat = base[d]
+        out_src.append(s_flat)
+        out_dst.append(d_flat)
+        out_pins.append(pin)
+    return out_ids, out_types, out_src, out_dst, out_pins
@@ -0,0 +1,265 @@
+"""Compact binary netlist format (.dlsn) used by /save and /load.
+
+Layout (little-endian):
+
+    header   32 bytes: magic b"DLSN", version u16, flags u16, gate count u32,
+             edge count u32, body length u32, raw body length u32, 8 reserved
+    body     (zlib-compressed when FLAG_ZLIB is set)
+             type names, pin names   u16 count, then u16 length + UTF-8 each
+             gate ids                u32 length + UTF-8, NUL separated
+             gate type codes         u8  x gates
+             gate values             u8  x gates (INPUT value / DFF state, 0/1)
+             edge src, edge dst      u32 x edges each (gate indices)
+             edge pin codes          u8  x edges
+             positions (FLAG_POS)    f32 x 2 x gates (x, y pairs)
+             bus values (FLAG_WIDE)  u32 count, then per entry u32 gate index,
+                                     u16 length + little-endian unsigned value
+
+Everything after the header is fixed-width arrays, so an uncompressed file is
+memory-mapped and compiled from zero-copy views without building Gate objects.
+The header alone is enough to list a file's gate and edge counts.
+"""
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Any
+
+from sim import Circuit, CompiledCircuit, Gate, base_type, type_width
+
+MAGIC = b"DLSN"
+VERSION = 1
+FLAG_ZLIB = 1
+FLAG_POS = 2
+FLAG_WIDE = 4
+EXT = ".dlsn"
+_HEADER = struct.Struct("<4sHHIIII8x")
+
+class Netlist:
+    """Flat, array-backed netlist: gate ids/types/values plus parallel edge arrays."""
+
+    def __init__(self, ids, types, values, src, dst, pins, positions=None):
+        self.ids = ids              # list of str
+        self.types = types          # list of str, one per gate
+        self.values = values        # sequence of 0/1 (or ints for buses), one per gate
+        self.src = src              # sequence of gate indices
+        self.dst = dst
+        self.pins = pins            # list of str, one per edge
+        self.positions = positions  # optional sequence of x0, y0, x1, y1, ...
+
+    @property
+    def gate_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.src)
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "Netlist":
+        # same shape as the /evaluate and /save payloads
+        nodes = payload.get("nodes", [])
+        ids = [n["id"] for n in nodes]
+        index = {gid: i for i, gid in enumerate(ids)}
+        # an edge repeated between the same gates keeps its first position and last pin, as in Circuit.connect
+        edges = {}
+        for e in payload.get("edges", []):
+            if e["from"] not in index or e["to"] not in index:
+                raise ValueError("Gate id not found")
+            edges[(index[e["from"]], index[e["to"]])] = e.get("pin", "a")
+        inputs = payload.get("inputs", {})
+        positions = None
+        if any("x" in n for n in nodes):
+            positions = []
+            for n in nodes:
+                positions += [float(n.get("x", 0)), float(n.get("y", 0))]
+        return cls(ids, [n["type"].upper() for n in nodes],
+                   [_stored(n.get("value", inputs.get(n["id"]))) for n in nodes],
+                   [s for s, _ in edges], [d for _, d in edges], list(edges.values()), positions)
+
+    def to_payload(self) -> Dict[str, Any]:
+        nodes = []
+        for i, gid in enumerate(self.ids):
+            node = {"id": gid, "type": self.types[i]}
+            if self.values[i]:
+                node["value"] = True if self.values[i] == 1 else int(self.values[i])
+            if self.positions is not None:
+                node["x"] = self.positions[2 * i]
+                node["y"] = self.positions[2 * i + 1]
+            nodes.append(node)
+        edges = [{"from": self.ids[s], "to": self.ids[d], "pin": p}
+                 for s, d, p in zip(self.src, self.dst, self.pins)]
+        return {"nodes": nodes, "edges": edges}
+
+    @classmethod
+    def from_circuit(cls, circuit: Circuit) -> "Netlist":
+        # module instances are saved flattened
+        ids, types, src, dst, pins = circuit.netlist_arrays()
+        positions = []
+        for gid in ids:
+            g = circuit.gates.get(gid)
+            pos = g.position if g is not None else (0, 0)
+            positions += [float(pos[0]), float(pos[1])]
+        return cls(ids, types, [_stored(circuit.gate_value(gid)) for gid in ids], src, dst, pins, positions)
+
+    def to_circuit(self) -> Circuit:
+        c = Circuit()
+        for i, gid in enumerate(self.ids):
+            pos = (self.positions[2 * i], self.positions[2 * i + 1]) if self.positions is not None else (0, 0)
+            g = Gate(gid, self.types[i], position=pos)
+            if self.values[i]:
+                g.value = int(self.values[i]) if type_width(g.type) > 1 else True
+            c.add_gate(g)
+        for s, d, p in zip(self.src, self.dst, self.pins):
+            c.connect(self.ids[s], self.ids[d], p)
+        return c
+
+    def compile(self, sequential: bool = False) -> CompiledCircuit:
+        """Compile straight from the arrays; run() starts from the stored gate values."""
+        return CompiledCircuit.from_arrays(self.ids, self.types, self.src, self.dst, self.pins,
+                                           sequential=sequential, initial=self.values)
+
+def _stored(value) -> int:
+    # stored gate value: 0/1, or the integer itself for a bus
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return 1 if value else 0
+
+def _pack_strings(names) -> bytes:
+    out = [struct.pack("<H", len(names))]
+    for name in names:
+        raw = name.encode("utf-8")
+        out.append(struct.pack("<H", len(raw)) + raw)
+    return b"".join(out)
+
+def _unpack_strings(buf, off: int):
+    (count,) = struct.unpack_from("<H", buf, off)
+    off += 2
+    names = []
+    for _ in range(count):
+        (ln,) = struct.unpack_from("<H", buf, off)
+        names.append(bytes(buf[off + 2:off + 2 + ln]).decode("utf-8"))
+        off += 2 + ln
+    return names, off
+
+def _le(arr: array) -> bytes:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _view(buf, off: int, typecode: str, count: int):
+    size = array(typecode).itemsize * count
+    mv = memoryview(buf)[off:off + size]
+    if sys.byteorder == "little" and (typecode == "B" or off % array(typecode).itemsize == 0):
+        return mv.cast(typecode), off + size
+    arr = array(typecode, bytes(mv))
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr, off + size
+
+def dumps(net: Netlist, compress: bool = True) -> bytes:
+    type_names = sorted(set(net.types))
+    pin_names = sorted(set(net.pins))
+    tcode = {t: i for i, t in enumerate(type_names)}
+    pcode = {p: i for i, p in enumerate(pin_names)}
+    if len(type_names) > 255 or len(pin_names) > 255:
+        raise ValueError("Too many distinct gate types or pins for the binary netlist format")
+    ids = "\0".join(net.ids).encode("utf-8")
+    parts = [_pack_strings(type_names), _pack_strings(pin_names), struct.pack("<I", len(ids)), ids]
+    # pad so the u32 arrays start 4-byte aligned and map as zero-copy views
+    head = sum(len(p) for p in parts) + 2 * len(net.ids)
+    parts.append(b"\0" * (-head % 4))
+    parts += [bytes(tcode[t] for t in net.types), bytes(1 if v else 0 for v in net.values),
+              _le(array("I", net.src)), _le(array("I", net.dst)), bytes(pcode[p] for p in net.pins)]
+    flags = 0
+    if net.positions is not None:
+        parts.append(b"\0" * (-len(net.pins) % 4))
+        parts.append(_le(array("f", net.positions)))
+        flags |= FLAG_POS
+    wide = [(i, v) for i, v in enumerate(net.values) if v > 1]
+    if wide:
+        parts.append(struct.pack("<I", len(wide)))
+        for i, v in wide:
+            raw = int(v).to_bytes((int(v).bit_length() + 7) // 8, "little")
+            parts.append(struct.pack("<IH", i, len(raw)) + raw)
+        flags |= FLAG_WIDE
+    body = b"".join(parts)
+    raw_len = len(body)
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags, net.gate_count, net.edge_count, len(body), raw_len) + body
+
+def loads(buf) -> Netlist:
+    """Parse a binary netlist from a bytes-like object (e.g. an mmap)."""
+    magic, version, flags, n, m, body_len, raw_len = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary netlist")
+    if version != VERSION:
+        raise ValueError(f"Unsupported netlist version {version}")
+    body = memoryview(buf)[_HEADER.size:_HEADER.size + body_len]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    type_names, off = _unpack_strings(body, 0)
+    pin_names, off = _unpack_strings(body, off)
+    (ln,) = struct.unpack_from("<I", body, off)
+    off += 4
+    ids = bytes(body[off:off + ln]).decode("utf-8").split("\0") if n else []
+    off += ln
+    off += -(off + 2 * n) % 4
+    codes, off = _view(body, off, "B", n)
+    values, off = _view(body, off, "B", n)
+    src, off = _view(body, off, "I", m)
+    dst, off = _view(body, off, "I", m)
+    pcodes, off = _view(body, off, "B", m)
+    positions = None
+    if flags & FLAG_POS:
+        off += -m % 4
+        positions, off = _view(body, off, "f", 2 * n)
+    if flags & FLAG_WIDE:
+        values = list(values)
+        (count,) = struct.unpack_from("<I", body, off)
+        off += 4
+        for _ in range(count):
+            i, ln = struct.unpack_from("<IH", body, off)
+            values[i] = int.from_bytes(bytes(body[off + 6:off + 6 + ln]), "little")
+            off += 6 + ln
+    return Netlist(ids, [type_names[c] for c in codes], values, src, dst,
+                   [pin_names[c] for c in pcodes], positions)
+
+def save(path, net: Netlist, compress: bool = True):
+    Path(path).write_bytes(dumps(net, compress=compress))
+
+def load(path) -> Netlist:
+    """Load a binary netlist, memory-mapping the file (array sections of an
+    uncompressed file stay views into the map)."""
+    with open(path, "rb") as f:
+        if f.seek(0, 2) < _HEADER.size:
+            raise ValueError("Not a binary netlist")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return loads(mm)
+
+def read_header(path) -> Dict[str, Any]:
+    """Gate/edge counts and sizes from the fixed header only."""
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ValueError("Not a binary netlist")
+    magic, version, flags, n, m, body_len, raw_len = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("Not a binary netlist")
+    return {"version": version, "gates": n, "edges": m, "compressed": bool(flags & FLAG_ZLIB),
+            "size": _HEADER.size + body_len, "raw_size": _HEADER.size + raw_len}
+
+def evaluate(net: Netlist, inputs: Dict[str, bool] = None) -> Dict[str, bool]:
+    """Evaluate a netlist from its compiled form, with optional INPUT overrides."""
+    cc = net.compile()
+    v = cc.initial + [0]
+    for iid, val in (inputs or {}).items():
+        i = cc.index.get(iid)
+        if i is not None and base_type(cc.types[i]) == "INPUT":
+            v[i] = cc.to_slot(i, val)
+    return cc.values(cc.settle(v))
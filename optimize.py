@@ -0,0 +1,180 @@
+"""Logic optimization for simulation.
+
+optimize(circuit) rebuilds the compiled circuit as a reduced network of
+2-input lookup-table gates, then:
+
+- propagates constants (unconnected pins read False, as in Gate.eval)
+- folds inverters into the gates that read them, so NOT/NAND/NOR chains and
+  double inversions disappear, and OUTPUT buffers collapse into their driver
+- merges structurally identical gates (same function of the same signals,
+  after normalizing pin order and inversions)
+- marks the gates that feed an OUTPUT (or a DFF in sequential mode); only
+  that cone is evaluated for simulation
+
+Every original gate id maps to a signal of the reduced network (possibly
+inverted, or a constant), so values can still be reported for all of them.
+The reduced network is only meant for simulation; it is not a Circuit.
+"""
+import copy
+import statistics
+import time
+from typing import Dict, Any
+
+from sim import Circuit, CompiledCircuit
+
+CONST = -1  # signal node of the constants: (CONST, 0) is False, (CONST, 1) is True
+
+def _var(node: int, f0: int, f1: int):
+    # signal for a function of a single node: f0/f1 are its values for node = 0/1
+    if node == CONST or f0 == f1:
+        return (CONST, f0)
+    return (node, f0)
+
+class OptimizedCircuit:
+    """Reduced, equivalent form of a circuit; see module docstring."""
+
+    def __init__(self, circuit: Circuit, sequential: bool = False):
+        src_cc = circuit.compile(sequential=sequential)
+        if src_cc.wide:
+            raise ValueError("Cannot optimize word-level or multi-input gates")
+        self.sequential = sequential
+        n0 = src_cc.size
+        # reduced network: node -> (id, type, table, a, b); sources keep their gate id and type
+        self._nodes = []
+        self._hash = {}
+        sources = set(src_cc.sources)
+        lits = [None] * (n0 + 1)
+        lits[n0] = (CONST, 0)
+        for i in range(n0):
+            if i in sources:
+                lits[i] = (self._node(src_cc.ids[i], src_cc.types[i], (0, 0, 0, 0), CONST, CONST), 0)
+            else:
+                lits[i] = self._gate(src_cc.tables[i], lits[src_cc.fanin_a[i]], lits[src_cc.fanin_b[i]])
+        # signal of every original gate
+        self.alias = {gid: lits[i] for i, gid in enumerate(src_cc.ids)}
+        roots = [lits[i][0] for i, t in enumerate(src_cc.types) if t == "OUTPUT"]
+        # a DFF captures a plain node: give inverted / constant d signals a gate of their own
+        dff_d = []
+        for d in src_cc.dff_d:
+            node, inv = lits[d]
+            if node == CONST or inv:
+                node = self._node(f"~d{len(self._nodes)}", "LUT",
+                                  (inv, 1 - inv, inv, 1 - inv), node, CONST)
+            dff_d.append(node)
+            roots.append(node)
+        live = [False] * len(self._nodes)
+        stack = [r for r in roots if r != CONST]
+        while stack:
+            k = stack.pop()
+            if live[k]:
+                continue
+            live[k] = True
+            _, _, _, a, b = self._nodes[k]
+            stack.extend(x for x in (a, b) if x != CONST and not live[x])
+        ids, types, tables, src, dst, pins = [], [], [], [], [], []
+        for k, (gid, t, table, a, b) in enumerate(self._nodes):
+            ids.append(gid)
+            types.append(t)
+            tables.append(table)
+            for x, pin in ((a, "a"), (b, "b")):
+                if x != CONST:
+                    src.append(x)
+                    dst.append(k)
+                    pins.append(pin)
+        self.cc = cc = CompiledCircuit.from_arrays(ids, types, src, dst, pins,
+                                                    sequential=sequential, tables=tables)
+        # compiled slot of each reduced node; constants read the constant-False slot
+        slot = [cc.index[gid] for gid in ids]
+        self.alias = {gid: (cc.size if node == CONST else slot[node], inv)
+                      for gid, (node, inv) in self.alias.items()}
+        if sequential:
+            cc.dff_d = [slot[node] for node in dff_d]
+        hot = {slot[k] for k in range(len(self._nodes)) if live[k]}
+        self.program = [p for p in cc.program if p[0] in hot]
+        # compiled view restricted to the hot cone, for its own generated settle function
+        self._hot_cc = copy.copy(cc)
+        self._hot_cc.program = self.program
+        self._hot_cc._settle = None
+        self.source_count = len(cc.sources)
+        self.gate_count = len(cc.program)
+        self.live_gate_count = len(self.program)
+        self.original_count = n0
+        self._outputs = [(gid, *self.alias[gid]) for gid, t in zip(src_cc.ids, src_cc.types) if t == "OUTPUT"]
+
+    def _node(self, gid: str, gtype: str, table, a: int, b: int) -> int:
+        self._nodes.append((gid, gtype, table, a, b))
+        return len(self._nodes) - 1
+
+    def _gate(self, table, la, lb):
+        (na, ia), (nb, ib) = la, lb
+        # absorb input inversions (and constant inputs) into the table
+        t = tuple(table[(x ^ ia) | (y ^ ib) << 1] for x, y in ((0, 0), (1, 0), (0, 1), (1, 1)))
+        if na == CONST:
+            return _var(nb, t[0], t[2])
+        if nb == CONST or na == nb:
+            return _var(na, t[0], t[1] if nb == CONST else t[3])
+        if t[0] == t[2] and t[1] == t[3]:
+            return _var(na, t[0], t[1])
+        if t[0] == t[1] and t[2] == t[3]:
+            return _var(nb, t[0], t[2])
+        if na > nb:
+            na, nb = nb, na
+            t = (t[0], t[2], t[1], t[3])
+        # keep stored functions False at (0, 0); the output inversion moves to readers
+        inv = t[0]
+        if inv:
+            t = tuple(1 - x for x in t)
+        key = (t, na, nb)
+        node = self._hash.get(key)
+        if node is None:
+            node = self._hash[key] = self._node(f"~n{len(self._nodes)}", "LUT", t, na, nb)
+        return (node, inv)
+
+    def evaluate(self, circuit: Circuit = None, full: bool = True) -> Dict[str, bool]:
+        """Evaluate with INPUT values / DFF states taken from `circuit` (the one
+        optimized). With full=False only the cone feeding OUTPUTs (and DFFs) is
+        computed and only the OUTPUT gates' values are returned."""
+        cc = self.cc
+        v = cc.initial + [0]
+        if circuit is not None:
+            for i in cc.sources:
+                v[i] = 1 if circuit.gate_value(cc.ids[i]) else 0
+        (cc if full else self._hot_cc).settle_function()(v)
+        if full:
+            return {gid: bool(v[s] ^ inv) for gid, (s, inv) in self.alias.items()}
+        return {gid: bool(v[s] ^ inv) for gid, s, inv in self._outputs}
+
+def optimize(circuit: Circuit, sequential: bool = False) -> OptimizedCircuit:
+    return OptimizedCircuit(circuit, sequential=sequential)
+
+def report(circuit: Circuit, repeat: int = 10) -> Dict[str, Any]:
+    """Optimize `circuit`, print before/after gate counts and the evaluation
+    speedup, and return them. Both sides time (median per call) a warmed-up settle
+    function on the same source values: the full compiled circuit before,
+    the optimized OUTPUT cone after."""
+    opt = optimize(circuit)
+    src_cc = circuit.compile()
+    before = _time_settle(src_cc.settle_function(), src_cc.load(circuit), repeat)
+    after = _time_settle(opt._hot_cc.settle_function(), opt.cc.load(circuit), repeat)
+    result = {
+        "gates_before": opt.original_count,
+        "gates_after": opt.source_count + opt.gate_count,
+        "gates_live": opt.source_count + opt.live_gate_count,
+        "evaluate_before": before,
+        "evaluate_after": after,
+        "speedup": before / after if after else float("inf"),
+    }
+    print(f"gates: {result['gates_before']} -> {result['gates_after']} "
+          f"({result['gates_live']} feeding outputs); "
+          f"evaluate: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms ({result['speedup']:.1f}x)")
+    return result
+
+def _time_settle(settle, v: list, repeat: int) -> float:
+    # median of `repeat` calls, after one warm-up call
+    settle(v)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        settle(v)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
@@ -0,0 +1,260 @@
+"""Incremental canvas rendering for the Streamlit UI.
+
+CanvasRenderer keeps two images of the visible area between reruns:
+
+- the static layer: every gate body, label and wire, drawn as if all signals
+  were False;
+- the frame: the static layer plus the value colouring of INPUT / OUTPUT
+  gates that are currently True.
+
+Gates and wires are indexed in a grid of `cell`-pixel world tiles. Each
+render() diffs the layout (gate boxes and edges) and the lit gates against
+the previous call. It then redraws only the tiles whose contents changed. A
+tile without lit gates is copied from the static layer; any other tile is
+drawn again with the new colours. Tiles outside the viewport are never
+drawn, and moving the viewport redraws every visible tile.
+"""
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+WHITE = (255, 255, 255, 255)
+_NEUTRAL = (240, 240, 240, 255)
+# fill per value-coloured type: (False / not evaluated, True)
+_FILLS = {
+    "INPUT": ((255, 230, 230, 255), (220, 255, 220, 255)),
+    "OUTPUT": ((240, 240, 255, 255), (200, 200, 255, 255)),
+}
+_WIRE = (60, 60, 60)
+_BLACK = (0, 0, 0)
+
+@lru_cache(maxsize=None)
+def _font():
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", 14)
+    except Exception:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=1)
+def _measure():
+    return ImageDraw.Draw(Image.new("1", (1, 1)))
+
+@lru_cache(maxsize=None)
+def _text_box(text: str):
+    # ink box of `text` drawn at (0, 0)
+    return _measure().multiline_textbbox((0, 0), text, font=_font())
+
+@lru_cache(maxsize=1)
+def _advance() -> float:
+    # widest printable ASCII character, to bound gate labels without measuring each one
+    return max(_font().getlength(chr(c)) for c in range(32, 127))
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def _overlaps(a, b) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+class CanvasRenderer:
+    def __init__(self, width: int = 900, height: int = 600, cell: int = 128):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.viewport = None
+        self._gates = {}   # gid -> (z, type, (x, y, w, h), label, bbox)
+        self._wires = {}   # (src, dst) -> (z, pin, line, label_pos, bbox)
+        self._attached = {}  # gid -> set of wire keys touching it
+        self._grid = {}    # (cx, cy) -> set of item keys: ("g", gid) / ("w", (src, dst))
+        self._lit = set()  # value-coloured gates currently drawn as True
+        self._z = 0
+        self._static = None
+        self._frame = None
+        self.last_regions = 0  # regions redrawn by the last render()
+        self.last_drawn = 0    # items drawn by the last render()
+
+    # --- spatial index ---
+
+    def _cells(self, bbox):
+        c = self.cell
+        for cx in range(int(bbox[0]) // c, int(bbox[2]) // c + 1):
+            for cy in range(int(bbox[1]) // c, int(bbox[3]) // c + 1):
+                yield cx, cy
+
+    def _index(self, key, bbox, add: bool):
+        for cell in self._cells(bbox):
+            if add:
+                self._grid.setdefault(cell, set()).add(key)
+            else:
+                items = self._grid.get(cell)
+                if items is not None:
+                    items.discard(key)
+                    if not items:
+                        del self._grid[cell]
+
+    def _query(self, box):
+        # (gates, wires) intersecting `box`, each in drawing order
+        keys = set()
+        for cell in self._cells(box):
+            keys.update(self._grid.get(cell, ()))
+        gates = [k[1] for k in keys if k[0] == "g" and _overlaps(self._gates[k[1]][4], box)]
+        wires = [k[1] for k in keys if k[0] == "w" and _overlaps(self._wires[k[1]][4], box)]
+        gates.sort(key=lambda g: self._gates[g][0])
+        wires.sort(key=lambda w: self._wires[w][0])
+        return gates, wires
+
+    # --- layout diff ---
+
+    def _gate_item(self, gid, node):
+        x, y, w, h = node["x"], node["y"], node.get("w", 100), node.get("h", 50)
+        label = f"{node['type']}\n{gid[:8]}"
+        # the label starts inside the body; bound its extent from the type line and a two-line height
+        right = x + 6 + max(_text_box(node["type"])[2], len(gid[:8]) * _advance())
+        bottom = y + 6 + _text_box("Ag\nAg")[3]
+        bbox = (x - 1, y - 1, max(x + w, right) + 2, max(y + h, bottom) + 2)
+        return node["type"], (x, y, w, h), label, bbox
+
+    def _wire_item(self, src, dst, pin):
+        s, d = self._gates.get(src), self._gates.get(dst)
+        if s is None or d is None:
+            return None
+        sx, sy, sw, sh = s[2]
+        dx, dy, dw, dh = d[2]
+        line = (sx + sw, sy + sh / 2, dx, dy + dh / 2)
+        pos = ((line[0] + line[2]) / 2, (line[1] + line[3]) / 2 - 10)
+        tb = _text_box(pin)
+        bbox = _union((min(line[0], line[2]) - 2, min(line[1], line[3]) - 2,
+                       max(line[0], line[2]) + 3, max(line[1], line[3]) + 3),
+                      (pos[0] + tb[0], pos[1] + tb[1], pos[0] + tb[2] + 1, pos[1] + tb[3] + 1))
+        return pin, line, pos, bbox
+
+    def _set_wire(self, key, pin, dirty):
+        old = self._wires.pop(key, None)
+        if old is not None:
+            self._index(("w", key), old[4], False)
+            dirty.append(old[4])
+        item = self._wire_item(key[0], key[1], pin) if pin is not None else None
+        if item is None:
+            for gid in key:
+                if gid in self._attached:
+                    self._attached[gid].discard(key)
+            return
+        z = old[0] if old is not None else self._next_z()
+        self._wires[key] = (z,) + item
+        self._index(("w", key), item[3], True)
+        dirty.append(item[3])
+        for gid in key:
+            self._attached.setdefault(gid, set()).add(key)
+
+    def _next_z(self) -> int:
+        self._z += 1
+        return self._z
+
+    def _update_layout(self, nodes, edges, dirty):
+        moved = []
+        for gid in [g for g in self._gates if g not in nodes]:
+            old = self._gates.pop(gid)
+            self._index(("g", gid), old[4], False)
+            dirty.append(old[4])
+            moved.append(gid)
+        for gid, node in nodes.items():
+            old = self._gates.get(gid)
+            if old is not None and old[1] == node["type"] and old[2] == (
+                    node["x"], node["y"], node.get("w", 100), node.get("h", 50)):
+                continue
+            item = self._gate_item(gid, node)
+            if old is not None:
+                self._index(("g", gid), old[4], False)
+                dirty.append(old[4])
+            self._gates[gid] = (old[0] if old is not None else self._next_z(),) + item
+            self._index(("g", gid), item[3], True)
+            dirty.append(item[3])
+            moved.append(gid)
+        wanted = {(s, d): pin for s, d, pin in edges}
+        for key in [k for k in self._wires if k not in wanted]:
+            self._set_wire(key, None, dirty)
+        done = set()
+        for key, pin in wanted.items():
+            old = self._wires.get(key)
+            if old is None or old[1] != pin:
+                self._set_wire(key, pin, dirty)
+                done.add(key)
+        for gid in moved:
+            for key in list(self._attached.get(gid, ())):
+                if key in wanted and key not in done:
+                    self._set_wire(key, wanted[key], dirty)
+                    done.add(key)
+            if gid not in self._gates:
+                self._attached.pop(gid, None)
+
+    # --- drawing ---
+
+    def _draw(self, box, lit):
+        # image of world region `box` with everything in it, gates first then wires
+        ox, oy = box[0], box[1]
+        img = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), WHITE)
+        draw = ImageDraw.Draw(img)
+        font = _font()
+        gates, wires = self._query(box)
+        for gid in gates:
+            _, t, (x, y, w, h), label, _ = self._gates[gid]
+            fills = _FILLS.get(t)
+            fill = fills[gid in lit] if fills else _NEUTRAL
+            draw.rectangle([x - ox, y - oy, x + w - ox, y + h - oy], fill=fill, outline=_BLACK)
+            draw.text((x + 6 - ox, y + 6 - oy), label, font=font, fill=_BLACK)
+        for key in wires:
+            _, pin, (sx, sy, dx, dy), (px, py), _ = self._wires[key]
+            draw.line((sx - ox, sy - oy, dx - ox, dy - oy), fill=_WIRE, width=3)
+            draw.text((px - ox, py - oy), pin, font=font, fill=_BLACK)
+        self.last_drawn += len(gates) + len(wires)
+        return img
+
+    def _tile(self, cell):
+        c = self.cell
+        return (cell[0] * c, cell[1] * c, cell[0] * c + c, cell[1] * c + c)
+
+    def _redraw(self, cell, static: bool):
+        # tiles are fixed world cells, so a tile redrawn alone matches a full render exactly
+        box = self._tile(cell)
+        at = (box[0] - self.viewport[0], box[1] - self.viewport[1])
+        if static:
+            self._static.paste(self._draw(box, ()), at)
+        gates = self._query(box)[0] if self._lit else ()
+        if any(g in self._lit for g in gates):
+            self._frame.paste(self._draw(box, self._lit), at)
+        else:
+            self._frame.paste(self._static.crop(at + (at[0] + self.cell, at[1] + self.cell)), at)
+        self.last_regions += 1
+
+    def render(self, nodes, edges, values=None, viewport=(0, 0)):
+        """The frame for `nodes` ({gid: {type, x, y, w?, h?}}), `edges` ((src, dst, pin)
+        triples) and gate `values`, with the world point `viewport` at the top left.
+        The returned image is reused, and updated in place, by the next call."""
+        self.last_regions = self.last_drawn = 0
+        dirty = []
+        self._update_layout(nodes, edges, dirty)
+        values = values or {}
+        lit = {gid for gid, g in self._gates.items() if g[1] in _FILLS and values.get(gid)}
+        changed = lit ^ self._lit
+        self._lit = lit
+        vx, vy = viewport
+        visible = set(self._cells((vx, vy, vx + self.width - 1, vy + self.height - 1)))
+        if self._frame is None or tuple(viewport) != self.viewport:
+            self.viewport = tuple(viewport)
+            self._static = Image.new("RGBA", (self.width, self.height), WHITE)
+            self._frame = Image.new("RGBA", (self.width, self.height), WHITE)
+            for cell in visible:
+                self._redraw(cell, static=True)
+            return self._frame
+        layout = set()
+        for box in dirty:
+            layout.update(self._cells(box))
+        layout &= visible
+        coloured = set()
+        for gid in changed & self._gates.keys():
+            coloured.update(self._cells(self._gates[gid][4]))
+        coloured &= visible
+        for cell in layout:
+            self._redraw(cell, static=True)
+        for cell in coloured - layout:
+            self._redraw(cell, static=False)
+        return self._frame
@@ -0,0 +1,112 @@
+"""Server-side circuit sessions for the FastAPI backend.
+
+A client uploads a netlist once and gets a session id; later requests post
+only input deltas, which are evaluated incrementally against the cached,
+compiled circuit. Sessions are evicted least-recently-used first when the
+store exceeds its memory budget, and after `ttl` seconds without use.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from sim import Circuit
+
+# Rough resident cost of a gate / edge in a Circuit, including its compiled
+# form and incremental-evaluation state (measured with tracemalloc).
+BYTES_PER_GATE = 800
+BYTES_PER_EDGE = 400
+
+def estimate_bytes(circuit: Circuit, trace=None) -> int:
+    # `trace`: the session's waveform.Trace, if any
+    n = len(circuit.gates) * BYTES_PER_GATE + circuit.number_of_edges() * BYTES_PER_EDGE
+    return n + (trace.nbytes if trace is not None else 0)
+
+class Session:
+    def __init__(self, sid: str, circuit: Circuit):
+        self.id = sid
+        self.circuit = circuit
+        self.size = estimate_bytes(circuit)
+        self.last_used = time.monotonic()
+        # waveform.Trace recorded through /sessions/{id}/trace, if any
+        self.trace = None
+        # held while a request evaluates or records the session
+        self.lock = threading.Lock()
+
+class SessionStore:
+    """LRU + TTL cache of Sessions bounded by an estimated memory budget."""
+
+    def __init__(self, max_bytes: int = None, ttl: float = None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('DLSIM_SESSION_MAX_BYTES', 512 * 1024 * 1024))
+        if ttl is None:
+            ttl = float(os.environ.get('DLSIM_SESSION_TTL', 1800))
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _drop(self, sid: str):
+        s = self._sessions.pop(sid)
+        self.total_bytes -= s.size
+
+    def _expire(self, now: float):
+        # the dict is in LRU order, so expired sessions are at the front
+        while self._sessions:
+            sid, s = next(iter(self._sessions.items()))
+            if now - s.last_used <= self.ttl:
+                break
+            self._drop(sid)
+
+    def create(self, circuit: Circuit) -> Session:
+        """Register a circuit and return its new session, evicting old ones to make room."""
+        s = Session(uuid.uuid4().hex, circuit)
+        if s.size > self.max_bytes:
+            raise MemoryError(f'Circuit needs ~{s.size} bytes, over the session budget of {self.max_bytes}')
+        with self._lock:
+            self._expire(time.monotonic())
+            while self._sessions and self.total_bytes + s.size > self.max_bytes:
+                self._drop(next(iter(self._sessions)))
+            self._sessions[s.id] = s
+            self.total_bytes += s.size
+        return s
+
+    def get(self, sid: str) -> Optional[Session]:
+        """Return the live session `sid` (marking it most recently used), or None."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            s = self._sessions.get(sid)
+            if s is not None:
+                s.last_used = now
+                self._sessions.move_to_end(sid)
+            return s
+
+    def resize(self, s: Session):
+        """Re-estimate `s` (e.g. after its trace grew), evicting other sessions
+        least-recently-used first to stay within the budget."""
+        size = estimate_bytes(s.circuit, s.trace)
+        with self._lock:
+            if self._sessions.get(s.id) is not s:
+                s.size = size
+                return
+            self.total_bytes += size - s.size
+            s.size = size
+            for sid in list(self._sessions):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if sid != s.id:
+                    self._drop(sid)
+
+    def delete(self, sid: str) -> bool:
+        with self._lock:
+            if sid not in self._sessions:
+                return False
+            self._drop(sid)
+            return True
@@ -1,107 +1,1280 @@
 from typing import Dict, Any
+import heapq
+import sys
 import networkx as nx
 
+def _bitwise_from_table(table):
+    t0, t1, t2, t3 = table
+    def op(a, b, m):
+        na = m ^ a
+        nb = m ^ b
+        r = 0
+        if t0: r |= na & nb
+        if t1: r |= a & nb
+        if t2: r |= na & b
+        if t3: r |= a & b
+        return r
+    return op
+
+# Word-level equivalents of the common truth tables; `m` is the all-ones mask
+# for the batch width. Anything else falls back to a sum of minterms.
+_BITWISE = {
+    (0, 0, 0, 0): lambda a, b, m: 0,
+    (0, 1, 0, 1): lambda a, b, m: a,
+    (1, 0, 1, 0): lambda a, b, m: m ^ a,
+    (0, 0, 0, 1): lambda a, b, m: a & b,
+    (0, 1, 1, 1): lambda a, b, m: a | b,
+    (1, 1, 1, 0): lambda a, b, m: m ^ (a & b),
+    (1, 0, 0, 0): lambda a, b, m: m ^ (a | b),
+    (0, 1, 1, 0): lambda a, b, m: a ^ b,
+}
+# registered gate types add their own function for any other table (see _define)
+
+def bitwise_op(table):
+    """Word-level function (a, b, mask) -> int computing `table` on every bit position."""
+    op = _BITWISE.get(table)
+    if op is None:
+        op = _BITWISE[table] = _bitwise_from_table(table)
+    return op
+
+# Straight-line expressions for the common truth tables, used when generating
+# the settle function for multi-cycle runs.
+_EXPR = {
+    (0, 0, 0, 0): "0",
+    (0, 1, 0, 1): "v[{a}]",
+    (1, 0, 1, 0): "1 ^ v[{a}]",
+    (0, 0, 0, 1): "v[{a}] & v[{b}]",
+    (0, 1, 1, 1): "v[{a}] | v[{b}]",
+    (1, 1, 1, 0): "1 ^ (v[{a}] & v[{b}])",
+    (1, 0, 0, 0): "1 ^ (v[{a}] | v[{b}])",
+    (0, 1, 1, 0): "v[{a}] ^ v[{b}]",
+    (1, 0, 0, 1): "1 ^ v[{a}] ^ v[{b}]",
+    # the rest of the 16 tables, mostly produced by the optimizer's inversion folding
+    (1, 1, 1, 1): "1",
+    (0, 0, 1, 1): "v[{b}]",
+    (1, 1, 0, 0): "1 ^ v[{b}]",
+    (0, 1, 0, 0): "v[{a}] & ~v[{b}]",
+    (0, 0, 1, 0): "v[{b}] & ~v[{a}]",
+    (1, 0, 1, 1): "1 ^ (v[{a}] & ~v[{b}])",
+    (1, 1, 0, 1): "1 ^ (v[{b}] & ~v[{a}])",
+}
+_CHUNK = 4096
+
+MAX_TABLE_PINS = 8
+
+class GateType:
+    """A gate type: its input pins and a vectorizable evaluation function.
+
+    fn(*pin_values, m) -> int gets one int per pin, in `pins` order, and
+    computes the gate on every bit position at once; m is the all-ones mask
+    of the word (1 for a single evaluation, 2**k - 1 for k packed vectors).
+    `table` is the truth table over the pins, indexed by the sum of
+    pin_k << k (padded to the four (a, b) entries below two pins; None above
+    MAX_TABLE_PINS pins and for word-level types). `opcode` indexes OPCODES."""
+    __slots__ = ("name", "opcode", "pins", "fn", "table", "source", "word")
+
+    def __init__(self, name, opcode, pins, fn, table, source=False, word=False):
+        self.name = name
+        self.opcode = opcode
+        self.pins = pins
+        self.fn = fn
+        self.table = table
+        self.source = source
+        self.word = word
+
+    def __repr__(self):
+        return f"GateType({self.name!r}, pins={self.pins!r})"
+
+# Gate types by name and by opcode; see register_gate_type.
+GATE_TYPES = {}
+OPCODES = []
+
+def _table_of(pins, fn):
+    k = len(pins)
+    if fn is None:
+        return (0, 0, 0, 0)
+    if k > MAX_TABLE_PINS:
+        return None
+    return tuple(fn(*[idx >> j & 1 for j in range(k)], 1) & 1 for idx in range(max(4, 1 << k)))
+
+def _define(name, pins, fn, source=False) -> GateType:
+    op = GATE_TYPES.get(name)
+    opcode = op.opcode if op is not None else len(OPCODES)
+    op = GateType(name, opcode, tuple(sys.intern(p) for p in pins), fn, _table_of(pins, fn), source)
+    GATE_TYPES[name] = op
+    if opcode == len(OPCODES):
+        OPCODES.append(op)
+    else:
+        OPCODES[opcode] = op
+    if len(pins) <= 2 and op.table not in _BITWISE:
+        _BITWISE[op.table] = (lambda a, b, m: fn(a, b, m)) if len(pins) == 2 else \
+                             (lambda a, b, m: fn(a, m)) if pins else (lambda a, b, m: fn(m))
+    return op
+
+def register_gate_type(name: str, pins, fn) -> GateType:
+    """Add a bit-level gate type, for example a 2:1 multiplexer:
+
+        register_gate_type("MUX2", ("a", "b", "s"), lambda a, b, s, m: a & (m ^ s) | b & s)
+
+    `fn` must work bitwise on packed words (see GateType). Gates of the type
+    compile to the same table lookups as the built-in types: one over (a, b)
+    for up to two pins, one over all pins for wider types. Register a type
+    before creating gates of it. Types cannot be redefined: existing gates
+    and compiled circuits keep the function they were built with."""
+    name = name.upper()
+    pins = tuple(pins)
+    if name in BUILTIN_TYPES:
+        raise ValueError(f"{name} is a built-in gate type")
+    if name in GATE_TYPES:
+        raise ValueError(f"{name} is already a registered gate type")
+    if name in MODULES:
+        raise ValueError(f"{name} is a registered module")
+    if not name or ":" in name:
+        raise ValueError(f"Invalid gate type name: {name!r}")
+    if len(set(pins)) != len(pins):
+        raise ValueError(f"Duplicate pin names for {name}: {pins}")
+    return _define(name, pins, fn)
+
+_define("INPUT", (), None, source=True)
+_define("OUTPUT", ("a",), lambda a, m: a)
+_define("DFF", (), lambda m: 0)  # outside sequential compiles a DFF reads as False
+_define("NOT", ("a",), lambda a, m: m ^ a)
+_define("AND", ("a", "b"), lambda a, b, m: a & b)
+_define("OR", ("a", "b"), lambda a, b, m: a | b)
+_define("NAND", ("a", "b"), lambda a, b, m: m ^ (a & b))
+_define("NOR", ("a", "b"), lambda a, b, m: m ^ (a | b))
+_define("XOR", ("a", "b"), lambda a, b, m: a ^ b)
+BUILTIN_TYPES = frozenset(GATE_TYPES)
+
+_UNKNOWN = GateType("?", None, (), None, (0, 0, 0, 0))
+_WORD_GATE_TYPES = {}
+
+def gate_type(name: str) -> GateType:
+    """The GateType of a (normalized) type name. Word-level names such as
+    "ADD:8" get one on first use; unknown names share a pinless type that
+    always evaluates to False."""
+    op = GATE_TYPES.get(name)
+    if op is None:
+        op = _WORD_GATE_TYPES.get(name)
+        if op is None:
+            if not word_type(name):
+                return _UNKNOWN
+            op = _WORD_GATE_TYPES[name] = GateType(name, None, word_pins(name), None, None,
+                                                   source=base_type(name) == "INPUT", word=True)
+    return op
+
 class Gate:
+    __slots__ = ("id", "type", "op", "value", "position")
+
     def __init__(self, id: str, type: str, position=(0,0)):
         self.id = id
-        self.type = type.upper()
-        self.inputs = []
+        self.type = sys.intern(type.upper())
+        self.op = gate_type(self.type)
         self.value = None
         self.position = position
-        if self.type == "NOT":
-            self.inputs = ["a"]
-        elif self.type in ("AND", "OR", "NAND", "NOR", "XOR"):
-            self.inputs = ["a","b"]
-        elif self.type == "INPUT":
-            self.inputs = []
-        elif self.type == "OUTPUT":
-            self.inputs = ["a"]
-        else:
-            self.inputs = []
+
+    @property
+    def inputs(self) -> tuple:
+        return self.op.pins
 
     def eval(self, input_values: Dict[str, bool]) -> bool:
-        t = self.type
-        if t == "INPUT":
+        op = self.op
+        if op.source:
+            if op.word:
+                return int(self.value or 0) & ((1 << type_width(self.type)) - 1)
             return bool(self.value)
-        if t == "OUTPUT":
-            return bool(input_values.get("a", False))
-        a = bool(input_values.get("a", False))
-        b = bool(input_values.get("b", False))
-        if t == "AND":
-            return a and b
-        if t == "OR":
-            return a or b
-        if t == "NAND":
-            return not (a and b)
-        if t == "NOR":
-            return not (a or b)
-        if t == "XOR":
-            return a ^ b
-        if t == "NOT":
-            return not a
-        return False
+        if op.word:
+            return word_function(self.type)(input_values)
+        if op.table is None:
+            return bool(op.fn(*[1 if input_values.get(p, False) else 0 for p in op.pins], 1) & 1)
+        idx = 0
+        bit = 1
+        for p in op.pins:
+            if input_values.get(p, False):
+                idx |= bit
+            bit <<= 1
+        return bool(op.table[idx])
+
+def truth_table(name: str):
+    """Truth table of a gate type from its GateType: over the (a, b) pins,
+    indexed by a | b << 1, for types with up to two pins."""
+    return gate_type(name.upper()).table
+
+# Word-level gates: a gate type with a numeric suffix carries unsigned integer
+# signals instead of bits, so "AND:8" is an 8-bit bitwise AND, "INPUT:16" a
+# 16-bit bus input and "DFF:32" a 32-bit register, each one integer operation.
+# SPLIT:k reads bit k of a bus; MERGE:n packs its one-bit pins "0".."n-1" into
+# an n-bit bus. Per op: input pins, output width (None: the suffix) and the
+# expression, where {m} is the all-ones mask of the suffix width and {k} the suffix.
+_WORD_OPS = {
+    "INPUT": ((), None, None),
+    "DFF": (("d",), None, "0"),
+    "OUTPUT": (("a",), None, "{a}"),
+    "NOT": (("a",), None, "{m} ^ {a}"),
+    "AND": (("a", "b"), None, "{a} & {b}"),
+    "OR": (("a", "b"), None, "{a} | {b}"),
+    "XOR": (("a", "b"), None, "{a} ^ {b}"),
+    "NAND": (("a", "b"), None, "{m} ^ ({a} & {b})"),
+    "NOR": (("a", "b"), None, "{m} ^ ({a} | {b})"),
+    "ADD": (("a", "b", "c"), None, "({a} + {b} + {c}) & {m}"),
+    "MUX": (("a", "b", "s"), None, "({b} if {s} else {a})"),
+    "EQ": (("a", "b"), 1, "int({a} == {b})"),
+    "LT": (("a", "b"), 1, "int({a} < {b})"),
+    "SPLIT": (("a",), 1, "({a} >> {k} & 1)"),
+    "MERGE": (None, None, None),
+}
+# pins that take a single bit whatever the gate's width (ADD carry in, MUX select)
+_BIT_PINS = {"ADD": ("c",), "MUX": ("s",)}
+_WORD_TYPES = {}
+_WORD_PINS = {}
+_WORD_FUNCS = {}
+
+def word_type(gate_type: str):
+    """(op, k) for a word-level gate type such as "ADD:8", else None."""
+    info = _WORD_TYPES.get(gate_type, False)
+    if info is False:
+        op, sep, k = gate_type.partition(":")
+        info = None
+        if sep and op in _WORD_OPS and k.isdigit() and (int(k) > 0 or op == "SPLIT"):
+            info = (op, int(k))
+        _WORD_TYPES[gate_type] = info
+    return info
+
+def base_type(gate_type: str) -> str:
+    """Gate type without its width: "DFF:8" -> "DFF"."""
+    info = word_type(gate_type)
+    return info[0] if info else gate_type
+
+def type_width(gate_type: str) -> int:
+    """Width in bits of a gate type's output."""
+    info = word_type(gate_type)
+    if info is None:
+        return 1
+    out = _WORD_OPS[info[0]][1]
+    return info[1] if out is None else out
+
+def word_pins(gate_type: str) -> tuple:
+    pins = _WORD_PINS.get(gate_type)
+    if pins is None:
+        op, k = word_type(gate_type)
+        pins = tuple(str(j) for j in range(k)) if op == "MERGE" else _WORD_OPS[op][0]
+        _WORD_PINS[gate_type] = pins
+    return pins
+
+def pin_width(gate_type: str, pin: str):
+    """Width pin `pin` of `gate_type` takes (None: any). Raises ValueError for a
+    pin a word-level gate does not have."""
+    info = word_type(gate_type)
+    if info is None:
+        return 1
+    op, k = info
+    if pin not in word_pins(gate_type):
+        raise ValueError(f"{gate_type} has no pin {pin!r}")
+    if op == "SPLIT":
+        return None
+    if op == "MERGE" or pin in _BIT_PINS.get(op, ()):
+        return 1
+    return k
+
+def word_expr(gate_type: str, ref) -> str:
+    """Python expression for a word-level gate; ref(pin) gives the code reading a pin."""
+    op, k = word_type(gate_type)
+    if op == "MERGE":
+        return " | ".join(f"{ref(str(j))} << {j}" for j in range(k))
+    return _WORD_OPS[op][2].format(m=(1 << k) - 1, k=k, **{p: ref(p) for p in word_pins(gate_type)})
+
+def word_function(gate_type: str):
+    """Function {pin: int} -> int evaluating a word-level gate type."""
+    fn = _WORD_FUNCS.get(gate_type)
+    if fn is None:
+        fn = _WORD_FUNCS[gate_type] = eval("lambda p: " + word_expr(gate_type, lambda pin: f"p.get({pin!r}, 0)"))
+    return fn
+
+def unpack_word(word: int, width: int) -> list:
+    """Bits 0..width-1 of a packed batch word as a list of bools."""
+    if not width:
+        return []
+    return [c == "1" for c in format(word, "b").zfill(width)[::-1][:width]]
+
+MAX_REPORTED_CYCLES = 3
+_MAX_CYCLE_IDS = 16
+
+class CycleError(RuntimeError):
+    """Combinational cycle found while compiling. `cycles` holds up to
+    MAX_REPORTED_CYCLES cycles (gate id lists), one per strongly connected
+    component; `components` counts every cyclic component. Circuit.connect
+    raises it with `edge` set to the (src, dst) pair it refused to add."""
+
+    def __init__(self, cycles, components: int, edge=None):
+        self.cycles = cycles
+        self.components = components
+        shown = [c if len(c) <= _MAX_CYCLE_IDS else c[:_MAX_CYCLE_IDS] + ["..."] for c in cycles]
+        if edge is not None:
+            super().__init__(f"Connecting {edge[0]} -> {edge[1]} would create a cycle: {shown[0]}")
+            return
+        more = components - len(cycles)
+        super().__init__(f"Cycle detected in circuit: {shown}"
+                         + (f" (+{more} more cyclic components)" if more > 0 else ""))
+
+def cyclic_components(nodes, succ) -> list:
+    """Strongly connected components of the subgraph induced by `nodes` (gate
+    indices; `succ` is the per-gate successor list) that contain a cycle, in
+    discovery order. Iterative Tarjan, linear in the size of the subgraph."""
+    member = set(nodes)
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    comps = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succ[root]))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w not in member:
+                    continue
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(succ[w])))
+                    break
+                if w in on_stack and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+                if low[v] == index[v]:
+                    comp = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        comp.append(w)
+                        if w == v:
+                            break
+                    if len(comp) > 1 or v in succ[v]:
+                        comps.append(comp)
+    return comps
+
+def shortest_cycle(comp, succ) -> list:
+    """Shortest cycle through the lowest-numbered gate of a cyclic strongly
+    connected component, found by a breadth-first search inside it."""
+    member = set(comp)
+    root = min(comp)
+    parent = {root: None}
+    frontier = [root]
+    while frontier:
+        nxt = []
+        for v in frontier:
+            for w in succ[v]:
+                if w == root:
+                    cycle = []
+                    while v is not None:
+                        cycle.append(v)
+                        v = parent[v]
+                    return cycle[::-1]
+                if w in member and w not in parent:
+                    parent[w] = v
+                    nxt.append(w)
+        frontier = nxt
+    return [root]
+
+def levelize(ids, types, src, dst, sequential: bool = False):
+    """(order, level) of a flat netlist: gate indices in topological order and
+    each gate's level (longest path from a source), by Kahn's algorithm in
+    rounds. Edges into DFFs are always cut: a DFF's output never depends
+    combinationally on its input, whether it holds a state (`sequential`) or
+    reads as False. Raises CycleError."""
+    n = len(ids)
+    succ = [[] for _ in range(n)]
+    indeg = [0] * n
+    dffs = {t for t in set(types) if base_type(t) == "DFF"} if types is not None else ()
+    for s, d in zip(src, dst):
+        if dffs and types[d] in dffs:
+            continue
+        succ[s].append(d)
+        indeg[d] += 1
+    level = [0] * n
+    order = [i for i in range(n) if indeg[i] == 0]
+    frontier = order
+    depth = 0
+    while frontier:
+        depth += 1
+        nxt = []
+        for i in frontier:
+            for d in succ[i]:
+                indeg[d] -= 1
+                if indeg[d] == 0:
+                    level[d] = depth
+                    nxt.append(d)
+        order.extend(nxt)
+        frontier = nxt
+    if len(order) < n:
+        # everything Kahn's algorithm could not reach is on or downstream of a cycle
+        comps = cyclic_components([i for i in range(n) if indeg[i]], succ)
+        cycles = [[ids[i] for i in shortest_cycle(c, succ)] for c in comps[:MAX_REPORTED_CYCLES]]
+        raise CycleError(cycles, len(comps))
+    return order, level
+
+class CompiledCircuit:
+    """Flat, integer-indexed, levelized form of a Circuit.
+
+    Gates are numbered 0..n-1 in topological order (`levels` holds each
+    gate's level, its longest path from a source). Every gate has
+    two fan-in slots (its first two pins, 'a' and 'b' for the built-in
+    types); an unconnected slot points at the constant-False slot n.
+    Evaluation is a single pass over `program` doing a truth-table lookup per
+    gate. Gates with more pins (word-level types, registered types such as a
+    3-input AND) read them through `wide` instead.
+
+    The graph is always cut at DFF inputs, so feedback through a DFF is legal.
+    With `sequential=True` a DFF is a source whose slot holds its stored state
+    (Q), and `dff_d` gives the slot its 'd' pin captures on a clock edge;
+    otherwise a DFF reads as False."""
+
+    def __init__(self, circuit: "Circuit" = None, sequential: bool = False, stats=None):
+        if circuit is None:
+            return  # filled in by from_arrays
+        if stats is None:
+            arrays = circuit.netlist_arrays()
+            self._build(*arrays, sequential, topo=circuit.topology(arrays[0], arrays[1], sequential))
+            return
+        with stats.phase("netlist"):
+            arrays = circuit.netlist_arrays()
+        stats.walk("netlist")
+        with stats.phase("levelize"):
+            self._build(*arrays, sequential, topo=circuit.topology(arrays[0], arrays[1], sequential))
+        stats.walk("levelize")
+
+    @classmethod
+    def from_arrays(cls, ids, types, src, dst, pins, sequential: bool = False, initial=None,
+                    tables=None) -> "CompiledCircuit":
+        """Compile straight from flat netlist arrays (gate ids and type names,
+        parallel edge arrays of gate indices and pin names) without building a
+        Circuit. `initial` gives per-gate INPUT values / DFF states used by run();
+        `tables` overrides the per-gate truth tables derived from the type names."""
+        cc = cls()
+        cc._build(ids, types, src, dst, pins, sequential, initial, tables)
+        return cc
+
+    def _build(self, ids, types, src, dst, pins, sequential, initial=None, tables=None, topo=None):
+        n = len(ids)
+        self.sequential = sequential
+        if topo is None:
+            order, level = levelize(ids, types, src, dst, sequential)
+        else:
+            order, level = topo
+        pos = [0] * n
+        for new, old in enumerate(order):
+            pos[old] = new
+        self.ids = [ids[i] for i in order]
+        self.index = {gid: i for i, gid in enumerate(self.ids)}
+        self.size = n
+        self.types = [types[i] for i in order]
+        self.levels = [level[i] for i in order]
+        kinds = {t: base_type(t) for t in set(self.types)}
+        ops = {t: gate_type(t) for t in kinds}
+        word_types = {t for t, op in ops.items() if op.word}
+        wide_types = {t for t, op in ops.items() if op.word or len(op.pins) > 2}
+        self.fanin_a = [n] * n
+        self.fanin_b = [n] * n
+        fanin_d = [n] * n
+        # pins read through fanin_a / fanin_b, per type
+        ab = {t: (op.pins + (None, None))[:2] for t, op in ops.items() if t not in wide_types}
+        if all(p in (("a", "b"), ("a", None), (None, None)) for p in ab.values()):
+            for s, d, pin in zip(src, dst, pins):
+                if pin == "a":
+                    self.fanin_a[pos[d]] = pos[s]
+                elif pin == "b":
+                    self.fanin_b[pos[d]] = pos[s]
+                elif pin == "d":
+                    fanin_d[pos[d]] = pos[s]
+        else:
+            for s, d, pin in zip(src, dst, pins):
+                pa, pb = ab.get(types[d], (None, None))
+                if pin == pa:
+                    self.fanin_a[pos[d]] = pos[s]
+                elif pin == pb:
+                    self.fanin_b[pos[d]] = pos[s]
+                elif pin == "d":
+                    fanin_d[pos[d]] = pos[s]
+        self.states = [i for i, t in enumerate(self.types) if kinds[t] == "DFF"] if sequential else []
+        self.dff_d = [fanin_d[i] for i in self.states]
+        if tables is not None:
+            self.tables = [tuple(tables[i]) for i in order]
+        else:
+            self.tables = [None if t in wide_types else ops[t].table for t in self.types]
+        self.inputs = [i for i, t in enumerate(self.types) if kinds[t] == "INPUT"]
+        # wide gates: slot -> {pin: fan-in slot}; with word-level gates also the width of every slot
+        self.wide = {}
+        self.widths = None
+        if wide_types:
+            self._build_wide(ids, src, dst, pins, pos, wide_types, word_types)
+        if initial is None:
+            self.initial = [0] * n
+        else:
+            self.initial = [self.to_slot(new, initial[old]) for new, old in enumerate(order)]
+        self.sources = self.inputs + self.states
+        srcs = set(self.sources)
+        self.program = [(i, self.tables[i], self.fanin_a[i], self.fanin_b[i])
+                        for i in range(n) if i not in srcs]
+        self._batch_program = None
+        self._fanout = None
+        self._settle = None
+        self._type_counts = None
+        self._wide_fns = None
+
+    def _build_wide(self, ids, src, dst, pins, pos, wide_types, word_types):
+        types = self.types
+        widths = None
+        if word_types:
+            self.widths = widths = [type_width(t) for t in types]
+        wide = self.wide = {i: {} for i, t in enumerate(types) if t in wide_types}
+        for s, d, pin in zip(src, dst, pins):
+            ps, pd = pos[s], pos[d]
+            if widths is not None:
+                want = pin_width(types[pd], pin)
+                if want is not None and widths[ps] != want:
+                    raise ValueError(f"Width mismatch: {ids[s]} is {widths[ps]} bits wide, "
+                                     f"pin {pin!r} of {ids[d]} takes {want}")
+            if pd in wide:
+                wide[pd][pin] = ps
+
+    def __getstate__(self):
+        # derived caches hold generated functions/lambdas; rebuild them after unpickling
+        state = self.__dict__.copy()
+        state.update(_batch_program=None, _fanout=None, _settle=None, _wide_fns=None)
+        return state
+
+    def to_slot(self, i: int, value) -> int:
+        """Slot encoding of a stored value for slot `i`: 0/1, or a masked integer
+        for word-level slots."""
+        if self.widths is None or self.widths[i] == 1:
+            return 1 if value else 0
+        return int(value) & ((1 << self.widths[i]) - 1) if value else 0
+
+    def from_slot(self, i: int, x: int):
+        """Value of slot `i` as reported to callers: bool, or int for buses."""
+        if self.widths is None or self.widths[i] == 1:
+            return bool(x)
+        return x
+
+    def run(self, circuit: "Circuit" = None) -> list:
+        """Evaluate and return the value slots (0/1 ints, plus the trailing constant slot).
+        Sources take their values from `circuit`'s gates, or from `initial` without one."""
+        return self.settle(self.load(circuit))
+
+    def load(self, circuit: "Circuit" = None) -> list:
+        """Fresh value slots with only the sources filled in (see run())."""
+        v = self.initial + [0]
+        if circuit is not None:
+            ids = self.ids
+            if self.widths is not None:
+                for i in self.sources:
+                    v[i] = self.to_slot(i, circuit.gate_value(ids[i]))
+            else:
+                for i in self.sources:
+                    v[i] = 1 if circuit.gate_value(ids[i]) else 0
+        return v
+
+    def settle(self, v: list) -> list:
+        """Recompute every non-source slot of `v` from the source slots."""
+        if self.wide:
+            return self.settle_function()(v)
+        for i, table, a, b in self.program:
+            v[i] = table[v[a] | v[b] << 1]
+        return v
+
+    def clock(self, v: list):
+        """Clock edge: every DFF slot captures its 'd' slot, all at once."""
+        nxt = [v[d] for d in self.dff_d]
+        for i, q in zip(self.states, nxt):
+            v[i] = q
+
+    def settle_function(self):
+        """Return a function settle(v) recomputing every non-source slot of `v`.
+
+        Same result as settle(), but generated once as straight-line
+        Python (in chunks, to keep each code object small) so repeated calls
+        skip the per-gate tuple unpacking and table dispatch."""
+        if self._settle is None:
+            ns = self._namespace()
+            chunks = []
+            for start in range(0, len(self.program), _CHUNK):
+                lines = [f"def _c{start}(v):"]
+                for i, table, a, b in self.program[start:start + _CHUNK]:
+                    if table is None:
+                        lines.append(f"    v[{i}] = " + self._wide_expr(i))
+                        continue
+                    expr = _EXPR.get(table, "T[{i}][v[{a}] | v[{b}] << 1]")
+                    lines.append(f"    v[{i}] = " + expr.format(i=i, a=a, b=b))
+                lines.append("    return v")
+                exec(compile("\n".join(lines), f"<settle:{start}>", "exec"), ns)
+                chunks.append(ns[f"_c{start}"])
+            if len(chunks) == 1:
+                self._settle = chunks[0]
+            else:
+                def settle(v, chunks=tuple(chunks)):
+                    for c in chunks:
+                        c(v)
+                    return v
+                self._settle = settle
+        return self._settle
+
+    def _namespace(self) -> Dict[str, Any]:
+        # globals of generated code: per-slot tables, and the table (K<opcode>)
+        # or function (F<opcode>) of every registered type evaluated as a wide gate
+        ns = {"T": self.tables}
+        for t in {self.types[i] for i in self.wide}:
+            op = gate_type(t)
+            if not op.word:
+                ns[f"K{op.opcode}"] = op.table
+                ns[f"F{op.opcode}"] = op.fn
+        return ns
+
+    def _wide_expr(self, i: int) -> str:
+        fanin, const = self.wide[i], self.size
+        op = gate_type(self.types[i])
+        if op.word:
+            return word_expr(op.name, lambda pin: f"v[{fanin.get(pin, const)}]")
+        refs = [f"v[{fanin.get(p, const)}]" for p in op.pins]
+        if op.table is None:
+            return f"F{op.opcode}({', '.join(refs)}, 1)"
+        return f"K{op.opcode}[" + " | ".join(f"{r} << {k}" if k else r for k, r in enumerate(refs)) + "]"
+
+    @property
+    def wide_functions(self) -> Dict[int, Any]:
+        """Per wide slot, a function v -> its new value, built on first use."""
+        if self._wide_fns is None:
+            ns = self._namespace()
+            self._wide_fns = {i: eval("lambda v: " + self._wide_expr(i), ns)
+                              for i, table, _, _ in self.program if table is None}
+        return self._wide_fns
+
+    def values(self, v: list) -> Dict[str, bool]:
+        if self.widths is None:
+            return {gid: bool(v[i]) for i, gid in enumerate(self.ids)}
+        widths = self.widths
+        return {gid: v[i] if widths[i] > 1 else bool(v[i]) for i, gid in enumerate(self.ids)}
+
+    @property
+    def type_counts(self) -> Dict[str, int]:
+        """Gates per type evaluated by one settle()."""
+        if self._type_counts is None:
+            counts = {}
+            for i, _, _, _ in self.program:
+                t = self.types[i]
+                counts[t] = counts.get(t, 0) + 1
+            self._type_counts = counts
+        return self._type_counts
+
+    @property
+    def fanout(self) -> list:
+        """Per-slot list of (non-INPUT) gates reading it, built on first use."""
+        if self._fanout is None:
+            fo = [[] for _ in range(self.size + 1)]
+            wide = self.wide
+            for i, _, a, b in self.program:
+                if i in wide:
+                    for s in set(wide[i].values()):
+                        fo[s].append(i)
+                    continue
+                fo[a].append(i)
+                if b != a:
+                    fo[b].append(i)
+            self._fanout = fo
+        return self._fanout
+
+    def propagate(self, v: list, seeds, values: Dict[str, bool] = None, changed: set = None,
+                  evaluated: list = None) -> int:
+        """Re-evaluate the fan-out cone of the slots in `seeds` (whose values in `v`
+        were just changed), stopping wherever a gate's output is unchanged.
+        Updates `v`, and `values` if given, in place and adds every slot whose
+        value changed to `changed` if given (and every slot evaluated to
+        `evaluated`); returns the number of gates evaluated."""
+        fanout = self.fanout
+        tables, fa, fb, ids = self.tables, self.fanin_a, self.fanin_b, self.ids
+        wide_fns = self.wide_functions if self.wide else None
+        heap = []
+        queued = set()
+        for s in seeds:
+            for d in fanout[s]:
+                if d not in queued:
+                    queued.add(d)
+                    heap.append(d)
+        # slot indices are in levelized order, so popping the smallest index
+        # always evaluates a gate after everything it reads
+        heapq.heapify(heap)
+        count = 0
+        while heap:
+            i = heapq.heappop(heap)
+            queued.discard(i)
+            count += 1
+            if evaluated is not None:
+                evaluated.append(i)
+            table = tables[i]
+            new = table[v[fa[i]] | v[fb[i]] << 1] if table is not None else wide_fns[i](v)
+            if new == v[i]:
+                continue
+            v[i] = new
+            if values is not None:
+                values[ids[i]] = self.from_slot(i, new)
+            if changed is not None:
+                changed.add(i)
+            for d in fanout[i]:
+                if d not in queued:
+                    queued.add(d)
+                    heapq.heappush(heap, d)
+        return count
+
+    def batch_words(self, vectors, inputs, defaults: Dict[int, bool]) -> Dict[int, int]:
+        """Pack input vectors (see Circuit.evaluate_batch) into one word per input slot.
+        `defaults` gives the value of every input slot a vector does not set."""
+        if self.widths is not None:
+            raise ValueError("Bit-parallel evaluation needs a circuit without word-level gates")
+        if inputs is None:
+            inputs = [self.ids[i] for i in self.inputs]
+        slots = []
+        for iid in inputs:
+            i = self.index.get(iid)
+            if i is None or self.types[i] != "INPUT":
+                raise ValueError(f"Not an input gate: {iid}")
+            slots.append(i)
+        mask = (1 << len(vectors)) - 1
+        words = {i: mask if defaults.get(i) else 0 for i in self.inputs}
+        if vectors:
+            if isinstance(vectors[0], dict):
+                for iid, i in zip(inputs, slots):
+                    cur = defaults.get(i, False)
+                    bits = "".join("1" if row.get(iid, cur) else "0" for row in reversed(vectors))
+                    words[i] = int(bits, 2)
+            else:
+                for j, i in enumerate(slots):
+                    bits = "".join("1" if row[j] else "0" for row in reversed(vectors))
+                    words[i] = int(bits, 2)
+        return words
+
+    @property
+    def batch_program(self) -> list:
+        """`program` for bit-parallel words, built on first use: (i, op, a, b)
+        computing op(w[a], w[b], mask), or for a wide gate (i, None, fn, slots)
+        computing fn(*[w[s] for s in slots], mask)."""
+        if self._batch_program is None:
+            bp = []
+            for i, t, a, b in self.program:
+                if t is None:
+                    # wide gate: the type's own function over all its pins
+                    op, fanin = gate_type(self.types[i]), self.wide[i]
+                    bp.append((i, None, op.fn, [fanin.get(p, self.size) for p in op.pins]))
+                else:
+                    bp.append((i, bitwise_op(t), a, b))
+            self._batch_program = bp
+        return self._batch_program
+
+    def run_batch(self, input_words: Dict[int, int], width: int) -> list:
+        """Bit-parallel evaluation: bit k of every word is vector k. `input_words`
+        maps input gate index -> packed word; returns the word per gate slot."""
+        bp = self.batch_program
+        mask = (1 << width) - 1
+        w = [0] * (self.size + 1)
+        for i, word in input_words.items():
+            w[i] = word & mask
+        if self.wide:
+            for i, op, a, b in bp:
+                if op is None:
+                    w[i] = a(*[w[s] for s in b], mask)
+                else:
+                    w[i] = op(w[a], w[b], mask)
+            return w
+        for i, op, a, b in bp:
+            w[i] = op(w[a], w[b], mask)
+        return w
+
+def deep_sizeof(obj, seen=None) -> int:
+    """sys.getsizeof summed over containers, instance attributes and slots,
+    counting each object once."""
+    if seen is None:
+        seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for cls in type(o).__mro__:
+                for slot in cls.__dict__.get("__slots__", ()):
+                    if hasattr(o, slot):
+                        stack.append(getattr(o, slot))
+    return total
+
+def _report(gates: int, edges: int, gate_bytes: int, edge_bytes: int) -> Dict[str, Any]:
+    return {
+        "gates": gates,
+        "edges": edges,
+        "gate_bytes": gate_bytes,
+        "edge_bytes": edge_bytes,
+        "bytes_per_gate": gate_bytes / gates if gates else 0.0,
+        "bytes_per_edge": edge_bytes / edges if edges else 0.0,
+    }
+
+# Registered module (subcircuit) types by name; see modules.py.
+MODULES = {}
+# Bumped on every module registration and removal. Flattened module bodies and
+# compiled circuits remember the generation they were built at and rebuild
+# once it moves, so a redefined module reaches every parent.
+MODULE_GENERATION = 0
+
+def modules_changed():
+    global MODULE_GENERATION
+    MODULE_GENERATION += 1
+
+def expand_modules(ids, types, src, dst, pins, src_pins):
+    """Return (ids, types, src, dst, pins) with every module instance replaced by
+    its flattened contents; a no-op for circuits without instances."""
+    if MODULES and any(t in MODULES for t in types):
+        from modules import flatten
+        return flatten(ids, types, src, dst, pins, src_pins)
+    return ids, types, src, dst, pins
+
+def _compile_or_error(circuit, sequential, stats):
+    try:
+        return CompiledCircuit(circuit, sequential=sequential, stats=stats)
+    except CycleError as exc:
+        return exc
 
 class Circuit:
     def __init__(self):
+        self._init_storage()
+        self._reset_topology()
+        self._compiled = None
+        self._compiled_seq = None
+        self._module_generation = MODULE_GENERATION
+        # incremental evaluation state: (compiled, slot values, values dict)
+        self._incr = None
+        self._dirty = set()
+        self.last_eval_count = 0
+        # stored values (DFF states) of gates inside module instances, by flattened id
+        self._hidden = {}
+        # metrics.Stats collecting instrumentation, or None (the default) for none
+        self.stats = None
+
+    def enable_stats(self, stats=None):
+        """Start recording instrumentation into `stats` (a metrics.Stats, shared or
+        new) and return it; see metrics.py for what is recorded."""
+        if stats is None:
+            from metrics import Stats
+            stats = Stats()
+        self.stats = stats
+        return stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def _init_storage(self):
         self.G = nx.DiGraph()
         self.gates = {}
 
+    def _invalidate(self):
+        self._compiled = None
+        self._compiled_seq = None
+
     def add_gate(self, gate: Gate):
+        existed = gate.id in self.gates
         self.gates[gate.id] = gate
         self.G.add_node(gate.id)
+        self._topo_add(gate.id, existed)
+        self._invalidate()
 
     def remove_gate(self, gid: str):
+        seeds = self._topo_remove(gid) if gid in self.gates else ()
         if gid in self.gates:
             del self.gates[gid]
         if gid in self.G:
             self.G.remove_node(gid)
+        self._relevel(seeds)
+        self._invalidate()
 
-    def connect(self, src_id: str, dst_id: str, dst_pin: str = "a"):
+    def connect(self, src_id: str, dst_id: str, dst_pin: str = "a", src_pin: str = None):
+        """Connect src_id's output to dst_pin of dst_id. `src_pin` names the output
+        port when src_id is an instance of a module with several outputs.
+        Raises CycleError, leaving the circuit unchanged, if the edge would close
+        a combinational cycle (feedback into a DFF is fine)."""
         if src_id not in self.gates or dst_id not in self.gates:
             raise ValueError("Gate id not found")
+        new = not self.G.has_edge(src_id, dst_id)
+        if new:
+            self._topo_connect(src_id, dst_id)
         self.G.add_edge(src_id, dst_id, pin=dst_pin)
+        data = self.G.edges[src_id, dst_id]
+        if src_pin is None:
+            data.pop("src_pin", None)
+        else:
+            data["src_pin"] = src_pin
+        if new:
+            self._raise_level(src_id, dst_id)
+        self._invalidate()
 
     def disconnect(self, src_id: str, dst_id: str):
         if self.G.has_edge(src_id, dst_id):
             self.G.remove_edge(src_id, dst_id)
+            self._topo_disconnect(dst_id)
+            self._invalidate()
+
+    # --- topology maintenance ---
+    # The topological order and levels of the structure with every edge into a
+    # DFF or module instance cut (the graph a sequential compile levelizes) are
+    # kept up to date edit by edit, Pearce-Kelly style: a connect that agrees
+    # with the current order is O(1), otherwise only the gates ordered between
+    # its two ends are searched and renumbered among themselves.
+
+    def _reset_topology(self):
+        self._ord = {}       # gid -> position in _topo; None when it must be rebuilt
+        self._topo = []      # position -> gid, None where a gate was removed
+        self._level = {}
+
+    def _preds(self, gid: str):
+        return self.G.pred[gid]
+
+    def _succs(self, gid: str):
+        return self.G.succ[gid]
+
+    def _cut(self, gid: str) -> bool:
+        t = self.gates[gid].type
+        return base_type(t) == "DFF" or t in MODULES
+
+    def _rebuild_topology(self) -> bool:
+        ids = list(self.gates)
+        index = {gid: i for i, gid in enumerate(ids)}
+        src, dst = [], []
+        for d, gid in enumerate(ids):
+            if self._cut(gid):
+                continue
+            for s in self._preds(gid):
+                src.append(index[s])
+                dst.append(d)
+        try:
+            order, level = levelize(ids, None, src, dst)
+        except CycleError:
+            return False
+        self._topo = [ids[i] for i in order]
+        self._ord = {gid: p for p, gid in enumerate(self._topo)}
+        self._level = {gid: level[i] for i, gid in enumerate(ids)}
+        return True
+
+    def _topo_add(self, gid: str, existed: bool):
+        if existed:
+            # a replaced gate may have changed type, and with it which edges are cut
+            self._ord = None
+        elif self._ord is not None:
+            self._ord[gid] = len(self._topo)
+            self._topo.append(gid)
+            self._level[gid] = 0
+
+    def _topo_remove(self, gid: str) -> list:
+        """Forget `gid` (still present); returns the gates to relevel once it is gone."""
+        if self._ord is None:
+            return []
+        seeds = [d for d in self._succs(gid) if d != gid and not self._cut(d)]
+        self._topo[self._ord.pop(gid)] = None
+        del self._level[gid]
+        if len(self._topo) > 2 * len(self._ord) + 64:
+            self._topo = [g for g in self._topo if g is not None]
+            self._ord = {g: p for p, g in enumerate(self._topo)}
+        return seeds
+
+    def _topo_connect(self, u: str, v: str):
+        """Make room in the order for a new edge u -> v, or raise CycleError."""
+        if self._ord is None and not self._rebuild_topology():
+            return  # already cyclic; compile() reports it
+        if self._cut(v):
+            return
+        if u == v:
+            raise CycleError([[u]], 1, edge=(u, v))
+        ord_ = self._ord
+        lb, ub = ord_[v], ord_[u]
+        if lb > ub:
+            return
+        # forward from v over gates ordered before u; reaching u closes a cycle
+        fwd = {v: None}
+        stack = [v]
+        while stack:
+            x = stack.pop()
+            for w in self._succs(x):
+                if self._cut(w):
+                    continue
+                if w == u:
+                    path = []
+                    while x is not None:
+                        path.append(x)
+                        x = fwd[x]
+                    raise CycleError([[u] + path[::-1]], 1, edge=(u, v))
+                if w not in fwd and ord_[w] < ub:
+                    fwd[w] = x
+                    stack.append(w)
+        # backward from u over gates ordered after v
+        bwd = {u}
+        stack = [u]
+        while stack:
+            x = stack.pop()
+            if self._cut(x):
+                continue
+            for w in self._preds(x):
+                if w not in bwd and ord_[w] > lb:
+                    bwd.add(w)
+                    stack.append(w)
+        # u's ancestors take the lowest freed positions, v's descendants the rest
+        moved = sorted(bwd, key=ord_.__getitem__) + sorted(fwd, key=ord_.__getitem__)
+        for p, gid in zip(sorted(ord_[g] for g in moved), moved):
+            ord_[gid] = p
+            self._topo[p] = gid
+
+    def _topo_disconnect(self, v: str):
+        if self._ord is None or self._cut(v):
+            return
+        self._relevel((v,))
+
+    def _raise_level(self, u: str, v: str):
+        # after adding u -> v: only a raise is possible, and only if u is not already below v
+        level = self._level
+        if self._ord is None or self._cut(v) or level[u] < level[v]:
+            return
+        level[v] = level[u] + 1
+        succs = self._succs(v)
+        if succs:
+            self._relevel([d for d in succs if not self._cut(d)])
+
+    def _relevel(self, seeds):
+        """Recompute levels downstream of `seeds`, in order, stopping where unchanged."""
+        if self._ord is None:
+            return
+        ord_, level = self._ord, self._level
+        heap = [(ord_[g], g) for g in seeds if g in ord_]
+        heapq.heapify(heap)
+        done = set()
+        while heap:
+            _, g = heapq.heappop(heap)
+            if g in done:
+                continue
+            done.add(g)
+            lv = 0
+            if not self._cut(g):
+                for p in self._preds(g):
+                    if level[p] >= lv:
+                        lv = level[p] + 1
+            if lv != level[g]:
+                level[g] = lv
+                for d in self._succs(g):
+                    if not self._cut(d):
+                        heapq.heappush(heap, (ord_[d], d))
+
+    def topology(self, ids, types, sequential: bool = False):
+        """The maintained (order, level) for the flat netlist `ids` / `types` from
+        netlist_arrays(), as gate indices in topological order and a level per
+        gate; None when it does not describe the graph being compiled (module
+        instances get flattened)."""
+        if self._ord is None and not self._rebuild_topology():
+            return None
+        if len(ids) != len(self._ord):
+            return None
+        if MODULES and any(t in MODULES for t in types):
+            return None
+        index = {gid: i for i, gid in enumerate(ids)}
+        level = self._level
+        return [index[g] for g in self._topo if g is not None], [level[g] for g in ids]
+
+    def netlist_arrays(self):
+        """Flat view of the structure: (ids, types, src, dst, pins), with edges as
+        gate-index arrays grouped by destination in connection order (the last
+        edge into a pin wins)."""
+        ids = list(self.gates)
+        types = [g.type for g in self.gates.values()]
+        index = {gid: i for i, gid in enumerate(ids)}
+        src, dst, pins, src_pins = [], [], [], []
+        G = self.G
+        for d, gid in enumerate(ids):
+            if gid not in G:
+                continue
+            for s, data in G.pred[gid].items():
+                src.append(index[s])
+                dst.append(d)
+                pins.append(data.get("pin", "a"))
+                src_pins.append(data.get("src_pin"))
+        return expand_modules(ids, types, src, dst, pins, src_pins)
+
+    def gate_value(self, gid: str):
+        """Stored value of a gate (INPUT value / DFF state), including gates that
+        only exist inside a flattened module instance."""
+        g = self.gates.get(gid)
+        return g.value if g is not None else self._hidden.get(gid)
+
+    def set_gate_value(self, gid: str, value):
+        g = self.gates.get(gid)
+        if g is not None:
+            g.value = value
+        else:
+            self._hidden[gid] = value
+
+    def number_of_edges(self) -> int:
+        return self.G.number_of_edges()
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Approximate bytes held by the gate tables and by the connectivity."""
+        G = self.G
+        return _report(len(self.gates), self.number_of_edges(),
+                       deep_sizeof((self.gates, G._node)), deep_sizeof((G._adj, G._pred)))
+
+    def compile(self, sequential: bool = False) -> CompiledCircuit:
+        """Return the compiled form of the circuit, rebuilding it only after a structural change.
+        A CycleError is cached the same way, so an invalid circuit is only analysed once."""
+        if self._module_generation != MODULE_GENERATION:
+            # a module was (re)defined or removed: instances may flatten, and cut, differently
+            self._module_generation = MODULE_GENERATION
+            self._ord = None
+            self._invalidate()
+        st = self.stats
+        if sequential:
+            if st is not None:
+                st.lookup("compiled_seq", self._compiled_seq is not None)
+            if self._compiled_seq is None:
+                self._compiled_seq = _compile_or_error(self, True, st)
+            cc = self._compiled_seq
+        else:
+            if st is not None:
+                st.lookup("compiled", self._compiled is not None)
+            if self._compiled is None:
+                self._compiled = _compile_or_error(self, False, st)
+            cc = self._compiled
+        if isinstance(cc, CycleError):
+            raise cc.with_traceback(None)
+        return cc
 
     def set_input_value(self, input_id: str, value: bool):
         g = self.gates.get(input_id)
-        if g and g.type == "INPUT":
-            g.value = bool(value)
+        if g and base_type(g.type) == "INPUT":
+            width = type_width(g.type)
+            g.value = bool(value) if width == 1 else int(value) & ((1 << width) - 1)
+            self._dirty.add(input_id)
         else:
             raise ValueError("Not an input gate")
 
     def evaluate(self) -> Dict[str, Any]:
-        if not nx.is_directed_acyclic_graph(self.G):
-            cycles = list(nx.simple_cycles(self.G.to_directed()))
-            raise RuntimeError(f"Cycle detected in circuit: {cycles}")
-
-        order = list(nx.topological_sort(self.G))
-        values = {}
-        for gid in order:
-            gate = self.gates[gid]
-            in_edges = list(self.G.in_edges(gid, data=True))
-            pin_vals = {}
-            for (src, _, data) in in_edges:
-                pin = data.get("pin", "a")
-                pin_vals[pin] = bool(values.get(src, False))
-            try:
-                result = gate.eval(pin_vals)
-            except Exception:
-                result = False
-            values[gid] = bool(result)
-        for gid, gate in self.gates.items():
-            if gid not in values:
-                if gate.type == "INPUT":
-                    values[gid] = bool(gate.value)
-                else:
-                    values[gid] = False
+        cc = self.compile()
+        self.last_eval_count = cc.size
+        return self._value_dict(cc, self._settled(cc, "full"))
+
+    def _settled(self, cc: CompiledCircuit, mode: str) -> list:
+        # cc.run(self), timed and counted when stats are enabled
+        st = self.stats
+        if st is None:
+            return cc.run(self)
+        with st.phase("load"):
+            v = cc.load(self)
+        with st.phase("settle"):
+            cc.settle(v)
+        st.evaluated(mode, cc.type_counts)
+        return v
+
+    def _value_dict(self, cc: CompiledCircuit, v: list) -> Dict[str, bool]:
+        st = self.stats
+        if st is None:
+            return cc.values(v)
+        with st.phase("values"):
+            return cc.values(v)
+
+    def evaluate_incremental(self) -> Dict[str, Any]:
+        """Like evaluate(), but only re-evaluates gates downstream of INPUTs
+        changed through set_input_value since the previous call. The returned
+        dict is kept and updated in place by later calls; the number of gates
+        evaluated is left in `last_eval_count`. A structural change falls back
+        to a full evaluation."""
+        cc = self.compile()
+        st = self.stats
+        if st is not None:
+            st.lookup("incremental", self._incr is not None and self._incr[0] is cc)
+        if self._incr is None or self._incr[0] is not cc:
+            v = self._settled(cc, "full")
+            values = self._value_dict(cc, v)
+            self._incr = (cc, v, values)
+            self._dirty.clear()
+            self.last_eval_count = cc.size
+            return values
+        _, v, values = self._incr
+        seeds = []
+        for gid in self._dirty:
+            i = cc.index.get(gid)
+            g = self.gates.get(gid)
+            if i is None or g is None:
+                continue
+            new = cc.to_slot(i, g.value)
+            if v[i] != new:
+                v[i] = new
+                values[gid] = cc.from_slot(i, new)
+                seeds.append(i)
+        self._dirty.clear()
+        if st is None:
+            self.last_eval_count = cc.propagate(v, seeds, values)
+            return values
+        evaluated = []
+        with st.phase("propagate"):
+            self.last_eval_count = cc.propagate(v, seeds, values, evaluated=evaluated)
+        st.walk("propagate")
+        counts = {}
+        for i in evaluated:
+            t = cc.types[i]
+            counts[t] = counts.get(t, 0) + 1
+        st.evaluated("incremental", counts)
         return values
 
+    def evaluate_batch(self, vectors, inputs=None, packed: bool = False) -> Dict[str, Any]:
+        """Evaluate many input vectors at once.
+
+        `vectors` is a sequence of rows, each either a mapping {input_id: bool}
+        or a sequence of bools aligned with `inputs` (default: every INPUT gate
+        in compiled order). Inputs a row does not set keep their current value.
+        Vectors are packed into one integer word per signal so each gate is a
+        single bitwise operation over the whole batch.
+
+        Returns {gid: [bool, ...]} with one entry per vector, or {gid: int}
+        bitmasks (bit k = vector k) when `packed` is True."""
+        cc = self.compile()
+        width = len(vectors)
+        defaults = {i: bool(self.gate_value(cc.ids[i])) for i in cc.inputs}
+        words = cc.batch_words(vectors, inputs, defaults)
+        st = self.stats
+        if st is None:
+            w = cc.run_batch(words, width)
+        else:
+            with st.phase("batch"):
+                w = cc.run_batch(words, width)
+            st.evaluated("batch", cc.type_counts, width)
+        if packed:
+            return {gid: w[i] for i, gid in enumerate(cc.ids)}
+        return {gid: unpack_word(w[i], width) for i, gid in enumerate(cc.ids)}
+
     def clear(self):
         self.G.clear()
         self.gates.clear()
+        self._reset_topology()
+        self._dirty.clear()
+        self._hidden.clear()
+        self._invalidate()
 
 # --- Sequential element support (D flip-flop) ---
 # DFF behavior:
@@ -109,71 +1282,92 @@ class Circuit:
 # - During evaluation, the DFF outputs its current stored value (Q).
 # - If `clock_tick=True` is passed to evaluate_with_tick, then after computing combinational
 #   logic, DFFs will capture their 'd' input into their stored state and update outputs.
+# - Edges into a DFF are cut when compiling (combinationally a DFF reads as False), so
+#   feedback loops through a DFF (counters, shift registers, FSMs) are legal in every
+#   evaluation mode; purely combinational cycles are still rejected.
 from typing import Optional
 
 def evaluate_with_tick(self, clock_tick: bool = False):
     """Evaluate the circuit. If clock_tick is False, behaves like evaluate().
     If clock_tick is True, performs synchronous DFF updates on a clock edge and returns final values.
     Returns a tuple (values, order) where order is topological order used for propagation visualization."""
-    import networkx as nx
-    if not nx.is_directed_acyclic_graph(self.G):
-        # allow cycles if they involve DFFs? For simplicity, still require DAG for combinational paths.
-        cycles = list(nx.simple_cycles(self.G.to_directed()))
-        # if cycles contain non-DFF nodes, raise
-        raise RuntimeError(f"Cycle detected in circuit: {cycles}")
-
-    order = list(nx.topological_sort(self.G))
-    values = {}
-    # First pass: evaluate with current DFF stored states (DFF outputs current value)
-    for gid in order:
-        gate = self.gates[gid]
-        in_edges = list(self.G.in_edges(gid, data=True))
-        pin_vals = {}
-        for (src, _, data) in in_edges:
-            pin = data.get("pin", "a")
-            pin_vals[pin] = bool(values.get(src, False))
-        # For DFF, output its stored state (gate.value); do not use input 'd' yet
-        if gate.type == 'DFF':
-            values[gid] = bool(gate.value)
-            continue
-        try:
-            result = gate.eval(pin_vals)
-        except Exception:
-            result = False
-        values[gid] = bool(result)
-    # If clock_tick is True, capture D inputs into next state, update gate.value for DFFs, then re-evaluate final outputs
+    cc = self.compile(sequential=True)
+    st = self.stats
+    v = self._settled(cc, "tick")
     if clock_tick:
-        next_states = {}
-        for gid, gate in self.gates.items():
-            if gate.type == 'DFF':
-                # find incoming edge to 'd' pin
-                in_edges = list(self.G.in_edges(gid, data=True))
-                dval = False
-                for (src, _, data) in in_edges:
-                    if data.get('pin', 'a') == 'd':
-                        dval = bool(values.get(src, False))
-                next_states[gid] = dval
-        # update stored states
-        for gid, ns in next_states.items():
-            self.gates[gid].value = bool(ns)
-        # recompute values after state update
-        values = {}
-        for gid in order:
-            gate = self.gates[gid]
-            in_edges = list(self.G.in_edges(gid, data=True))
-            pin_vals = {}
-            for (src, _, data) in in_edges:
-                pin = data.get("pin", "a")
-                pin_vals[pin] = bool(values.get(src, False))
-            if gate.type == 'DFF':
-                values[gid] = bool(gate.value)
-                continue
-            try:
-                result = gate.eval(pin_vals)
-            except Exception:
-                result = False
-            values[gid] = bool(result)
-    return values, order
-
-# attach method to Circuit
+        if st is None:
+            cc.clock(v)
+            for i in cc.states:
+                self.set_gate_value(cc.ids[i], cc.from_slot(i, v[i]))
+            cc.settle(v)
+        else:
+            with st.phase("clock"):
+                cc.clock(v)
+            with st.phase("writeback"):
+                for i in cc.states:
+                    self.set_gate_value(cc.ids[i], cc.from_slot(i, v[i]))
+            with st.phase("settle"):
+                cc.settle(v)
+            st.gates(cc.type_counts)
+    return self._value_dict(cc, v), list(cc.ids)
+
+def _stimulus_at(stimulus, k):
+    if stimulus is None:
+        return None
+    if callable(stimulus):
+        return stimulus(k)
+    if isinstance(stimulus, dict):
+        # {input_id: sequence of values}; a sequence shorter than the run holds its last value
+        return {iid: seq[k] if k < len(seq) else seq[-1] for iid, seq in stimulus.items() if len(seq)}
+    return stimulus[k] if k < len(stimulus) else None
+
+def run(self, cycles: int, stimulus=None, watch=None):
+    """Simulate `cycles` clock edges and return a per-cycle trace.
+
+    `stimulus` gives INPUT values per cycle: a callable cycle -> {input_id: bool},
+    a sequence of such mappings (one per cycle; inputs not mentioned hold their value),
+    or a mapping {input_id: sequence of bools}.
+    `watch` lists the gate ids to trace (default: every OUTPUT and DFF).
+
+    Each cycle applies its stimulus, settles the combinational logic and then
+    clocks every DFF. Returns {gid: bytearray} where byte k is the value settled
+    during cycle k, just before its clock edge (a list of ints for buses). Final DFF states and input values
+    are written back to the gates."""
+    st = self.stats
+    if st is None:
+        return _run_cycles(self, cycles, stimulus, watch)
+    with st.phase("run"):
+        trace = _run_cycles(self, cycles, stimulus, watch)
+    st.evaluated("run", self._compiled_seq.type_counts, cycles)
+    return trace
+
+def _run_cycles(self, cycles: int, stimulus, watch):
+    cc = self.compile(sequential=True)
+    settle = cc.settle_function()
+    index = cc.index
+    v = cc.run(self)
+    if watch is None:
+        watch = [gid for gid in cc.ids if base_type(cc.types[index[gid]]) in ("OUTPUT", "DFF")]
+    slots = [index[gid] for gid in watch]
+    trace = [bytearray(cycles) if cc.widths is None or cc.widths[i] == 1 else [0] * cycles for i in slots]
+    columns = list(enumerate(slots))
+    inputs = set(cc.inputs)
+    for k in range(cycles):
+        stim = _stimulus_at(stimulus, k)
+        if stim:
+            for iid, val in stim.items():
+                i = index.get(iid)
+                if i not in inputs:
+                    raise ValueError(f"Not an input gate: {iid}")
+                v[i] = cc.to_slot(i, val)
+        settle(v)
+        for j, i in columns:
+            trace[j][k] = v[i]
+        cc.clock(v)
+    for i in cc.sources:
+        self.set_gate_value(cc.ids[i], cc.from_slot(i, v[i]))
+    return dict(zip(watch, trace))
+
+# attach methods to Circuit
 Circuit.evaluate_with_tick = evaluate_with_tick
+Circuit.run = run
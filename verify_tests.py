@@ -1,4 +1,27 @@
-from sim import Gate, Circuit
+from sim import Gate, Circuit, CompiledCircuit, CycleError, MAX_REPORTED_CYCLES, register_gate_type
+from parallel import evaluate_parallel
+from sessions import SessionStore, estimate_bytes
+from live import LiveSimulation
+import netlist
+from compact import CompactCircuit
+from modules import register_module, unregister_module
+from optimize import optimize
+import generators
+from bench import compare, main as bench_main
+from waveform import Trace
+from faults import fault_coverage
+from jobs import JobPool, Busy, TooLarge, evaluate as evaluate_job
+import jobs
+from metrics import Stats
+from render import CanvasRenderer
+from bdd import BDD, circuit_bdds, equivalent, satisfy, minimize
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
 
 def assert_eq(a,b,msg=None):
     if a!=b:
@@ -51,18 +74,76 @@ assert_eq(vals['x'], True, 'XOR wrong')
 assert_eq(vals['nand'], True, 'NAND wrong')
 assert_eq(vals['nor'], False, 'NOR wrong')
 
-# Test cycle detection
+# Test cycle detection: a cycle-closing connect is refused and leaves the circuit as it was
 c = Circuit()
 a = Gate('a','INPUT'); b = Gate('b','AND')
 c.add_gate(a); c.add_gate(b)
-c.connect('a','b','a'); c.connect('b','a','a')  # creates cycle
-c.set_input_value('a', True)
+c.connect('a','b','a')
 threw = False
 try:
-    c.evaluate()
+    c.connect('b','a','a')  # would create a cycle
 except RuntimeError:
     threw = True
 assert_eq(threw, True, 'Cycle not detected')
+assert_eq(c.number_of_edges(), 1, 'Rejected edge was added')
+c.set_input_value('a', True)
+assert_eq(c.evaluate()['b'], False, 'Circuit unusable after rejected connect')
+
+# Test cycle diagnostics are bounded, cached and ignore DFF-broken loops
+ids = [f'x{k}' for k in range(40)] + [f'n{k}' for k in range(5)]
+types = ['XOR'] * 40 + ['NOT'] * 5
+# every XOR reads its two neighbours: exponentially many simple cycles, one component
+src = [k for k in range(40) for _ in (0, 1)] + list(range(40, 45))
+dst = [d for k in range(40) for d in ((k + 1) % 40, (k - 1) % 40)] + list(range(40, 45))
+try:
+    CompiledCircuit.from_arrays(ids, types, src, dst, ['a', 'b'] * 40 + ['a'] * 5)
+    raise AssertionError('Cycle not detected')
+except CycleError as exc:
+    err = exc
+assert_eq((len(err.cycles), err.components), (MAX_REPORTED_CYCLES, 6), 'Cycle report not bounded')
+assert_eq(err.cycles[0], ['x0', 'x1'], 'Shortest cycle not reported')
+assert_eq(len(str(err)) < 300, True, 'Cycle message too long')
+c = Circuit()
+for g in [Gate('q','DFF'), Gate('n','NOT')]:
+    c.add_gate(g)
+c.connect('q','n','a'); c.connect('n','q','d')
+assert_eq(c.evaluate_with_tick(True)[0]['q'], True, 'DFF loop rejected')
+# combinational evaluation cuts the DFF input edge too and reads the DFF as False
+assert_eq(c.evaluate(), {'q': False, 'n': True}, 'DFF loop rejected by evaluate()')
+assert_eq(c.evaluate_batch([[]], inputs=[])['n'], [True], 'DFF loop rejected by evaluate_batch()')
+c.add_gate(Gate('q', 'NOT'))  # retyping the DFF keeps its edges and closes a combinational loop
+try:
+    c.evaluate()
+    raise AssertionError('Cycle not detected')
+except CycleError as exc:
+    err = exc
+try:
+    c.evaluate()
+except CycleError as exc:
+    assert_eq(exc is err, True, 'Cycle error not cached')
+
+# Test topology is maintained across edits and matches a from-scratch levelization
+for cls in (Circuit, CompactCircuit):
+    c = cls()
+    for gid in ['o', 'n3', 'n2', 'n1', 'i']:  # added in reverse order
+        c.add_gate(Gate(gid, 'OUTPUT' if gid == 'o' else 'INPUT' if gid == 'i' else 'NOT'))
+    c.connect('n3','o','a'); c.connect('n2','n3','a'); c.connect('n1','n2','a'); c.connect('i','n1','a')
+    ids, types = c.netlist_arrays()[:2]
+    order, level = c.topology(ids, types)
+    assert_eq([ids[i] for i in order], ['i', 'n1', 'n2', 'n3', 'o'], f'{cls.__name__} order wrong')
+    assert_eq(dict(zip(ids, level)), {'i': 0, 'n1': 1, 'n2': 2, 'n3': 3, 'o': 4}, f'{cls.__name__} levels wrong')
+    threw = False
+    try:
+        c.connect('n3','n1','a')
+    except CycleError as exc:
+        threw = exc.cycles == [['n3', 'n1', 'n2']]
+    assert_eq(threw, True, f'{cls.__name__} cycle-closing connect not rejected')
+    c.disconnect('n2','n3'); c.remove_gate('n1'); c.connect('i','o','a')
+    ids, types = c.netlist_arrays()[:2]
+    assert_eq(dict(zip(ids, c.topology(ids, types)[1])), {'o': 1, 'n3': 0, 'n2': 0, 'i': 0},
+              f'{cls.__name__} levels not updated')
+    c.set_input_value('i', True)
+    assert_eq(c.evaluate()['o'], True, f'{cls.__name__} values wrong after edits')
 
 # Test isolated node behavior
 c = Circuit()
@@ -76,4 +157,585 @@ c.set_input_value('in', True)
 vals = c.evaluate()
 assert_eq(vals['in'], True, 'Isolated input should return its value')
 
+# Test compiled form is cached and rebuilt after structural edits
+c = Circuit()
+i1 = Gate('i1','INPUT'); n = Gate('n','NOT'); o = Gate('o','OUTPUT')
+for g in [i1,n,o]:
+    c.add_gate(g)
+c.connect('i1','n','a'); c.connect('n','o','a')
+cc = c.compile()
+c.set_input_value('i1', True)
+vals = c.evaluate()
+assert_eq(c.compile() is cc, True, 'Compiled form not cached')
+assert_eq(vals['o'], False, 'Compiled NOT chain wrong')
+c.disconnect('n','o')
+assert_eq(c.compile() is cc, False, 'Compiled form not invalidated')
+assert_eq(c.evaluate()['o'], False, 'Disconnected OUTPUT should be False')
+c.connect('i1','o','a')
+assert_eq(c.evaluate()['o'], True, 'Reconnected OUTPUT wrong')
+
+# Test bit-parallel batch evaluation matches per-vector evaluate()
+c = Circuit()
+i1 = Gate('i1','INPUT'); i2 = Gate('i2','INPUT')
+x = Gate('x','XOR'); nand = Gate('nand','NAND'); nor = Gate('nor','NOR'); n = Gate('n','NOT')
+for g in [i1,i2,x,nand,nor,n]:
+    c.add_gate(g)
+c.connect('i1','x','a'); c.connect('i2','x','b')
+c.connect('i1','nand','a'); c.connect('i2','nand','b')
+c.connect('i1','nor','a'); c.connect('i2','nor','b'); c.connect('x','n','a')
+rows = [[False,False],[False,True],[True,False],[True,True]]
+batch = c.evaluate_batch(rows, inputs=['i1','i2'])
+for k, (v1, v2) in enumerate(rows):
+    c.set_input_value('i1', v1); c.set_input_value('i2', v2)
+    vals = c.evaluate()
+    for gid in vals:
+        assert_eq(batch[gid][k], vals[gid], f'Batch {gid} wrong for vector {k}')
+packed = c.evaluate_batch([{'i1': True, 'i2': True}, {'i1': False}], packed=True)
+assert_eq(packed['nand'], 0b10, 'Packed batch NAND wrong')
+
+# Test incremental evaluation only walks the changed cone
+c = Circuit()
+for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('n1','NOT'), Gate('n2','NOT'),
+          Gate('o1','OUTPUT'), Gate('o2','OUTPUT')]:
+    c.add_gate(g)
+c.connect('i1','n1','a'); c.connect('n1','o1','a')
+c.connect('i2','n2','a'); c.connect('n2','o2','a')
+vals = c.evaluate_incremental()
+assert_eq(c.last_eval_count, 6, 'First incremental evaluation should be full')
+c.set_input_value('i1', True)
+vals = c.evaluate_incremental()
+assert_eq(c.last_eval_count, 2, 'Incremental evaluation walked too many gates')
+assert_eq((vals['n1'], vals['o1'], vals['o2']), (False, False, True), 'Incremental values wrong')
+c.set_input_value('i1', True)
+c.evaluate_incremental()
+assert_eq(c.last_eval_count, 0, 'Unchanged input should not re-evaluate')
+assert_eq(vals, c.evaluate(), 'Incremental and full evaluation disagree')
+
+# Test sequential feedback through DFFs: 2-bit counter
+c = Circuit()
+for g in [Gate('q0','DFF'), Gate('q1','DFF'), Gate('n0','NOT'), Gate('x1','XOR'), Gate('o','OUTPUT')]:
+    c.add_gate(g)
+c.connect('q0','n0','a'); c.connect('n0','q0','d')
+c.connect('q0','x1','a'); c.connect('q1','x1','b'); c.connect('x1','q1','d')
+c.connect('q1','o','a')
+trace = c.run(6)
+counts = [trace['q0'][k] | trace['q1'][k] << 1 for k in range(6)]
+assert_eq(counts, [0,1,2,3,0,1], 'Counter sequence wrong')
+assert_eq(list(trace['o']), [0,0,1,1,0,0], 'Counter OUTPUT trace wrong')
+vals, order = c.evaluate_with_tick(True)
+assert_eq((vals['q0'], vals['q1']), (True, True), 'evaluate_with_tick after run wrong')
+
+# Test run() stimulus drives inputs per cycle
+c = Circuit()
+for g in [Gate('i','INPUT'), Gate('d1','DFF'), Gate('d2','DFF')]:
+    c.add_gate(g)
+c.connect('i','d1','d'); c.connect('d1','d2','d')
+trace = c.run(4, stimulus={'i': [True, False, True]}, watch=['d2'])
+assert_eq(list(trace['d2']), [0,0,1,0], 'Shift register trace wrong')
+
+# Test word-level gates: an 8-bit accumulator with a bus comparator, splitter and merger
+for cls in (Circuit, CompactCircuit):
+    c = cls()
+    for g in [Gate('x','INPUT:8'), Gate('acc','DFF:8'), Gate('sum','ADD:8'), Gate('out','OUTPUT:8'),
+              Gate('lim','INPUT:8'), Gate('lt','LT:8'), Gate('msb','SPLIT:7'), Gate('en','INPUT'),
+              Gate('pick','MUX:8'), Gate('m','MERGE:2'), Gate('n','NOT')]:
+        c.add_gate(g)
+    c.connect('acc','sum','a'); c.connect('x','sum','b'); c.connect('sum','pick','b'); c.connect('acc','pick','a')
+    c.connect('en','pick','s'); c.connect('pick','acc','d'); c.connect('acc','out','a')
+    c.connect('acc','lt','a'); c.connect('lim','lt','b'); c.connect('sum','msb','a')
+    c.connect('msb','n','a'); c.connect('msb','m','0'); c.connect('n','m','1')
+    c.set_input_value('x', 100); c.set_input_value('lim', 150); c.set_input_value('en', True)
+    trace = c.run(4, watch=['out', 'lt', 'm'])
+    assert_eq(trace['out'], [0, 100, 200, 44], f'{cls.__name__} accumulator trace wrong')
+    assert_eq(list(trace['lt']), [1, 1, 0, 1], f'{cls.__name__} comparator trace wrong')
+    assert_eq(list(trace['m']), [2, 1, 2, 1], f'{cls.__name__} merger trace wrong')
+    assert_eq(c.gates['acc'].value, 144, f'{cls.__name__} register state not written back')
+    vals, _ = c.evaluate_with_tick(False)
+    assert_eq((vals['out'], vals['sum'], vals['lt']), (144, 244, True), f'{cls.__name__} word values wrong')
+    c.set_input_value('x', 300)  # masked to 8 bits
+    vals, _ = c.evaluate_with_tick(False)
+    assert_eq((vals['x'], vals['sum']), (44, 188), f'{cls.__name__} bus input not masked')
+    net = netlist.loads(netlist.dumps(netlist.Netlist.from_circuit(c)))
+    assert_eq(net.to_circuit().evaluate_with_tick(False)[0], c.evaluate_with_tick(False)[0],
+              f'{cls.__name__} bus values lost in netlist round trip')
+threw = False
+try:
+    c = Circuit()
+    for g in [Gate('x','INPUT:8'), Gate('y','INPUT:4'), Gate('s','ADD:8')]:
+        c.add_gate(g)
+    c.connect('x','s','a'); c.connect('y','s','b'); c.evaluate()
+except ValueError as exc:
+    threw = 'Width mismatch' in str(exc)
+assert_eq(threw, True, 'Bus width mismatch not rejected')
+
+# Test waveform traces store only changes, keep a ring-buffer window and export VCD
+c = generators.counter(3); c.set_input_value('in0', True)
+full = c.run(20, watch=['q0', 'q2'])
+c = generators.counter(3); c.set_input_value('in0', True)
+t = Trace(c, ['q0', 'q2'])
+t.capture(12); t.capture(8)
+assert_eq([t.value_at('q2', k) for k in range(20)], [bool(x) for x in full['q2']], 'Trace values wrong')
+assert_eq(len(t._times[1]), 5, 'Trace stores more than the changes')
+assert_eq(c.gates['q0'].value, False, 'Trace did not write DFF states back')
+c = generators.counter(3); c.set_input_value('in0', True)
+t = Trace(c, ['q2'], window=6)
+t.capture(20)
+sl = t.slice()
+assert_eq((sl['start'], sl['end']), (14, 20), 'Trace window wrong')
+assert_eq(sl['signals']['q2'], {'width': 1, 'initial': True, 'changes': [[16, False]]}, 'Trace slice wrong')
+assert_eq(len(t._times[0]) <= 4, True, 'Ring buffer not trimmed')
+vcd = t.to_vcd(15, 18)
+assert_eq(vcd.split('$enddefinitions $end\n')[1], '#15\n$dumpvars\n1!\n$end\n#16\n0!\n#18\n', 'VCD body wrong')
+
+# Test parallel evaluation matches batch evaluation, shards merged in order
+if __name__ == '__main__':
+    c = Circuit()
+    for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('x','XOR'), Gate('o','OUTPUT')]:
+        c.add_gate(g)
+    c.connect('i1','x','a'); c.connect('i2','x','b'); c.connect('x','o','a')
+    rows = [[bool(k & 1), bool(k & 2)] for k in range(10)]
+    par = evaluate_parallel(c, rows, inputs=['i1','i2'], workers=2, watch=['o'], shard_size=3)
+    assert_eq(par['o'], c.evaluate_batch(rows, inputs=['i1','i2'])['o'], 'Parallel results wrong')
+
+# Test session store evicts least recently used sessions past its budget
+def small_circuit():
+    c = Circuit()
+    c.add_gate(Gate('i','INPUT')); c.add_gate(Gate('o','OUTPUT')); c.connect('i','o','a')
+    return c
+store = SessionStore(max_bytes=2 * estimate_bytes(small_circuit()), ttl=60)
+s1 = store.create(small_circuit()); s2 = store.create(small_circuit())
+store.get(s1.id)
+s3 = store.create(small_circuit())
+assert_eq((store.get(s1.id) is s1, store.get(s2.id), store.get(s3.id) is s3), (True, None, True), 'LRU eviction wrong')
+store.ttl = -1
+assert_eq(store.get(s1.id), None, 'Expired session returned')
+
+# Test live simulation frames carry only changed gates
+c = Circuit()
+for g in [Gate('q','DFF'), Gate('n','NOT'), Gate('en','INPUT'), Gate('o','OUTPUT')]:
+    c.add_gate(g)
+c.connect('q','n','a'); c.connect('n','q','d'); c.connect('en','o','a')
+live = LiveSimulation(c)
+assert_eq(len(live.frame()['changed']), 4, 'First frame should carry every gate')
+live.tick()
+assert_eq(live.frame(), {'cycle': 1, 'changed': {'q': True, 'n': False}}, 'Tick frame wrong')
+live.tick(2)
+assert_eq(live.frame()['changed'], {}, 'Coalesced frame should drop undone changes')
+live.set_inputs({'en': True})
+assert_eq(live.frame()['changed'], {'en': True, 'o': True}, 'Input frame wrong')
+# a session-backed simulation shares the session's lock and keeps its circuit current
+s = SessionStore(ttl=60).create(c)
+assert_eq(c.evaluate_incremental()['o'], True, 'Live input not seen by the circuit')
+live = LiveSimulation(c, lock=s.lock)
+live.set_inputs({'en': False})
+assert_eq(c.evaluate_incremental()['o'], False, 'Live input change skipped the dirty set')
+live.tick()
+assert_eq(c.gates['q'].value, not live.values()['n'], 'Ticked DFF state not written back')
+with s.lock:
+    assert_eq(live.frame(block=False), None, 'Frame taken while a job holds the session')
+assert_eq(live.frame()['changed'], {'en': False, 'o': False, 'q': False, 'n': True}, 'Queued changes lost')
+
+# Test binary netlist round trip and compiling straight from its arrays
+c = Circuit()
+for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('x','XOR'), Gate('q','DFF'), Gate('o','OUTPUT')]:
+    c.add_gate(g)
+c.connect('i1','x','a'); c.connect('i2','x','b'); c.connect('x','q','d'); c.connect('x','o','a')
+c.set_input_value('i1', True)
+for compress in (True, False):
+    net = netlist.loads(netlist.dumps(netlist.Netlist.from_circuit(c), compress=compress))
+    cc = net.compile()
+    assert_eq(cc.values(cc.run()), c.evaluate(), 'Netlist compiled values wrong')
+    assert_eq(net.to_circuit().evaluate(), c.evaluate(), 'Netlist round trip wrong')
+    assert_eq(netlist.evaluate(net, {'i2': True})['o'], False, 'Netlist input override wrong')
+
+# Test array-backed CompactCircuit behaves like Circuit
+for cls in (Circuit, CompactCircuit):
+    c = cls()
+    for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('x','XOR'), Gate('n','NOT'), Gate('o','OUTPUT')]:
+        c.add_gate(g)
+    c.connect('i1','x','a'); c.connect('i2','x','b'); c.connect('x','n','a'); c.connect('n','o','a')
+    c.connect('i1','o','a')
+    c.set_input_value('i1', True)
+    c.disconnect('i1','o')
+    c.remove_gate('i2')
+    vals = c.evaluate()
+    assert_eq((vals['x'], vals['n'], vals['o']), (True, False, False), f'{cls.__name__} values wrong')
+    assert_eq(c.number_of_edges(), 3, f'{cls.__name__} edge count wrong')
+    report = c.memory_report()
+    assert_eq((report['gates'], report['edges']), (4, 3), f'{cls.__name__} memory report wrong')
+assert_eq(sorted(c.G.edges(data='pin')), [('i1','x','a'), ('n','o','a'), ('x','n','a')], 'CompactCircuit graph view wrong')
+c = CompactCircuit()
+c.add_gate(Gate('i','INPUT')); c.add_gate(Gate('m','MERGE:300'))
+for k in range(300):
+    c.connect('i','m',str(k))
+assert_eq(c.G.edges['i','m']['pin'], '299', 'CompactCircuit pin past 256 names wrong')
+
+# Test module instances evaluate like the hand-flattened circuit
+ha = Circuit()
+for g in [Gate('a','INPUT'), Gate('b','INPUT'), Gate('x','XOR'), Gate('y','AND'), Gate('s','OUTPUT'), Gate('c','OUTPUT')]:
+    ha.add_gate(g)
+ha.connect('a','x','a'); ha.connect('b','x','b'); ha.connect('a','y','a'); ha.connect('b','y','b')
+ha.connect('x','s','a'); ha.connect('y','c','a')
+register_module('TEST_HA', ha)
+c = Circuit()
+for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('h','TEST_HA'), Gate('sum','OUTPUT'), Gate('carry','OUTPUT')]:
+    c.add_gate(g)
+c.connect('i1','h','a'); c.connect('i2','h','b')
+c.connect('h','sum','a',src_pin='s'); c.connect('h','carry','a',src_pin='c')
+for v1 in (False, True):
+    for v2 in (False, True):
+        c.set_input_value('i1', v1); c.set_input_value('i2', v2)
+        vals = c.evaluate()
+        assert_eq((vals['sum'], vals['carry'], vals['h/x']), (v1 ^ v2, v1 and v2, v1 ^ v2), 'Module instance wrong')
+threw = False
+try:
+    c.connect('h','sum','a'); c.evaluate()
+except ValueError:
+    threw = True
+assert_eq(threw, True, 'Ambiguous module output port not rejected')
+unregister_module('TEST_HA')
+
+# Test redefining a module reaches already-compiled parents, through nested modules too
+def one_gate(t):
+    m = Circuit()
+    for g in [Gate('a','INPUT'), Gate('b','INPUT'), Gate('g', t), Gate('y','OUTPUT')]:
+        m.add_gate(g)
+    m.connect('a','g','a'); m.connect('b','g','b'); m.connect('g','y','a')
+    return m
+register_module('TEST_OP', one_gate('AND'))
+outer = Circuit()
+for g in [Gate('a','INPUT'), Gate('b','INPUT'), Gate('op','TEST_OP'), Gate('y','OUTPUT')]:
+    outer.add_gate(g)
+outer.connect('a','op','a'); outer.connect('b','op','b'); outer.connect('op','y','a')
+register_module('TEST_OUTER', outer)
+c = Circuit()
+for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('w','TEST_OUTER'), Gate('direct','TEST_OP'), Gate('o','OUTPUT')]:
+    c.add_gate(g)
+c.connect('i1','w','a'); c.connect('i2','w','b'); c.connect('w','o','a')
+c.connect('i1','direct','a'); c.connect('i2','direct','b')
+c.set_input_value('i1', True)
+assert_eq((c.evaluate()['o'], c.evaluate()['direct/y']), (False, False), 'Module instance wrong')
+register_module('TEST_OP', one_gate('OR'))
+assert_eq((c.evaluate()['o'], c.evaluate_incremental()['direct/y']), (True, True), 'Redefined module not picked up')
+unregister_module('TEST_OUTER'); unregister_module('TEST_OP')
+
+# Test batch evaluation reads hidden module INPUTs (not ports) from their stored values
+register_module('TEST_GATED', one_gate('AND'), inputs=['a'])
+c = Circuit()
+for g in [Gate('i1','INPUT'), Gate('m','TEST_GATED'), Gate('o','OUTPUT')]:
+    c.add_gate(g)
+c.connect('i1','m','a'); c.connect('m','o','a')
+c.set_gate_value('m/b', True)
+assert_eq(c.evaluate_batch([[False], [True]], inputs=['i1'])['o'], [False, True], 'Hidden module input wrong in batch')
+if __name__ == '__main__':
+    par = evaluate_parallel(c, [[False], [True]], inputs=['i1'], workers=2, watch=['o'], shard_size=1)
+    assert_eq(par['o'], [False, True], 'Hidden module input wrong in parallel batch')
+unregister_module('TEST_GATED')
+
+# Test DFF state inside module instances persists across clock edges
+tff = Circuit()
+for g in [Gate('q','DFF'), Gate('n','NOT'), Gate('out','OUTPUT')]:
+    tff.add_gate(g)
+tff.connect('q','n','a'); tff.connect('n','q','d'); tff.connect('q','out','a')
+register_module('TEST_TFF', tff)
+c = Circuit()
+c.add_gate(Gate('t1','TEST_TFF')); c.add_gate(Gate('o','OUTPUT')); c.connect('t1','o','a')
+seen = [c.evaluate_with_tick(True)[0]['o'] for _ in range(3)]
+assert_eq(seen, [True, False, True], 'Module DFF state lost between ticks')
+unregister_module('TEST_TFF')
+
+# Test optimizer folds inverters/constants, merges duplicates, keeps every gate's value
+c = Circuit()
+for g in [Gate('a','INPUT'), Gate('b','INPUT'), Gate('n1','NOT'), Gate('n2','NOT'), Gate('x1','AND'), Gate('x2','AND'),
+          Gate('k','AND'), Gate('o','OR'), Gate('out','OUTPUT'), Gate('dead','XOR')]:
+    c.add_gate(g)
+c.connect('a','n1','a'); c.connect('n1','n2','a')
+c.connect('n2','x1','a'); c.connect('b','x1','b'); c.connect('a','x2','a'); c.connect('b','x2','b')
+c.connect('a','k','a')
+c.connect('x1','o','a'); c.connect('x2','o','b'); c.connect('o','out','a'); c.connect('a','dead','a')
+opt = optimize(c)
+assert_eq(opt.live_gate_count, 1, 'Optimizer did not reduce to a single AND')
+for v1 in (False, True):
+    for v2 in (False, True):
+        c.set_input_value('a', v1); c.set_input_value('b', v2)
+        assert_eq(opt.evaluate(c), c.evaluate(), 'Optimized circuit differs')
+        assert_eq(opt.evaluate(c, full=False), {'out': v1 and v2}, 'Optimized outputs differ')
+
+# Test benchmark generators compute what they claim, and regressions are flagged
+for gen in (generators.ripple_adder, generators.cla_adder):
+    c = gen(6)
+    for x, y in ((0, 0), (13, 50), (63, 63)):
+        for i in range(6):
+            c.set_input_value(f'a{i}', bool(x >> i & 1)); c.set_input_value(f'b{i}', bool(y >> i & 1))
+        vals = c.evaluate()
+        assert_eq(sum(vals[f's{i}'] << i for i in range(7)), x + y, f'{gen.__name__} sum wrong')
+c = generators.array_multiplier(4)
+for i in range(4):
+    c.set_input_value(f'a{i}', bool(11 >> i & 1)); c.set_input_value(f'b{i}', bool(13 >> i & 1))
+vals = c.evaluate()
+assert_eq(sum(vals[f'p{i}'] << i for i in range(8)), 143, 'Multiplier product wrong')
+c = generators.counter(3); c.set_input_value('in0', True)
+seen = []
+for _ in range(9):
+    vals = c.evaluate_with_tick(True)[0]
+    seen.append(sum(vals[f'out{i}'] << i for i in range(3)))
+assert_eq(seen, [1, 2, 3, 4, 5, 6, 7, 0, 1], 'Counter sequence wrong')
+base = {'results': [{'kind': 'k', 'size': 1, 'eval_s': 0.010, 'peak_bytes': 1000}]}
+assert_eq(compare({'results': [{'kind': 'k', 'size': 1, 'eval_s': 0.011, 'peak_bytes': 1000}]}, base), [], 'False regression')
+assert_eq(len(compare({'results': [{'kind': 'k', 'size': 1, 'eval_s': 0.020, 'peak_bytes': 2000}]}, base)), 2, 'Regression missed')
+with tempfile.TemporaryDirectory() as tmp:
+    args = ['--kinds', 'ripple_adder', '--sizes', '100', '--no-memory', '--output', os.path.join(tmp, 'r.json')]
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        assert_eq(bench_main(args + ['--baseline', os.path.join(tmp, 'missing.json')]), 0, 'Missing baseline failed the run')
+    assert_eq('comparison skipped' in out.getvalue(), True, 'Missing baseline not reported')
+    fast = os.path.join(tmp, 'fast.json')
+    with open(fast, 'w') as f:
+        json.dump({'results': [{'kind': 'ripple_adder', 'size': 100, 'build_s': 1e-9}]}, f)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as err:
+        assert_eq(bench_main(args + ['--baseline', fast]), 1, 'Baseline regression not reported')
+    assert_eq('build_s' in err.getvalue(), True, 'Regressed metric not listed')
+
+# Test opt-in instrumentation counts phases, gate evaluations and cache hits
+c = generators.counter(2)
+assert_eq(c.stats, None, 'Stats on by default')
+st = c.enable_stats()
+c.set_input_value('in0', True)
+c.evaluate_with_tick(True); c.evaluate_with_tick(False)
+snap = st.snapshot()
+assert_eq(snap['cache']['compiled_seq'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5}, 'Compile cache counts wrong')
+assert_eq(snap['evaluations'], {'tick': 2}, 'Evaluation counts wrong')
+assert_eq(snap['gate_evals']['XOR'], 6, 'Per-type gate counts wrong')
+assert_eq(snap['phases']['clock']['calls'], 1, 'Clock phase not timed')
+assert_eq('dlsim_gate_evals_total{type="XOR"} 6' in st.to_prometheus(), True, 'Prometheus text wrong')
+c = Circuit(); st = c.enable_stats()
+for g in [Gate('i1','INPUT'), Gate('i2','INPUT'), Gate('x','AND'), Gate('y','NOT')]:
+    c.add_gate(g)
+c.connect('i1','x','a'); c.connect('i2','x','b'); c.connect('i2','y','a')
+c.evaluate_incremental(); c.set_input_value('i1', True); c.evaluate_incremental()
+assert_eq(st.snapshot()['gate_evals'], {'AND': 2, 'NOT': 1}, 'Incremental gate counts wrong')
+assert_eq(st.hit_rate('incremental'), 0.5, 'Incremental cache hit rate wrong')
+
+# Test registered gate types evaluate like built-ins on every path
+register_gate_type('AND3', ('a', 'b', 'c'), lambda a, b, c, m: a & b & c)
+register_gate_type('MUX2', ('a', 'b', 's'), lambda a, b, s, m: a & (m ^ s) | b & s)
+register_gate_type('XNOR', ('a', 'b'), lambda a, b, m: m ^ a ^ b)
+register_gate_type('BUF', ('a',), lambda a, m: a)
+register_gate_type('TRI', ('a', 'en'), lambda a, en, m: a & en)
+try:
+    register_gate_type('and', ('a',), lambda a, m: a)
+    raise AssertionError('Built-in type redefined')
+except ValueError:
+    pass
+try:
+    register_gate_type('xnor', ('a', 'b'), lambda a, b, m: a ^ b)
+    raise AssertionError('Registered type redefined')
+except ValueError:
+    pass
+assert_eq(Gate('g', 'mux2').inputs, ('a', 'b', 's'), 'Registered pins wrong')
+def custom(cls):
+    c = cls()
+    for gid in 'pqrs':
+        c.add_gate(Gate(gid, 'INPUT'))
+    for gid, t in [('g3', 'AND3'), ('mx', 'MUX2'), ('xn', 'XNOR'), ('bf', 'BUF'), ('tr', 'TRI'), ('o', 'OR')]:
+        c.add_gate(Gate(gid, t))
+    for s, d, pin in [('p','g3','a'), ('q','g3','b'), ('r','g3','c'), ('p','mx','a'), ('q','mx','b'), ('s','mx','s'),
+                      ('mx','xn','a'), ('g3','xn','b'), ('xn','bf','a'), ('bf','tr','a'), ('r','tr','en'),
+                      ('tr','o','a'), ('g3','o','b')]:
+        c.connect(s, d, pin)
+    return c
+def expect(p, q, r, s):
+    g3 = p and q and r; mx = q if s else p; xn = mx == g3
+    return {'g3': g3, 'mx': mx, 'xn': xn, 'bf': xn, 'tr': xn and r, 'o': (xn and r) or g3}
+rows = [[bool(k >> j & 1) for j in range(4)] for k in range(16)]
+for cls in (Circuit, CompactCircuit):
+    c = custom(cls)
+    batch = c.evaluate_batch(rows, inputs=list('pqrs'))
+    for k, row in enumerate(rows):
+        for gid, val in zip('pqrs', row):
+            c.set_input_value(gid, val)
+        want = expect(*row)
+        got = c.evaluate()
+        assert_eq({g: got[g] for g in want}, want, f'Registered types wrong for {row}')
+        got = c.evaluate_incremental()
+        assert_eq({g: got[g] for g in want}, want, f'Incremental registered types wrong for {row}')
+        assert_eq({g: batch[g][k] for g in want}, want, f'Batch registered types wrong for {row}')
+g = Gate('m', 'MUX2')
+assert_eq([g.eval({'a': a, 'b': b, 's': s}) for s in (0, 1) for a in (0, 1) for b in (0, 1)],
+          [False, False, True, True, False, True, False, True], 'Gate.eval of registered type wrong')
+
+# Test stuck-at fault coverage matches re-simulating each faulty circuit
+def c17(stuck=None):
+    # ISCAS c17 plus a redundant g = i1 | (i1 & i2); `stuck` ties a gate's output to a constant
+    gates = [('i1','INPUT'), ('i2','INPUT'), ('i3','INPUT'), ('i4','INPUT'), ('i5','INPUT'),
+             ('n1','NAND'), ('n2','NAND'), ('n3','NAND'), ('n4','NAND'), ('n5','NAND'), ('n6','NAND'),
+             ('r','AND'), ('g','OR'), ('o1','OUTPUT'), ('o2','OUTPUT'), ('o3','OUTPUT')]
+    edges = [('i1','n1','a'), ('i3','n1','b'), ('i3','n2','a'), ('i4','n2','b'), ('i2','n3','a'), ('n2','n3','b'),
+             ('n2','n4','a'), ('i5','n4','b'), ('n1','n5','a'), ('n3','n5','b'), ('n3','n6','a'), ('n4','n6','b'),
+             ('i1','r','a'), ('i2','r','b'), ('i1','g','a'), ('r','g','b'), ('n5','o1','a'), ('n6','o2','a'), ('g','o3','a')]
+    c = Circuit()
+    for gid, t in gates:
+        c.add_gate(Gate(gid, 'INPUT' if stuck and gid == stuck[0] else t))
+    for s, d, pin in edges:
+        if not (stuck and d == stuck[0]):
+            c.connect(s, d, pin)
+    if stuck:
+        c.gates[stuck[0]].value = bool(stuck[1])
+    return c
+ins = ['i1', 'i2', 'i3', 'i4', 'i5']
+rows = [[bool(k >> j & 1) for j in range(5)] for k in (0, 31, 5, 10, 21, 12, 3, 27, 9, 18, 30, 1)]
+rep = fault_coverage(c17(), rows, inputs=ins, block=5)
+golden_first, golden_undetected = {}, []
+good = c17().evaluate_batch(rows, inputs=ins)
+for gid, v in [(gid, v) for gid in c17().compile().ids for v in (0, 1)]:
+    c = c17((gid, v))
+    bad = c.evaluate_batch([[x for i, x in zip(ins, row) if i != gid] for row in rows],
+                           inputs=[i for i in ins if i != gid])
+    hits = [k for k in range(len(rows)) if any(bad[o][k] != good[o][k] for o in ('o1', 'o2', 'o3'))]
+    if hits:
+        golden_first[(gid, v)] = hits[0]
+    else:
+        golden_undetected.append((gid, v))
+assert_eq({(g, v): k for g, v, k in rep['first_detection']}, golden_first, 'First detecting vectors wrong')
+assert_eq(rep['undetected'], golden_undetected, 'Undetected faults wrong')
+assert_eq(('r', 0) in rep['undetected'], True, 'Redundant fault reported as detected')
+assert_eq(rep['detected'] + len(rep['undetected']), rep['faults'], 'Fault counts inconsistent')
+rep = fault_coverage(c17(), rows, inputs=ins, observe=['n3'], faults=[('n2', 0), ('n6', 1)])
+assert_eq((rep['detected'], rep['undetected']), (1, [('n6', 1)]), 'Observation points ignored')
+
+# Test the API job pool: both lanes, worker stats, gate limit, full queue, timeout
+def slow_job(seconds, stats=None):
+    time.sleep(seconds)
+    return seconds
+async def pool_checks():
+    st = Stats()
+    pool = JobPool(threads=1, processes=1, queue=1, small_work=100, max_gates=1000, timeout=5, stats=st)
+    payload = {'nodes': [{'id': 'i', 'type': 'INPUT'}, {'id': 'n', 'type': 'NOT'}],
+               'edges': [{'from': 'i', 'to': 'n'}], 'inputs': {'i': True}}
+    assert_eq((await pool.run(evaluate_job, payload, gates=2))['values']['n'], False, 'Thread lane result wrong')
+    assert_eq((await pool.run(evaluate_job, payload, gates=2, work=101))['values']['n'], False, 'Process lane result wrong')
+    assert_eq(st.snapshot()['gate_evals'], {'NOT': 2}, 'Worker stats not merged')
+    batch = dict(payload, vectors=[[k % 3 == 0] for k in range(7)], input_ids=['i'], watch=['n'])
+    parts = await asyncio.gather(*[pool.run(jobs.evaluate_batch, shard, gates=2, work=101)
+                                   for shard in jobs.split_batch(batch, 2)])
+    assert_eq(jobs.merge_batches(parts), {'values': {'n': [k % 3 != 0 for k in range(7)]}, 'count': 7},
+              'Sharded batch not merged in order')
+    try:
+        await pool.run(evaluate_job, payload, gates=1001)
+        raise AssertionError('Gate limit not enforced')
+    except TooLarge:
+        pass
+    running = [asyncio.ensure_future(pool.run(slow_job, 0.2, gates=1)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    try:
+        await pool.run(slow_job, 0, gates=1)
+        raise AssertionError('Full queue accepted a job')
+    except Busy:
+        pass
+    assert_eq(await asyncio.gather(*running), [0.2, 0.2], 'Queued jobs lost')
+    try:
+        await pool.run(slow_job, 0.2, gates=1, timeout=0.01)
+        raise AssertionError('Timeout not enforced')
+    except asyncio.TimeoutError:
+        pass
+    assert_eq(pool.inflight['small'], 1, 'Timed-out job released its slot early')
+    pool.shutdown()
+    assert_eq(pool.inflight, {'small': 0, 'large': 0}, 'Slots not released')
+asyncio.run(pool_checks())
+
+# Test API sessions accept DFF feedback and record traces of it
+payload = netlist.Netlist.from_circuit(generators.counter(3)).to_payload()
+payload['inputs'] = {'in0': True}
+s = SessionStore(ttl=60).create(jobs.new_session_circuit(payload))
+assert_eq(jobs.evaluate_session(s, {})['values']['out0'], False, 'Counter session evaluation wrong')
+assert_eq(jobs.record_trace(s, {'cycles': 10, 'signals': ['q2']}, 6), {'start': 4, 'end': 10, 'changes': 2},
+          'Session trace not recorded')
+assert_eq(s.trace.slice(4, 9)['signals']['q2'], {'width': 1, 'initial': True, 'changes': [[8, False]]},
+          'Session trace slice wrong')
+assert_eq(s.trace.to_vcd(4, 9).split('$enddefinitions $end\n')[1], '#4\n$dumpvars\n1!\n$end\n#8\n0!\n#9\n',
+          'Session trace VCD wrong')
+assert_eq(jobs.trace_slice(s, 4, 9), s.trace.slice(4, 9), 'Session trace job slice wrong')
+# the trace counts towards the session's size, evicting other sessions when over budget
+store = SessionStore(max_bytes=2 * estimate_bytes(s.circuit) + 1, ttl=60)
+s, other = store.create(s.circuit), store.create(jobs.new_session_circuit(payload))
+jobs.record_trace(s, {'cycles': 100}, 100)
+store.resize(s)
+assert_eq(s.size, estimate_bytes(s.circuit) + s.trace.nbytes, 'Trace bytes not estimated')
+assert_eq((store.get(other.id), store.get(s.id) is s, store.total_bytes), (None, True, s.size),
+          'Grown session did not evict others')
+
+# Test saved JSON netlists are held to the gate limit inside the job
+with tempfile.TemporaryDirectory() as d:
+    path = os.path.join(d, 'small.json')
+    with open(path, 'w') as f:
+        json.dump(netlist.Netlist.from_circuit(small_circuit()).to_payload(), f)
+    assert_eq(jobs.evaluate_saved(path, {'i': True})['values']['o'], True, 'Saved JSON evaluation wrong')
+    try:
+        jobs.evaluate_saved(path, {}, max_gates=1)
+        raise AssertionError('Saved JSON over the gate limit evaluated')
+    except jobs.TooLarge:
+        pass
+
+# Test the canvas renderer redraws only what changed and matches a full redraw
+nodes = {f'g{k}': {'type': ['INPUT', 'AND', 'OUTPUT'][k % 3], 'x': 20 + (k % 10) * 140, 'y': 20 + (k // 10) * 90,
+                   'w': 100, 'h': 50} for k in range(60)}
+edges = [(f'g{k}', f'g{k + 1}', 'a') for k in range(59) if (k + 1) % 10]
+r = CanvasRenderer(900, 600)
+r.render(nodes, edges, {})
+full = r.last_drawn
+r.render(nodes, edges, {})
+assert_eq((r.last_regions, r.last_drawn), (0, 0), 'Unchanged rerun redrew the canvas')
+r.render(nodes, edges, {'g3': True, 'g9': True})  # g9 is off screen
+assert_eq(0 < r.last_drawn < full // 4, True, 'Value change redrew too much')
+nodes['g12']['x'] += 30
+edges.append(('g0', 'g12', 'b'))
+for vp in ((0, 0), (150, 40)):
+    img = r.render(nodes, edges, {'g3': True, 'g9': True}, viewport=vp)
+    ref = CanvasRenderer(900, 600).render(nodes, edges, {'g3': True, 'g9': True}, viewport=vp)
+    assert_eq(img.tobytes() == ref.tobytes(), True, f'Incremental frame differs from a full render at {vp}')
+
+# Test BDD equivalence, counterexamples, satisfiability and minimization
+rep = equivalent(generators.ripple_adder(48), generators.cla_adder(48))
+assert_eq((rep['equivalent'], rep['compared']), (True, 49), 'Adders not proven equivalent')
+a, b = generators.ripple_adder(24), generators.ripple_adder(24)
+b.disconnect('b17', 'g87')  # carry AND of bit 17 now reads a16 instead of b17
+b.connect('a16', 'g87', 'b')
+rep = equivalent(a, b)
+assert_eq((rep['equivalent'], len(rep['counterexample'])), (False, 49), 'Mutation not found')
+for c in (a, b):
+    for gid, val in rep['counterexample'].items():
+        c.set_input_value(gid, val)
+assert_eq(a.evaluate()[rep['mismatch']] != b.evaluate()[rep['mismatch']], True, 'Counterexample does not differ')
+good = c17().evaluate_batch([[bool(k >> j & 1) for j in range(5)] for k in range(32)], inputs=ins)
+for out in ('o1', 'o2', 'o3'):
+    rep = satisfy(c17(), out, False)
+    assert_eq(rep['count'], good[out].count(False), f'Satisfying count of {out} wrong')
+    c = c17()
+    for gid, val in rep['assignment'].items():
+        c.set_input_value(gid, val)
+    assert_eq(c.evaluate()[out], False, f'Assignment does not satisfy {out}')
+assert_eq(minimize(c17(), 'o3')['expression'], 'i1', 'Redundant logic not minimized')
+cubes = minimize(custom(Circuit), 'o')['cubes']
+for k in range(16):
+    point = {gid: bool(k >> j & 1) for j, gid in enumerate('pqrs')}
+    got = any(all(point[v] == want for v, want in cube.items()) for cube in cubes)
+    assert_eq(got, expect(*point.values())['o'], f'Minimized cover of registered types wrong at {point}')
+def and_chain(n):
+    c = Circuit()
+    c.add_gate(Gate('i0', 'INPUT'))
+    prev = 'i0'
+    for k in range(1, n):
+        c.add_gate(Gate(f'i{k}', 'INPUT')); c.add_gate(Gate(f'g{k}', 'AND'))
+        c.connect(prev, f'g{k}', 'a'); c.connect(f'i{k}', f'g{k}', 'b')
+        prev = f'g{k}'
+    c.add_gate(Gate('o', 'OUTPUT')); c.connect(prev, 'o', 'a')
+    return c
+assert_eq(equivalent(and_chain(1500), and_chain(1500))['equivalent'], True, 'Deep BDD hit the recursion limit')
+assert_eq(satisfy(and_chain(1500), 'o')['count'], 1, 'Deep BDD count wrong')
+full, want = circuit_bdds(generators.random_dag(12, 12))
+m, f = circuit_bdds(generators.random_dag(12, 12), BDD(max_nodes=len(full) + 1))
+assert_eq((len(full._ite) > m.max_nodes, len(m._ite) <= m.max_nodes), (True, True), 'Operation cache not bounded')
+assert_eq(f, want, 'Bounded operation cache changed the BDDs')
+rep = equivalent(generators.counter(6), generators.counter(6), sequential=True)
+assert_eq((rep['equivalent'], rep['compared']), (True, 12), 'Next-state functions not compared')
+
 print('ALL TESTS PASSED')
@@ -0,0 +1,213 @@
+"""Waveform capture for clocked circuits.
+
+A Trace runs a circuit cycle by cycle (like Circuit.run) and records, for each
+selected signal, only the cycles where its value changes: a cycle array and a
+value array per signal ('B' for single bits, 'Q' for buses up to 64 bits, a
+list beyond that). With `window` set it is a ring buffer holding the last
+`window` cycles, plus each signal's value entering the window.
+
+slice() returns a cycle range as plain data (what /sessions/{id}/trace serves)
+and to_vcd() renders it as Value Change Dump text for waveform viewers such
+as GTKWave, one time unit per clock cycle.
+"""
+import heapq
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Any
+
+from sim import Circuit, base_type, _stimulus_at
+
+def _value_array(width: int):
+    if width == 1:
+        return array("B")
+    if width <= 64:
+        return array("Q")
+    return []
+
+def _vcd_id(n: int) -> str:
+    # identifier codes use the printable characters ! .. ~
+    code = ""
+    while True:
+        code += chr(33 + n % 94)
+        n //= 94
+        if not n:
+            return code
+
+def _vcd_value(x, width: int, code: str) -> str:
+    if width == 1:
+        return ("x" if x is None else str(x)) + code
+    return ("bx" if x is None else "b" + format(x, "b")) + " " + code
+
+class Trace:
+    """Change-only trace of `signals` (default: every OUTPUT and DFF) of a
+    circuit's sequential compiled form; see the module docstring."""
+
+    def __init__(self, circuit: Circuit, signals=None, window: int = None):
+        self.circuit = circuit
+        cc = self.cc = circuit.compile(sequential=True)
+        if signals is None:
+            signals = [gid for gid, t in zip(cc.ids, cc.types) if base_type(t) in ("OUTPUT", "DFF")]
+        self.signals = list(signals)
+        self._slots = []
+        for gid in self.signals:
+            i = cc.index.get(gid)
+            if i is None:
+                raise ValueError(f"Gate id not found: {gid}")
+            self._slots.append(i)
+        self.widths = [cc.widths[i] if cc.widths is not None else 1 for i in self._slots]
+        if window is not None and window < 1:
+            raise ValueError("window must be at least one cycle")
+        self.window = window
+        self.cycle = 0  # next cycle to be recorded
+        self._start = 0
+        self._times = [array("I") for _ in self.signals]
+        self._values = [_value_array(w) for w in self.widths]
+        self._last = [None] * len(self.signals)
+
+    @property
+    def first_cycle(self) -> int:
+        """Oldest cycle whose values are still held."""
+        if self.window is None:
+            return self._start
+        return max(self._start, self.cycle - self.window)
+
+    @property
+    def change_count(self) -> int:
+        return sum(len(t) for t in self._times)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the recorded changes."""
+        n = sum(t.itemsize * len(t) for t in self._times)
+        for values in self._values:
+            if isinstance(values, array):
+                n += values.itemsize * len(values)
+            else:
+                n += sum(8 + sys.getsizeof(x) for x in values)
+        return n
+
+    def capture(self, cycles: int, stimulus=None) -> int:
+        """Simulate and record `cycles` more clock cycles; `stimulus` is as for
+        Circuit.run (indexed from the first of these cycles). Final DFF states
+        and input values are written back to the circuit. Returns self.cycle."""
+        cc = self.cc
+        if self.circuit.compile(sequential=True) is not cc:
+            raise ValueError("Circuit structure changed since the trace started")
+        settle = cc.settle_function()
+        index = cc.index
+        inputs = set(cc.inputs)
+        v = cc.run(self.circuit)
+        columns = list(zip(self._slots, self._times, self._values))
+        last = self._last
+        for k in range(cycles):
+            stim = _stimulus_at(stimulus, k)
+            if stim:
+                for iid, val in stim.items():
+                    i = index.get(iid)
+                    if i not in inputs:
+                        raise ValueError(f"Not an input gate: {iid}")
+                    v[i] = cc.to_slot(i, val)
+            settle(v)
+            t = self.cycle
+            for j, (i, times, values) in enumerate(columns):
+                x = v[i]
+                if x != last[j]:
+                    last[j] = x
+                    times.append(t)
+                    values.append(x)
+            cc.clock(v)
+            self.cycle += 1
+            if self.window is not None and self.cycle - self._start >= 2 * self.window:
+                self._trim()
+        if self.window is not None:
+            self._trim()
+        for i in cc.sources:
+            self.circuit.set_gate_value(cc.ids[i], cc.from_slot(i, v[i]))
+        return self.cycle
+
+    def _trim(self):
+        # drop changes before the window, keeping the one that sets each signal's entering value
+        lo = self.cycle - self.window
+        for times, values in zip(self._times, self._values):
+            k = bisect_right(times, lo) - 1
+            if k > 0:
+                del times[:k]
+                del values[:k]
+        self._start = max(self._start, lo)
+
+    def _range(self, start, end):
+        lo = self.first_cycle if start is None else max(start, self.first_cycle)
+        hi = self.cycle if end is None else min(end, self.cycle)
+        return lo, max(lo, hi)
+
+    def _value(self, j: int, x):
+        if x is None or self.widths[j] > 1:
+            return x
+        return bool(x)
+
+    def value_at(self, signal: str, cycle: int):
+        """Value of `signal` settled during `cycle` (None if not held)."""
+        j = self.signals.index(signal)
+        if not self.first_cycle <= cycle < self.cycle:
+            return None
+        times = self._times[j]
+        k = bisect_right(times, cycle) - 1
+        return self._value(j, self._values[j][k]) if k >= 0 else None
+
+    def slice(self, start: int = None, end: int = None) -> Dict[str, Any]:
+        """Cycles start..end-1 (clamped to what is held): per signal its width,
+        the value entering the range and the [cycle, value] changes inside it."""
+        lo, hi = self._range(start, end)
+        signals = {}
+        for j, gid in enumerate(self.signals):
+            times, values = self._times[j], self._values[j]
+            a = bisect_right(times, lo)
+            b = bisect_left(times, hi)
+            signals[gid] = {
+                "width": self.widths[j],
+                "initial": self._value(j, values[a - 1]) if a > 0 and lo < hi else None,
+                "changes": [[times[k], self._value(j, values[k])] for k in range(a, b)],
+            }
+        return {"start": lo, "end": hi, "signals": signals}
+
+    def to_vcd(self, start: int = None, end: int = None, timescale: str = "1 ns") -> str:
+        """Value Change Dump of cycles start..end-1; gate ids of flattened module
+        instances ('inst/gate') become nested scopes."""
+        lo, hi = self._range(start, end)
+        codes = [_vcd_id(j) for j in range(len(self.signals))]
+        out = ["$version dlsim $end", f"$timescale {timescale} $end", "$scope module top $end"]
+        scope = []
+        for j in sorted(range(len(self.signals)), key=lambda j: self.signals[j].split("/")):
+            *path, name = self.signals[j].split("/")
+            while scope != path[:len(scope)]:
+                out.append("$upscope $end")
+                scope.pop()
+            for part in path[len(scope):]:
+                out.append(f"$scope module {part} $end")
+                scope.append(part)
+            out.append(f"$var wire {self.widths[j]} {codes[j]} {name.replace(' ', '_')} $end")
+        out += ["$upscope $end"] * (len(scope) + 1)
+        out += ["$enddefinitions $end", f"#{lo}", "$dumpvars"]
+        streams = []
+        for j, (times, values) in enumerate(zip(self._times, self._values)):
+            a = bisect_right(times, lo)
+            b = bisect_left(times, hi)
+            init = values[a - 1] if a > 0 and lo < hi else None
+            out.append(_vcd_value(init, self.widths[j], codes[j]))
+            streams.append(zip(times[a:b], repeat(j), values[a:b]))
+        out.append("$end")
+        t_prev = lo
+        for t, j, x in heapq.merge(*streams):
+            if t != t_prev:
+                out.append(f"#{t}")
+                t_prev = t
+            out.append(_vcd_value(x, self.widths[j], codes[j]))
+        if hi != t_prev:
+            out.append(f"#{hi}")
+        return "\n".join(out) + "\n"
+
+    def write_vcd(self, path, start: int = None, end: int = None, timescale: str = "1 ns"):
+        Path(path).write_text(self.to_vcd(start, end, timescale))